@@ -7,6 +7,7 @@ Contains SLURM backends for canine
 from .base import AbstractTransport, AbstractSlurmBackend
 from .local import LocalTransport, LocalSlurmBackend
 from .remote import RemoteTransport, RemoteSlurmBackend
+from .slurmrestd import SlurmRestdBackend
 from .dummy import DummyTransport, DummySlurmBackend
 from .gcpTransient import TransientGCPSlurmBackend
 from .imageTransient import TransientImageSlurmBackend
@@ -17,6 +18,7 @@ __all__ = [
     'LocalTransport',
     'RemoteSlurmBackend',
     'RemoteTransport',
+    'SlurmRestdBackend',
     'DummySlurmBackend',
     'DummyTransport',
     'TransientGCPSlurmBackend',
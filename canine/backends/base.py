@@ -3,21 +3,101 @@ import typing
 import re
 import shutil
 import os
+import posixpath
 import time
 import stat
 import sys
-from contextlib import ExitStack
+import hashlib
+import threading
+from contextlib import ExitStack, contextmanager
 from uuid import uuid4 as uuid
-from ..utils import ArgumentHelper, check_call, canine_logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from ..utils import ArgumentHelper, check_call, canine_logging, expand_hostlist, merge_intervals
 import pandas as pd
 
 SLURM_PARTITION_RECON = b'slurm_load_partitions: Unable to contact slurm controller (connect failure)'
 batch_job_pattern = re.compile(r'Submitted batch job (\d+)')
+CHECKSUM_BLOCK_SIZE = 1048576
+# Files up to this size are batched through the controller agent, if one is provided
+AGENT_FILE_SIZE = 1048576
+# Maximum total file size sent or received in a single agent request
+AGENT_REQUEST_SIZE = 16777216
+RmtreeResult = namedtuple('RmtreeResult', ['path', 'n_removed'])
+
+def _agent_batches(transfers: typing.List[typing.Tuple[str, str, str, typing.Any]]) -> typing.Generator[typing.List[typing.Tuple[str, str, str, typing.Any]], None, None]:
+    """
+    Splits (source, destination, relative path, source stat) transfers into
+    batches which fit within a single agent request
+    """
+    batch = []
+    size = 0
+    for transfer in transfers:
+        if len(batch) and size + transfer[3].st_size > AGENT_REQUEST_SIZE:
+            yield batch
+            batch = []
+            size = 0
+        batch.append(transfer)
+        size += transfer[3].st_size
+    if len(batch):
+        yield batch
+
+def _local_checksum_many(paths: typing.Iterable[str]) -> typing.Dict[str, str]:
+    """
+    Returns the md5 hex digest of each of the requested local files
+    """
+    checksums = {}
+    for path in paths:
+        md5 = hashlib.md5()
+        with open(path, 'rb') as r:
+            for chunk in iter(lambda: r.read(CHECKSUM_BLOCK_SIZE), b''):
+                md5.update(chunk)
+        checksums[path] = md5.hexdigest()
+    return checksums
+
+# Delimited equivalents of the default squeue and sinfo formats
+# Column headers match the default fixed-width output, except that squeue
+# also reports each job's CPUS (%C), which the autoscaler uses to size nodes
+SQUEUE_FORMAT = '%i|%P|%j|%u|%t|%M|%D|%C|%R'
+SQUEUE_DTYPES = {'NODES': int, 'CPUS': int}
+SQUEUE_FORMAT_OPTIONS = {'o', 'O', 'format', 'Format', 'l', 'long', 's', 'steps'}
+SINFO_FORMAT = '%P|%a|%l|%D|%t|%N'
+SINFO_NODE_FORMAT = '%N|%D|%P|%t'
+SINFO_DTYPES = {'NODES': int}
+SINFO_FORMAT_OPTIONS = {'o', 'O', 'format', 'Format', 'l', 'long', 's', 'summarize', 'R', 'list-reasons', 'list_reasons'}
+
+def _has_slurm_option(args: ArgumentHelper, options: typing.Set[str]) -> bool:
+    """
+    Returns True if any of the given flags or parameters were set in the ArgumentHelper
+    """
+    return any(args[option] is not None for option in options)
+
+def read_slurm_table(stdout: typing.BinaryIO, dtypes: typing.Optional[typing.Dict[str, typing.Any]] = None, sep: str = '|') -> pd.DataFrame:
+    """
+    Parses delimited output from squeue, sacct, or sinfo
+    All columns are read as strings, except those given in dtypes.
+    The first column is used as the index.
+    Empty fields are read as NaN
+    """
+    df = pd.read_csv(
+        stdout,
+        sep=sep,
+        engine='c',
+        index_col=0,
+        dtype=str,
+        keep_default_na=False,
+        na_values=['']
+    )
+    if dtypes is not None:
+        df = df.astype({k: v for k, v in dtypes.items() if k in df.columns})
+    df.index = df.index.map(str)
+    return df
 
 class AbstractTransport(abc.ABC):
     """
     Base class for file transport
     """
+    _stat_cache = None # {(path, follow_symlinks): stat or None}, while a stat_cache() context is active
     @abc.abstractmethod
     def __enter__(self):
         """
@@ -101,11 +181,7 @@ class AbstractTransport(abc.ABC):
         """
         Returns True if the given path exists
         """
-        try:
-            self.stat(path)
-            return True
-        except FileNotFoundError:
-            return False
+        return self._cached_stat(path) is not None
 
     @abc.abstractmethod
     def chmod(self, path: str, mode: int):
@@ -154,28 +230,22 @@ class AbstractTransport(abc.ABC):
         """
         Returns True if the requested path is a directory
         """
-        try:
-            return stat.S_ISDIR(self.stat(path).st_mode)
-        except FileNotFoundError:
-            return False
+        pathstat = self._cached_stat(path)
+        return pathstat is not None and stat.S_ISDIR(pathstat.st_mode)
 
     def isfile(self, path: str) -> bool:
         """
         Returns True if the requested path is a regular file
         """
-        try:
-            return stat.S_ISREG(self.stat(path).st_mode)
-        except FileNotFoundError:
-            return False
+        pathstat = self._cached_stat(path)
+        return pathstat is not None and stat.S_ISREG(pathstat.st_mode)
 
     def islink(self, path: str) -> bool:
         """
         Returns True if the requested path is a symlink
         """
-        try:
-            return stat.S_ISLNK(self.stat(path).st_mode)
-        except FileNotFoundError:
-            return False
+        pathstat = self._cached_stat(path, follow_symlinks=False)
+        return pathstat is not None and stat.S_ISLNK(pathstat.st_mode)
 
     @abc.abstractmethod
     def glob(self, path: str) -> typing.List[str]:
@@ -184,6 +254,108 @@ class AbstractTransport(abc.ABC):
         """
         pass
 
+    def listdir_attr(self, path: str) -> typing.List[typing.Tuple[str, typing.Any]]:
+        """
+        Lists the contents of the requested path, alongside the stat information
+        of each entry (symlinks are not followed)
+        Returns a list of (name, stat) tuples
+        """
+        return [
+            (name, self.stat(os.path.join(path, name), follow_symlinks=False))
+            for name in self.listdir(path)
+        ]
+
+    def stat_many(self, paths: typing.Iterable[str], follow_symlinks: bool = True) -> typing.Dict[str, typing.Any]:
+        """
+        Returns stat information for each of the requested paths
+        Paths which do not exist map to None
+        """
+        results = {}
+        for path in paths:
+            try:
+                results[path] = self.stat(path, follow_symlinks=follow_symlinks)
+            except FileNotFoundError:
+                results[path] = None
+        return results
+
+    def exists_many(self, paths: typing.Iterable[str]) -> typing.Dict[str, bool]:
+        """
+        Returns a dictionary of {path: exists} for each of the requested paths
+        If a stat cache is active, results are added to the cache
+        """
+        paths = list(paths)
+        if self._stat_cache is not None:
+            missing = [
+                path for path in paths
+                if (os.path.normpath(path), True) not in self._stat_cache
+            ]
+            if len(missing):
+                for path, pathstat in self.stat_many(missing).items():
+                    self._stat_cache[(os.path.normpath(path), True)] = pathstat
+            return {
+                path: self._stat_cache[(os.path.normpath(path), True)] is not None
+                for path in paths
+            }
+        return {
+            path: pathstat is not None
+            for path, pathstat in self.stat_many(paths).items()
+        }
+
+    def makedirs_many(self, paths: typing.Iterable[str]):
+        """
+        Recursively build each of the requested directory structures
+        Directories which already exist are ignored
+        """
+        for path in paths:
+            self.makedirs(path, exist_okay=True)
+
+    @contextmanager
+    def stat_cache(self) -> typing.ContextManager[typing.Dict]:
+        """
+        Context manager which caches stat results (including missing paths)
+        for exists, isdir, isfile, and islink within the context.
+        Modifications made through this transport invalidate affected entries.
+        Changes made by other processes will not be seen while the cache is active
+        """
+        if self._stat_cache is not None:
+            # Nested context. Reuse the outer cache
+            yield self._stat_cache
+            return
+        self._stat_cache = {}
+        try:
+            yield self._stat_cache
+        finally:
+            self._stat_cache = None
+
+    def _cached_stat(self, path: str, follow_symlinks: bool = True) -> typing.Any:
+        """
+        (Internal)
+        Returns stat information for the path, or None if it does not exist.
+        Uses the stat cache, if active
+        """
+        key = (os.path.normpath(path), follow_symlinks)
+        if self._stat_cache is not None and key in self._stat_cache:
+            return self._stat_cache[key]
+        try:
+            pathstat = self.stat(path, follow_symlinks=follow_symlinks)
+        except FileNotFoundError:
+            pathstat = None
+        if self._stat_cache is not None:
+            self._stat_cache[key] = pathstat
+        return pathstat
+
+    def _invalidate(self, *paths: str):
+        """
+        (Internal)
+        Drops cached stat information for the given paths and anything beneath them
+        """
+        if self._stat_cache is not None:
+            for path in paths:
+                path = os.path.normpath(path)
+                prefix = path.rstrip('/') + '/'
+                for key in [key for key in self._stat_cache if key[0] == path or key[0].startswith(prefix)]:
+                    del self._stat_cache[key]
+
     def makedirs(self, path: str, exist_okay: bool = False):
         """
         Recursively build the requested directory structure
@@ -209,8 +381,11 @@ class AbstractTransport(abc.ABC):
         """
         dirnames = []
         filenames = []
-        for name in self.listdir(path):
-            if self.isdir(os.path.join(path, name)):
+        for name, attr in self.listdir_attr(path):
+            fpath = os.path.join(path, name)
+            if self._stat_cache is not None:
+                self._stat_cache[(os.path.normpath(fpath), False)] = attr
+            if stat.S_ISDIR(attr.st_mode) or (stat.S_ISLNK(attr.st_mode) and self.isdir(fpath)):
                 dirnames.append(name)
             else:
                 filenames.append(name)
@@ -218,17 +393,21 @@ class AbstractTransport(abc.ABC):
         for dirname in dirnames:
             yield from self.walk(os.path.join(path, dirname))
 
-    def rmtree(self, path: str, max_retries: int = 5, timeout: int = 5):
+    def rmtree(self, path: str, max_retries: int = 5, timeout: int = 5, root: typing.Optional[str] = None) -> RmtreeResult:
         """
         Recursively remove the directory tree rooted at the given path.
         Automatically retries failures after a brief timeout
+        Refuses to remove the filesystem root or the transport's working directory.
+        If root is provided, also refuses to remove any path not contained within root
+        Returns a RmtreeResult of (path, number of entries removed)
         """
+        path = self._check_rmtree_path(path, root)
         pathstat = self.stat(path)
         if not stat.S_ISDIR(pathstat.st_mode):
             raise NotADirectoryError(path)
         for attempt in range(max_retries):
             try:
-                return self._rmtree(path, pathstat)
+                return RmtreeResult(path, self._rmtree(path, pathstat))
             except (OSError, FileNotFoundError, IOError, NotADirectoryError):
                 # Helps to preserve the exception traceback by conditionally re-raising here
                 if attempt >= (max_retries - 1):
@@ -237,14 +416,52 @@ class AbstractTransport(abc.ABC):
         # Should not be possible to reach here
         raise RuntimeError("AbstractTransport.rmtree exceeded retries without exception")
 
-    def _rmtree(self, path: str, pathstat: os.stat_result):
+    def rmtree_many(self, paths: typing.Iterable[str], max_retries: int = 5, timeout: int = 5, root: typing.Optional[str] = None) -> typing.List[RmtreeResult]:
+        """
+        Recursively remove each of the given directory trees.
+        Same safety checks as rmtree. Paths which do not exist are skipped and
+        reported as having 0 entries removed
+        Returns a list of RmtreeResults
+        """
+        paths = [self._check_rmtree_path(path, root) for path in paths]
+        return [
+            self.rmtree(path, max_retries, timeout, root) if self.exists(path) else RmtreeResult(path, 0)
+            for path in paths
+        ]
+
+    def _check_rmtree_path(self, path: str, root: typing.Optional[str] = None) -> str:
+        """
+        (Internal)
+        Normalizes the given path and checks that it is safe to recursively remove.
+        Paths are normalized lexically, so that a symlink cannot redirect the
+        removal outside of root; symlinks themselves are never removed
+        Raises a ValueError if the path is unsafe
+        """
+        cwd = self.normpath('.')
+        path = posixpath.normpath(posixpath.join(cwd, path))
+        if path in {'/', cwd}:
+            raise ValueError("Refusing to remove {}".format(path))
+        if root is not None:
+            root = posixpath.normpath(posixpath.join(cwd, root))
+            if posixpath.commonpath([root, path]) != root:
+                raise ValueError("Refusing to remove {} which is outside of {}".format(path, root))
+        try:
+            if stat.S_ISLNK(self.stat(path, follow_symlinks=False).st_mode):
+                raise ValueError("Refusing to remove symlink {}".format(path))
+        except FileNotFoundError:
+            pass
+        return path
+
+    def _rmtree(self, path: str, pathstat: os.stat_result) -> int:
         """
         (Internal)
         Recursively remove the directory tree rooted at the given path.
         Automatically retries failures after a brief timeout
+        Returns the number of entries removed
         """
         if not stat.S_ISDIR(pathstat.st_mode):
             raise NotADirectoryError(path)
+        n_removed = 0
         for fname in self.listdir(path):
             fname = os.path.join(path, fname)
             try:
@@ -252,61 +469,280 @@ class AbstractTransport(abc.ABC):
             except FileNotFoundError:
                 # Handling for broken symlinks is bad
                 self.remove(fname)
+                n_removed += 1
             else:
                 if stat.S_ISDIR(fstat.st_mode):
-                    self._rmtree(
+                    n_removed += self._rmtree(
                         fname,
                         fstat
                     )
                 else:
                     self.remove(fname)
+                    n_removed += 1
         self.rmdir(path)
+        return n_removed + 1
 
-    def sendtree(self, src: str, dest: str):
+    def utime(self, path: str, times: typing.Tuple[float, float]):
         """
-        Copy the full local file tree src to the remote path dest
+        Sets the access and modified times (atime, mtime) of the given path
         """
-        if not self.exists(dest):
+        raise NotImplementedError("utime not supported by {}".format(type(self).__name__))
+
+    def listtree(self, path: str) -> typing.Dict[str, typing.Any]:
+        """
+        Returns stat information for every entry beneath the given directory,
+        keyed by path relative to the starting directory.
+        Symlinks are followed. Returns an empty dictionary if the directory does not exist
+        """
+        tree = {}
+        if not self.isdir(path):
+            return tree
+        for dirpath, dirnames, filenames in self.walk(path):
+            for name in dirnames + filenames:
+                fpath = os.path.join(dirpath, name)
+                try:
+                    tree[os.path.relpath(fpath, path)] = self.stat(fpath)
+                except FileNotFoundError:
+                    # Broken symlink
+                    pass
+        return tree
+
+    def checksum_many(self, paths: typing.Iterable[str]) -> typing.Dict[str, str]:
+        """
+        Returns the md5 hex digest of each of the requested files
+        """
+        checksums = {}
+        for path in paths:
+            md5 = hashlib.md5()
+            with self.open(path, 'rb') as r:
+                for chunk in iter(lambda: r.read(CHECKSUM_BLOCK_SIZE), b''):
+                    md5.update(chunk)
+            checksums[path] = md5.hexdigest()
+        return checksums
+
+    def sendtree(self, src: str, dest: str, incremental: bool = False, checksum: bool = False, agent: typing.Optional[typing.Any] = None) -> typing.List[str]:
+        """
+        Copy the full local file tree src to the remote path dest
+        If incremental is True, files which already exist at the destination
+        with a matching size and a modification time no older than the source
+        are not transferred.
+        If checksum is also True, md5 checksums are compared instead of modification times
+        Modification times are preserved when updating an existing destination.
+        Files uploaded into a new destination keep their upload time, which is
+        newer than the source and therefore still matches on the next transfer
+        If a controller agent (canine.localization.agent.AgentClient) is provided,
+        directories and small files are written in batches through it
+        Returns the list of transferred files, relative to src
+        """
+        existed = self.exists(dest)
+        if not existed:
             self.makedirs(dest)
+        remote = self.listtree(dest) if incremental and existed else {}
+        pending = []
+        dirs = []
         for path, dirnames, filenames in os.walk(src):
+            relpath = os.path.relpath(path, src)
             rpath = os.path.join(
                 dest,
-                os.path.relpath(path, src)
+                relpath
             )
-            if not self.exists(rpath):
-                self.mkdir(rpath)
+            if incremental:
+                if relpath != '.' and relpath not in remote:
+                    dirs.append(rpath)
+            elif agent is not None or not self.exists(rpath):
+                # the agent's makedirs skips existing directories
+                dirs.append(rpath)
             for f in filenames:
-                self.send(os.path.join(path, f), os.path.join(rpath, f))
-
+                pending.append((
+                    os.path.join(path, f),
+                    os.path.join(rpath, f),
+                    os.path.normpath(os.path.join(relpath, f))
+                ))
+        transfers = [
+            (localfile, remotefile, relpath, os.stat(localfile))
+            for localfile, remotefile, relpath in pending
+        ]
+        if incremental:
+            transfers = self._changed_files(
+                transfers,
+                remote,
+                checksum,
+                lambda paths: self.checksum_many(paths),
+                lambda paths: _local_checksum_many(paths)
+            )
+        batched = []
+        if agent is not None:
+            batched = [transfer for transfer in transfers if transfer[3].st_size <= AGENT_FILE_SIZE]
+            agent.write_many({}, dirs=dirs)
+            for batch in _agent_batches(batched):
+                files = {}
+                for localfile, remotefile, relpath, localstat in batch:
+                    with open(localfile, 'rb') as r:
+                        files[remotefile] = r.read()
+                agent.write_many(
+                    files,
+                    mode={remotefile: stat.S_IMODE(localstat.st_mode) for _, remotefile, _, localstat in batch},
+                    times={remotefile: (localstat.st_atime, localstat.st_mtime) for _, remotefile, _, localstat in batch} if incremental and existed else None
+                )
+            self._invalidate(*dirs, *(remotefile for _, remotefile, _, _ in batched))
+        else:
+            for rpath in dirs:
+                self.mkdir(rpath)
+        for localfile, remotefile, relpath, localstat in transfers:
+            if agent is not None and localstat.st_size <= AGENT_FILE_SIZE:
+                continue
+            self.send(localfile, remotefile)
+            if incremental and existed:
+                self.utime(remotefile, (localstat.st_atime, localstat.st_mtime))
+        return [relpath for _, _, relpath, _ in transfers]
 
-    def receivetree(self, src: str, dest: str):
+    def receivetree(self, src: str, dest: str, incremental: bool = False, checksum: bool = False, agent: typing.Optional[typing.Any] = None) -> typing.List[str]:
         """
         Copy the full remote file tree src to the local path dest
+        If incremental is True, files which already exist at the destination
+        with a matching size and a modification time no older than the source
+        are not transferred.
+        If checksum is also True, md5 checksums are compared instead of modification times
+        If a controller agent (canine.localization.agent.AgentClient) is provided,
+        small files are read in batches through it
+        Returns the list of transferred files, relative to src
         """
         if not os.path.exists(dest):
             os.makedirs(dest)
-        for path, dirnames, filenames in self.walk(src):
-            lpath = os.path.join(
-                dest,
-                os.path.relpath(path, src)
+        transfers = []
+        for relpath, remotestat in sorted(self.listtree(src).items()):
+            lpath = os.path.join(dest, relpath)
+            if stat.S_ISDIR(remotestat.st_mode):
+                if not os.path.exists(lpath):
+                    os.makedirs(lpath)
+            else:
+                transfers.append((os.path.join(src, relpath), lpath, relpath, remotestat))
+        if incremental:
+            local = {}
+            for remotefile, localfile, relpath, remotestat in transfers:
+                try:
+                    local[relpath] = os.stat(localfile)
+                except FileNotFoundError:
+                    pass
+            transfers = self._changed_files(
+                transfers,
+                local,
+                checksum,
+                lambda paths: _local_checksum_many(paths),
+                lambda paths: self.checksum_many(paths)
             )
-            if not os.path.exists(lpath):
-                os.mkdir(lpath)
-            for f in filenames:
-                self.receive(os.path.join(path, f), os.path.join(lpath, f))
+        contents = {}
+        if agent is not None:
+            for batch in _agent_batches([transfer for transfer in transfers if transfer[3].st_size <= AGENT_FILE_SIZE]):
+                contents.update(agent.read_many(remotefile for remotefile, _, _, _ in batch))
+        for remotefile, localfile, relpath, remotestat in transfers:
+            if not os.path.isdir(os.path.dirname(localfile)):
+                os.makedirs(os.path.dirname(localfile))
+            if contents.get(remotefile, None) is not None:
+                with open(localfile, 'wb') as w:
+                    w.write(contents[remotefile])
+                os.chmod(localfile, stat.S_IMODE(remotestat.st_mode))
+            else:
+                self.receive(remotefile, localfile)
+            if incremental:
+                os.utime(localfile, (remotestat.st_atime, remotestat.st_mtime))
+        return [relpath for _, _, relpath, _ in transfers]
+
+    @staticmethod
+    def _changed_files(
+        transfers: typing.List[typing.Tuple[str, str, str, typing.Any]],
+        existing: typing.Dict[str, typing.Any],
+        checksum: bool,
+        dest_checksums: typing.Callable[[typing.List[str]], typing.Dict[str, str]],
+        src_checksums: typing.Callable[[typing.List[str]], typing.Dict[str, str]]
+    ) -> typing.List[typing.Tuple[str, str, str, typing.Any]]:
+        """
+        (Internal)
+        Filters a list of (source, destination, relative path, source stat) transfers
+        down to those which are missing or differ from the existing destination stats
+        """
+        changed = []
+        matched = []
+        for transfer in transfers:
+            srcstat = transfer[3]
+            deststat = existing.get(transfer[2])
+            if (
+                deststat is None
+                or not stat.S_ISREG(deststat.st_mode)
+                or deststat.st_size != srcstat.st_size
+                or (not checksum and int(deststat.st_mtime) < int(srcstat.st_mtime))
+            ):
+                changed.append(transfer)
+            else:
+                matched.append(transfer)
+        if checksum and len(matched):
+            src_sums = src_checksums([transfer[0] for transfer in matched])
+            dest_sums = dest_checksums([transfer[1] for transfer in matched])
+            changed += [
+                transfer for transfer in matched
+                if src_sums[transfer[0]] != dest_sums[transfer[1]]
+            ]
+        return changed
+
+class _PendingQuery(object):
+    """
+    (Internal)
+    A status query which is currently running. Other callers wait on it
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class _StatusState(object):
+    """
+    (Internal)
+    Per-backend bookkeeping for coalesced status queries
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inflight = {} # {query key: _PendingQuery}
+        self.cache = {} # {query key: (monotonic time, result)}
+        self.queries = 0 # Number of commands actually run
+        self.merged = 0 # Number of callers which shared a running command
+
+_status_state_lock = threading.Lock()
+
+def _status_state(backend: 'AbstractSlurmBackend') -> _StatusState:
+    """
+    (Internal)
+    Returns the status query bookkeeping for the backend, creating it if needed.
+    Created lazily because not every backend calls AbstractSlurmBackend.__init__
+    """
+    state = backend.__dict__.get('_status_state')
+    if state is None:
+        with _status_state_lock:
+            state = backend.__dict__.get('_status_state')
+            if state is None:
+                state = _StatusState()
+                backend.__dict__['_status_state'] = state
+    return state
 
 class AbstractSlurmBackend(abc.ABC):
     """
     Base class for a SLURM backend
     """
 
-    def __init__(self, hard_reset_on_orch_init: bool = True, **kwargs):
+    # Seconds that squeue, sacct, and sinfo results are shared between callers
+    status_cache_ttl = 5
+
+    def __init__(self, hard_reset_on_orch_init: bool = True, status_cache_ttl: typing.Optional[float] = None, **kwargs):
         """
         If an implementing class defines a constructor, it must take **kwargs.
         """
 
         #:param bool hard_reset_on_orch_init: Whether this backend needs the orchestrator to hard reset it after initialization (True), or the backend resets itself (False)
         self.hard_reset_on_orch_init = hard_reset_on_orch_init
+        #:param float status_cache_ttl: Seconds that status query results may be reused (0 disables caching, but identical concurrent queries are still merged)
+        if status_cache_ttl is not None:
+            self.status_cache_ttl = float(status_cache_ttl)
 
     @abc.abstractmethod
     def invoke(self, command: str, interactive: bool = False, **kwargs) -> typing.Tuple[int, typing.BinaryIO, typing.BinaryIO]:
@@ -317,15 +753,138 @@ class AbstractSlurmBackend(abc.ABC):
         """
         pass
 
-    def squeue(self, *slurmopts: str, **slurmparams: typing.Any) -> pd.DataFrame:
+    def invoke_many(self, commands: typing.Iterable[str], timeout: typing.Optional[float] = None, max_workers: int = 8) -> typing.List[typing.Tuple[int, typing.BinaryIO, typing.BinaryIO]]:
+        """
+        Invokes several non-interactive commands concurrently.
+        Returns a list of (exit status, stdout stream, stderr stream), in order.
+        If a timeout is given, it is passed to each invoke call
+        """
+        kwargs = {'timeout': timeout} if timeout is not None else {}
+        commands = list(commands)
+        if len(commands) <= 1:
+            return [self.invoke(command, **kwargs) for command in commands]
+        with ThreadPoolExecutor(min(max_workers, len(commands))) as executor:
+            return list(executor.map(lambda command: self.invoke(command, **kwargs), commands))
+
+    @contextmanager
+    def open_channel(self, command: str) -> typing.ContextManager[typing.Tuple[typing.BinaryIO, typing.BinaryIO]]:
+        """
+        Starts a long-running command on the slurm controller.
+        Yields a tuple of (stdin, stdout) byte streams connected to the command.
+        The command's stdin is closed on exit, and its stderr is discarded.
+        Backends which cannot stream to a command raise NotImplementedError
+        """
+        raise NotImplementedError("{} does not support command channels".format(type(self).__name__))
+        yield
+
+    def squeue(self, *slurmopts: str, fresh: bool = False, **slurmparams: typing.Any) -> pd.DataFrame:
+        """
+        Shows the current status of the job queue
+        slurmopts and kwargs are passed into an ArgumentHelper and unpacked
+        as command line arguments
+        Unless a custom format is given, the default squeue columns are returned
+        along with an integer CPUS column
+        Identical concurrent queries share one command, and results are reused
+        for status_cache_ttl seconds. Set fresh=True to always query the controller
+        """
+        return self._status_query(self._squeue, slurmopts, slurmparams, fresh)
+
+    def sacct(self, *slurmopts: str, fresh: bool = False, **slurmparams: typing.Any) -> pd.DataFrame:
+        """
+        Shows the current job accounting information
+        slurmopts and slurmparams are passed into an ArgumentHelper and unpacked
+        as command line arguments
+        Identical concurrent queries share one command, and results are reused
+        for status_cache_ttl seconds. Set fresh=True to always query the controller
+        """
+        return self._status_query(self._sacct, slurmopts, slurmparams, fresh)
+
+    def sinfo(self, *slurmopts: str, fresh: bool = False, **slurmparams: typing.Any) -> pd.DataFrame:
+        """
+        Shows the current cluster information
+        slurmopts and slurmparams are passed into an ArgumentHelper and unpacked
+        as command line arguments
+        Identical concurrent queries share one command, and results are reused
+        for status_cache_ttl seconds. Set fresh=True to always query the controller
+        """
+        return self._status_query(self._sinfo, slurmopts, slurmparams, fresh)
+
+    def invalidate_status_cache(self):
+        """
+        Discards cached squeue, sacct, and sinfo results.
+        Called automatically after submitting or cancelling jobs
+        """
+        with _status_state(self).lock:
+            _status_state(self).cache.clear()
+
+    def _status_query(self, query: typing.Callable[..., pd.DataFrame], slurmopts: typing.Tuple[str, ...], slurmparams: typing.Dict[str, typing.Any], fresh: bool = False) -> pd.DataFrame:
+        """
+        (Internal)
+        Runs the given status query, merging it with an identical query already
+        in progress and reusing results younger than status_cache_ttl.
+        Fresh queries always run, but still update the cache.
+        Each caller receives its own copy of the result
+        """
+        state = _status_state(self)
+        key = (
+            query.__name__,
+            tuple(str(opt) for opt in slurmopts),
+            tuple(sorted((k, str(v)) for k, v in slurmparams.items()))
+        )
+        with state.lock:
+            if not fresh:
+                if key in state.cache and time.monotonic() - state.cache[key][0] < self.status_cache_ttl:
+                    return state.cache[key][1].copy()
+                if key in state.inflight:
+                    pending = state.inflight[key]
+                    state.merged += 1
+                else:
+                    pending = None
+            else:
+                pending = None
+            if pending is None:
+                pending = _PendingQuery()
+                state.inflight[key] = pending
+                leader = True
+            else:
+                leader = False
+        if leader:
+            try:
+                pending.result = query(*slurmopts, **slurmparams)
+            except BaseException as e:
+                pending.error = e
+                raise
+            finally:
+                with state.lock:
+                    state.queries += 1
+                    if pending.error is None:
+                        state.cache[key] = (time.monotonic(), pending.result)
+                    if state.inflight.get(key) is pending:
+                        del state.inflight[key]
+                pending.done.set()
+            return pending.result.copy()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result.copy()
+
+    def _squeue(self, *slurmopts: str, **slurmparams: typing.Any) -> pd.DataFrame:
         """
+        (Internal)
         Shows the current status of the job queue
         slurmopts and kwargs are passed into an ArgumentHelper and unpacked
         as command line arguments
+        Unless a custom output format is requested, output is read in delimited form
         """
-        command = 'squeue'+ArgumentHelper(*slurmopts, **slurmparams).commandline
+        args = ArgumentHelper(*slurmopts, **slurmparams)
+        delimited = not _has_slurm_option(args, SQUEUE_FORMAT_OPTIONS)
+        if delimited:
+            args.format = SQUEUE_FORMAT
+        command = 'squeue'+args.commandline
         status, stdout, stderr = self.invoke(command)
         check_call(command, status, stdout, stderr)
+        if delimited:
+            return read_slurm_table(stdout, SQUEUE_DTYPES)
         df = pd.read_fwf(
             stdout,
             index_col=0
@@ -334,31 +893,40 @@ class AbstractSlurmBackend(abc.ABC):
         return df
 
 
-    def sacct(self, *slurmopts: str, **slurmparams: typing.Any) -> pd.DataFrame:
+    def _sacct(self, *slurmopts: str, **slurmparams: typing.Any) -> pd.DataFrame:
         """
+        (Internal)
         Shows the current job accounting information
         slurmopts and slurmparams are passed into an ArgumentHelper and unpacked
         as command line arguments
+        Output is read in --parsable2 form, and all columns are left as strings
         """
-        command = 'sacct'+ArgumentHelper(*slurmopts, **slurmparams).commandline
+        args = ArgumentHelper(*slurmopts, **slurmparams)
+        if not _has_slurm_option(args, {'p', 'P', 'parsable', 'parsable2'}):
+            args.parsable2 = True
+        delimiter = args.delimiter if args.delimiter is not None else '|'
+        command = 'sacct'+args.commandline
         status, stdout, stderr = self.invoke(command)
         check_call(command, status, stdout, stderr)
-        df = pd.read_fwf(
-            stdout,
-            index_col=0
-        ).iloc[1:]
-        df.index = df.index.map(str)
-        return df
+        return read_slurm_table(stdout, sep=delimiter)
 
-    def sinfo(self, *slurmopts: str, **slurmparams: typing.Any) -> pd.DataFrame:
+    def _sinfo(self, *slurmopts: str, **slurmparams: typing.Any) -> pd.DataFrame:
         """
+        (Internal)
         Shows the current cluster information
         slurmopts and slurmparams are passed into an ArgumentHelper and unpacked
         as command line arguments
+        Unless a custom output format is requested, output is read in delimited form
         """
-        command = 'sinfo'+ArgumentHelper(*slurmopts, **slurmparams).commandline
+        args = ArgumentHelper(*slurmopts, **slurmparams)
+        delimited = not _has_slurm_option(args, SINFO_FORMAT_OPTIONS)
+        if delimited:
+            args.format = SINFO_NODE_FORMAT if _has_slurm_option(args, {'N', 'Node'}) else SINFO_FORMAT
+        command = 'sinfo'+args.commandline
         status, stdout, stderr = self.invoke(command)
         check_call(command, status, stdout, stderr)
+        if delimited:
+            return read_slurm_table(stdout, SINFO_DTYPES)
         df = pd.read_fwf(
             stdout,
             index_col=0
@@ -393,6 +961,7 @@ class AbstractSlurmBackend(abc.ABC):
             command
         )
         status, stdout, stderr = self.invoke(command)
+        self.invalidate_status_cache()
         check_call(command, status, stdout, stderr)
         out = stdout.read().decode()
         err = stderr.read().decode()
@@ -413,6 +982,7 @@ class AbstractSlurmBackend(abc.ABC):
             jobID
         )
         status, stdout, stderr = self.invoke(command)
+        self.invalidate_status_cache()
         check_call(command, status, stdout, stderr)
 
 
@@ -465,6 +1035,13 @@ class AbstractSlurmBackend(abc.ABC):
             transport.chmod(script_path, 0o775)
         return script_path
 
+    def ping(self) -> bool:
+        """
+        Returns False if the Slurm controller cannot be contacted yet
+        """
+        status, stdout, stderr = self.invoke("sinfo")
+        return status == 0 or SLURM_PARTITION_RECON not in stderr.read()
+
     def wait_for_cluster_ready(self, elastic: bool = True, timeout = 0):
         """
         Blocks until the main partition is marked as up.
@@ -472,12 +1049,10 @@ class AbstractSlurmBackend(abc.ABC):
         (default: block forever)
         """
 
-        status, stdout, stderr = self.invoke("sinfo")
         n_iter = 0
-        while status != 0 and SLURM_PARTITION_RECON in stderr.read():
+        while not self.ping():
             canine_logging.warning("Slurm controller not ready. Retrying in 10s...")
             time.sleep(10)
-            status, stdout, stderr = self.invoke("sinfo")
             n_iter += 1
 
             if timeout > 0 and n_iter*10 >= timeout:
@@ -503,11 +1078,88 @@ class AbstractSlurmBackend(abc.ABC):
                 time.sleep(10)
                 df = self.sinfo()
 
-    def estimate_cost(self, clock_uptime: typing.Optional[float] = None, node_uptime: typing.Optional[float] = None, job_cpu_time: typing.Optional[typing.Dict[str, float]] = None) -> typing.Tuple[float, typing.Optional[typing.Dict[str, float]]]:
+    def node_hours(self) -> typing.Optional[float]:
+        """
+        Returns the total node-hours for which this backend has run worker nodes,
+        or None if the backend does not track node uptime
+        """
+        return None
+
+    def node_usage(self, job: str) -> pd.DataFrame:
+        """
+        Returns the node allocations of the given job's array tasks, including
+        preempted attempts, from sacct. Rows are indexed by task, with the node,
+        the allocation's start and end (in seconds), and the CPUs allocated on the node
+        """
+        acct = self.sacct(
+          "D",
+          job = job,
+          format = "JobId,NodeList,Start,End,AllocCPUS",
+          fresh = True
+        )
+        acct = acct.loc[acct.index.str.contains("_") & ~acct.index.str.contains(".", regex = False)]
+        now = pd.Timestamp.now()
+        rows = []
+        for jid, record in acct.iterrows():
+            start = pd.to_datetime(record["Start"], errors = "coerce")
+            nodes = expand_hostlist(record["NodeList"])
+            if pd.isna(start) or not len(nodes):
+                continue
+            end = pd.to_datetime(record["End"], errors = "coerce")
+            end = now if pd.isna(end) else end
+            for node in nodes:
+                rows.append((jid, node, start.timestamp(), end.timestamp(), int(record["AllocCPUS"]) / len(nodes)))
+        return pd.DataFrame(rows, columns = ["JobID", "node", "start", "end", "cpus"]).set_index("JobID")
+
+    @staticmethod
+    def busy_node_hours(usage: pd.DataFrame) -> typing.Dict[str, float]:
+        """
+        Returns the hours for which each node ran tasks, given node_usage().
+        Overlapping allocations on a node are counted once
+        """
+        return {
+            node : sum(end - start for start, end in merge_intervals(zip(g["start"], g["end"]))) / 3600
+            for node, g in usage.groupby("node")
+        }
+
+    @staticmethod
+    def task_cpu_hours(usage: pd.DataFrame) -> typing.Dict[str, typing.Dict[str, float]]:
+        """
+        Returns the CPU hours allocated to each task on each node, given node_usage()
+        """
+        usage = usage.assign(cpu_hours = usage["cpus"] * (usage["end"] - usage["start"]) / 3600)
+        return {
+            jid : g.groupby("node")["cpu_hours"].sum().to_dict()
+            for jid, g in usage.groupby(level = 0)
+        }
+
+    def request_on_demand(self, jobs: typing.Iterable[str], partition: typing.Optional[str] = None) -> typing.List[str]:
+        """
+        Moves tasks which keep getting preempted onto non-preemptible nodes.
+        Backends which cannot provision such nodes can only move pending tasks
+        to the given partition, if any.
+        Returns the tasks which were moved (or will be, once requeued)
+        """
+        jobs = list(jobs)
+        if partition is None or not len(jobs):
+            return []
+        queue = self.squeue('r', fresh = True)
+        pending = [job for job in jobs if job in queue.index and (queue.loc[[job], 'ST'] == 'PD').all()]
+        if not len(pending):
+            return []
+        rc, stdout, stderr = self.invoke("scontrol update jobid={} partition={}".format(",".join(pending), partition))
+        if rc != 0:
+            canine_logging.warning("Could not move tasks to partition {}".format(partition))
+            return []
+        return pending
+
+    def estimate_cost(self, clock_uptime: typing.Optional[float] = None, node_uptime: typing.Optional[typing.Union[float, typing.Dict[str, float]]] = None, job_cpu_time: typing.Optional[typing.Dict[str, typing.Union[float, typing.Dict[str, float]]]] = None) -> typing.Tuple[float, typing.Optional[typing.Dict[str, float]]]:
         """
         Returns a cost estimate for the cluster, based on any cost information available
         to the backend. May provide total node uptime (for cluster cost estimate)
         and/or cpu_time for each job to get job specific cost estimates.
+        Node uptime and each job's cpu_time may also be broken down by node
+        ({node: hours}), so that nodes can be priced by machine type.
         Clock uptime may be provided and is useful if the cluster has an inherrant
         overhead for uptime (ie: controller nodes).
         Note: Job cost estimates may not sum up to the total cluster cost if the
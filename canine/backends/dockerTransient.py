@@ -10,12 +10,14 @@ import socket
 import psutil
 import io
 import pickle
+import shlex
 import math
 import threading
 import time
 
-from .imageTransient import TransientImageSlurmBackend, list_instances, gce
-from ..utils import get_default_gcp_project, gcp_hourly_cost, isatty, canine_logging
+from .imageTransient import TransientImageSlurmBackend, GCEOperationError, list_instances, gce
+from .lease import Lease
+from ..utils import get_default_gcp_project, gcp_hourly_cost, isatty, run_task_graph, canine_logging
 
 from requests.exceptions import ConnectionError as RConnectionError
 from urllib3.exceptions import ProtocolError
@@ -26,7 +28,14 @@ from threading import Lock
 
 gce_lock = Lock()
 
+# Shared cluster configuration directory on the NFS
+CLUSTER_CONF_DIR = "/mnt/nfs/clust_conf/canine"
+
 class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
+
+    # Slurm starts nodes on demand, so init_nodes needs a running controller
+    nodes_require_controller = True
+
     def __init__(
         self, cluster_name, *,
         nfs_startup_script = "/usr/local/share/slurm_gcp_docker/src/provision_storage_container_host.sh",
@@ -35,7 +44,7 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
         nfs_shutdown_script = "/usr/local/share/slurm_gcp_docker/src/shutdown_worker_container_host.sh",
         nfs_disk_size = 2000, nfs_disk_type = "pd-standard", nfs_action_on_stop = "stop", nfs_image = "",
         nfs_image_project = "", action_on_stop = "delete", image_family = None, image = None,
-        clust_frac = 0.01, user = os.environ["USER"], **kwargs
+        clust_frac = 0.01, user = os.environ["USER"], lease_ttl = None, **kwargs
     ):
         if user is None:
             # IE: USER was not set
@@ -71,11 +80,13 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
           "nfs_compute_script" :
             "--metadata " + \
             ",".join([ "{}=\"{}\"".format(k, v) for k, v in nfs_compute_script.items() if v is not None ]),
+          "nfs_compute_metadata" : { k : v for k, v in nfs_compute_script.items() if v is not None },
           "action_on_stop" : action_on_stop,
           "nfs_action_on_stop" : nfs_action_on_stop if nfs_action_on_stop is not None
             else self.config["action_on_stop"],
           "image_family" : image_family if image_family is not None else "slurm-gcp-docker-" + user,
           "clust_frac" : max(min(clust_frac, 1.0), 1e-6),
+          "lease_ttl" : lease_ttl,
           "user" : user,
           **{ k : v for k, v in self.config.items() if k not in { "worker_prefix", "user", "action_on_stop" } }
         }
@@ -86,6 +97,7 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
 
         # placeholder for Docker container object
         self.container = None
+        self._container_obj = None
 
         # flag to indicate whether the Docker was already running
         self.preexisting_container = False
@@ -95,86 +107,130 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
 
         self.NFS_server_ready = False
         self.NFS_ready = False
-        self.NFS_monitor_thread = None
-        self.NFS_monitor_lock = None
+
+        # keep-alive lease held on the cluster, if any
+        self.lease = None
 
     def init_slurm(self):
         self.dkr = docker.from_env()
+        lease = Lease(os.path.join(CLUSTER_CONF_DIR, "lease.json"))
 
-        #
-        # check if image exists
-        try:
-            image = self.dkr.images.get('broadinstitute/slurm_gcp_docker:latest')
-        except docker.errors.ImageNotFound:
-            raise Exception("You have not yet built or pulled the Slurm Docker image!")
-        except RConnectionError as e:
-            if isinstance(e.args[0], ProtocolError):
-                if isinstance(e.args[0].args[1], PermissionError):
-                    raise PermissionError("You do not have permission to run Docker!")
-                elif isinstance(e.args[0].args[1], ConnectionRefusedError):
-                    raise ConnectionRefusedError("The Docker daemon does not appear to be running on this machine. Please start it.")
-            raise Exception("Unknown problem connecting to the Docker daemon")
-        except Exception as e:
-            raise Exception("Problem starting Slurm Docker: {}: {}".format(
-              type(e).__name__, e 
-            ))
+        # if a watchdog is shutting down a previous cluster, let it finish
+        # before we start reusing its NFS and controller container
+        lease.wait_stopped()
 
         #
-        # start the NFS
-        self.start_NFS()
+        # start the NFS, controller container, and supporting checks concurrently.
+        # The NFS server takes longest to boot; the Docker image can be checked
+        # in the meantime
+        image = {}
 
-        #
-        # mount the NFS
-        self.mount_NFS()
+        def check_image():
+            try:
+                image["slurm"] = self.dkr.images.get('broadinstitute/slurm_gcp_docker:latest')
+            except docker.errors.ImageNotFound:
+                raise Exception("You have not yet built or pulled the Slurm Docker image!")
+            except RConnectionError as e:
+                if isinstance(e.args[0], ProtocolError):
+                    if isinstance(e.args[0].args[1], PermissionError):
+                        raise PermissionError("You do not have permission to run Docker!")
+                    elif isinstance(e.args[0].args[1], ConnectionRefusedError):
+                        raise ConnectionRefusedError("The Docker daemon does not appear to be running on this machine. Please start it.")
+                raise Exception("Unknown problem connecting to the Docker daemon")
+            except Exception as e:
+                raise Exception("Problem starting Slurm Docker: {}: {}".format(
+                  type(e).__name__, e 
+                ))
 
         #
         # ensure that Docker can start (no Slurm processes outside of Docker already running)
-        try:
-            ready_for_docker()
-        except:
-            canine_logging.error("Docker host is not ready to start container!")
-            raise
-
-        #
-        # create the Slurm container if it's not already present
-        canine_logging.info("Starting Slurm controller ...")
-        if self.config["cluster_name"] not in [x.name for x in self.dkr.containers.list()]:
-            # FIXME: gcloud is cloud-provider specific. how can we make this more generic?
-            gcloud_conf_dir = subprocess.check_output("echo -n ~/.config/gcloud", shell = True).decode()
-            self.dkr.containers.run(
-              image = image.tags[0], detach = True, network_mode = "host",
-              volumes = {
-                "/mnt/nfs" : { "bind" : "/mnt/nfs", "mode" : "rw" },
-                gcloud_conf_dir : { "bind" : "/etc/gcloud", "mode" : "rw" }
-               },
-              name = self.config["cluster_name"], command = "/bin/bash",
-              user = self.config["user"], stdin_open = True, remove = True
-            )
-            self.container = self._get_container(self.config["cluster_name"])
+        def check_host():
+            try:
+                ready_for_docker()
+            except:
+                canine_logging.error("Docker host is not ready to start container!")
+                raise
 
-        # otherwise, try and start it if it's stopped
-        else:
-            self.preexisting_container = True
-            self.container = self._get_container(self.config["cluster_name"])
-            if self.container().status == "exited":
-                self.container().start()
+        def start_container():
+            #
+            # create the Slurm container if it's not already present
+            canine_logging.info("Starting Slurm controller ...")
+            if self.config["cluster_name"] not in [x.name for x in self.dkr.containers.list()]:
+                # FIXME: gcloud is cloud-provider specific. how can we make this more generic?
+                gcloud_conf_dir = subprocess.check_output("echo -n ~/.config/gcloud", shell = True).decode()
+                self.dkr.containers.run(
+                  image = image["slurm"].tags[0], detach = True, network_mode = "host",
+                  volumes = {
+                    "/mnt/nfs" : { "bind" : "/mnt/nfs", "mode" : "rw" },
+                    gcloud_conf_dir : { "bind" : "/etc/gcloud", "mode" : "rw" }
+                   },
+                  name = self.config["cluster_name"], command = "/bin/bash",
+                  user = self.config["user"], stdin_open = True, remove = True
+                )
+                self.container = self._get_container(self.config["cluster_name"])
 
-        # TODO: should we restart slurmctld in the container here?
+            # otherwise, try and start it if it's stopped
+            else:
+                self.preexisting_container = True
+                self.container = self._get_container(self.config["cluster_name"])
+                if self.container().status == "exited":
+                    self.container().start()
+                    self.invalidate_container()
 
-        #
-        # wait until the container is fully started, or error out if it failed
-        # to start
-        self.wait_for_container_to_be_ready(timeout = 60)
+            # TODO: should we restart slurmctld in the container here?
 
         #
         # save the configuration to disk so that Slurm knows how to configure
         # the nodes it creates
-        subprocess.check_call("""
-          [ ! -d /mnt/nfs/clust_conf/canine ] && mkdir -p /mnt/nfs/clust_conf/canine ||
-            echo -n
-          """, shell = True, executable = '/bin/bash')
-        with open("/mnt/nfs/clust_conf/canine/backend_conf.pickle", "wb") as f:
-            pickle.dump(self.config, f)
+        def save_config():
+            subprocess.check_call("""
+              [ ! -d /mnt/nfs/clust_conf/canine ] && mkdir -p /mnt/nfs/clust_conf/canine ||
+                echo -n
+              """, shell = True, executable = '/bin/bash')
+            with open("/mnt/nfs/clust_conf/canine/backend_conf.pickle", "wb") as f:
+                pickle.dump(self.config, f)
+
+        #
+        # if a previous pipeline left the cluster running under a lease, hold
+        # the lease so that the cluster is not shut down while we use it.
+        # The lease lives on the NFS, so this must wait until it is mounted.
+        # If the lease expired in the meantime, its watchdog tears down what
+        # we just started, so startup has to begin again once it has finished
+        startup = {}
+        def hold_lease():
+            if lease.wait_stopped():
+                startup["restart"] = True
+            elif lease.exists() and lease.acquire(self.config["lease_ttl"], create = False):
+                self.lease = lease
+
+        while True:
+            startup["restart"] = False
+            timings = run_task_graph({
+              "docker_image" : (check_image, []),
+              "nfs_start" : (self.start_NFS, []),
+              "nfs_mount" : (self.mount_NFS, ["nfs_start"]),
+              "lease_check" : (hold_lease, ["nfs_mount"]),
+              "host_check" : (check_host, ["nfs_mount"]),
+              "save_config" : (save_config, ["nfs_mount"]),
+              "container_start" : (start_container, ["docker_image", "host_check"]),
+              # wait until the container is fully started, or error out if it failed
+              # to start
+              "container_ready" : (lambda : self.wait_for_container_to_be_ready(timeout = 60), ["container_start"])
+            })
+            if not startup["restart"]:
+                break
+            canine_logging.warning("Previous cluster was shut down during startup; starting again")
+            self.invalidate_instance_list()
+            self.invalidate_container()
+            self.NFS_server_ready = False
+            self.NFS_ready = False
+        canine_logging.info("Controller startup phases: " + ", ".join(
+          "{} {:.1f}s".format(phase, t) for phase, t in timings.items()
+        ))
+
+        if self.lease is None and self.config["lease_ttl"] is not None:
+            lease.acquire(self.config["lease_ttl"])
+            self.lease = lease
 
     def init_nodes(self):
         if not self.NFS_ready:
@@ -189,12 +245,7 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
         # nodes still running when __exit__() is called.
         # TODO: deal with nodes that already exist
         allnodes = pd.read_pickle("/mnt/nfs/clust_conf/slurm/host_LuT.pickle")
-
-        # we only care about nodes that Slurm will actually dispatch jobs to;
-        # the rest will be set to "drain" (i.e., blacklisted) below.
-        self.nodes = allnodes.groupby("machine_type").apply(
-          lambda x : x.iloc[0:math.ceil(len(x)*self.config["clust_frac"])]
-        ).droplevel(0)
+        self.nodes = self._load_node_list(allnodes)
 
         # set nodes that will never be used to drain
         for _, g in allnodes.loc[~allnodes.index.isin(self.nodes.index)].groupby("machine_type"):
@@ -215,75 +266,136 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
           pd.DataFrame({ "machine_type" : "nfs" }, index = [self.config["worker_prefix"] + "-nfs"])
         ])
 
+    def _load_node_list(self, allnodes: pd.DataFrame) -> pd.DataFrame:
+        """
+        (Internal)
+        Returns the nodes in Slurm's node lookup table which Slurm will actually
+        dispatch jobs to, given clust_frac
+        """
+        # we only care about nodes that Slurm will actually dispatch jobs to;
+        # the rest will be set to "drain" (i.e., blacklisted) in init_nodes.
+        return allnodes.groupby("machine_type").apply(
+          lambda x : x.iloc[0:math.ceil(len(x)*self.config["clust_frac"])]
+        ).droplevel(0)
+
     def stop(self): 
+        # with a lease, leave everything running for the next pipeline; the lease
+        # watchdog shuts the cluster down once no pipeline has held it for lease_ttl
+        if self.lease is not None:
+            canine_logging.info("Releasing cluster lease; the cluster will shut down once the lease expires")
+            self.lease.release()
+            self.lease = None
+
         # if the Docker was not spun up by this context manager, do not tear
         # anything down -- we don't want to clobber an already running cluster
-        if not self.preexisting_container:
-            # delete node configuration file
+        elif not self.preexisting_container:
+            self.teardown()
+
+        # stop the thread that restarts preempted nodes
+        self.stop_preemption_watcher()
+
+    def teardown(self):
+        """
+        Shuts down the cluster: worker nodes, the controller container, and the NFS
+        """
+        # delete node configuration file
+        try:
+            subprocess.check_call(
+              "rm -f /mnt/nfs/clust_conf/canine/backend_conf.pickle",
+              shell = True,
+              timeout = 10
+            )
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            canine_logging.error("Couldn't delete node configuration file:")
+            canine_logging.error(e)
+
+        #
+        # shutdown nodes that are still running (except NFS)
+        allnodes = self.nodes
+
+        # if we're aborting before the NFS has even been started, there are no
+        # nodes to shutdown.
+        if not allnodes.empty:
+            # sometimes the Google API will spectacularly fail; in that case, we
+            # just try to shutdown everything in the node list, regardless of whether
+            # it exists.
             try:
-                subprocess.check_call(
-                  "rm -f /mnt/nfs/clust_conf/canine/backend_conf.pickle",
-                  shell = True,
-                  timeout = 10
-                )
-            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
-                canine_logging.error("Couldn't delete node configuration file:")
-                canine_logging.error(e)
+                extant_nodes = self.list_instances_all_zones()
+                self.nodes = allnodes.loc[allnodes.index.isin(extant_nodes["name"]) &
+                               (allnodes["machine_type"] != "nfs")]
+            except:
+                self.nodes = allnodes.loc[allnodes["machine_type"] != "nfs"]
 
-            #
-            # shutdown nodes that are still running (except NFS)
-            allnodes = self.nodes
-
-            # if we're aborting before the NFS has even been started, there are no
-            # nodes to shutdown.
-            if not allnodes.empty:
-                # sometimes the Google API will spectacularly fail; in that case, we
-                # just try to shutdown everything in the node list, regardless of whether
-                # it exists.
-                try:
-                    extant_nodes = self.list_instances_all_zones()
-                    self.nodes = allnodes.loc[allnodes.index.isin(extant_nodes["name"]) &
-                                   (allnodes["machine_type"] != "nfs")]
-                except:
-                    self.nodes = allnodes.loc[allnodes["machine_type"] != "nfs"]
-
-                # superclass method will stop/delete/leave these running, depending on how
-                # self.config["action_on_stop"] is set
-                super().stop()
+            # superclass method will stop/delete/leave these running, depending on how
+            # self.config["action_on_stop"] is set
+            super().stop()
 
-            #
-            # stop the Docker
+        #
+        # stop the Docker
 
-            # this needs to happen after super().stop() is invoked, since that
-            # calls scancel, which in turn requires a running Slurm controller Docker
-            if self.container is not None:
-                self.container().stop()
+        # this needs to happen after super().stop() is invoked, since that
+        # calls scancel, which in turn requires a running Slurm controller Docker
+        if self.container is not None:
+            self.container().stop()
+            self.invalidate_container()
 
-            #
-            # unmount the NFS
+        #
+        # unmount the NFS
 
-            # this needs to be the last step, since Docker will hang if NFS is pulled
-            # out from under it
-            if self.config["nfs_action_on_stop"] != "run":
-                try:
-                    subprocess.check_call("sudo umount -f /mnt/nfs", shell = True)
-                except subprocess.CalledProcessError:
-                    canine_logging.error("Could not unmount NFS (do you have open files on it?)\nPlease run `lsof | grep /mnt/nfs`, close any open files, and run `sudo umount -f /mnt/nfs` before attempting to run another pipeline.")
+        # this needs to be the last step, since Docker will hang if NFS is pulled
+        # out from under it. The lease (if any) lives on the NFS, so it goes first
+        if os.path.exists(os.path.join(CLUSTER_CONF_DIR, "lease.json")):
+            Lease(os.path.join(CLUSTER_CONF_DIR, "lease.json")).remove()
+        if self.config["nfs_action_on_stop"] != "run":
+            try:
+                subprocess.check_call("sudo umount -f /mnt/nfs", shell = True)
+            except subprocess.CalledProcessError:
+                canine_logging.error("Could not unmount NFS (do you have open files on it?)\nPlease run `lsof | grep /mnt/nfs`, close any open files, and run `sudo umount -f /mnt/nfs` before attempting to run another pipeline.")
 
-            # superclass method will stop/delete/leave the NFS running, depending on
-            # how self.config["nfs_action_on_stop"] is set.
+        # superclass method will stop/delete/leave the NFS running, depending on
+        # how self.config["nfs_action_on_stop"] is set.
 
-            if not allnodes.empty:
-                self.nodes = allnodes.loc[allnodes["machine_type"] == "nfs"]
-                super().stop(action_on_stop = self.config["nfs_action_on_stop"], kill_straggling_jobs = False)
+        if not allnodes.empty:
+            self.nodes = allnodes.loc[allnodes["machine_type"] == "nfs"]
+            super().stop(action_on_stop = self.config["nfs_action_on_stop"], kill_straggling_jobs = False)
 
-        # kill thread that auto-restarts NFS
-        if self.NFS_monitor_lock is not None:
-            self.NFS_monitor_lock.set()
+    @classmethod
+    def from_config(cls, config: typing.Dict[str, typing.Any]) -> 'DockerTransientImageSlurmBackend':
+        """
+        Reconstructs the backend for a running cluster from its saved configuration
+        (backend_conf.pickle), e.g. so that another process can tear it down
+        """
+        self = cls.__new__(cls)
+        self.config = config
+        self.dkr = docker.from_env()
+        self._container_obj = None
+        try:
+            self.dkr.containers.get(config["cluster_name"])
+            self.container = self._get_container(config["cluster_name"])
+        except docker.errors.NotFound:
+            self.container = None
+        self.preexisting_container = False
+        self.lease = None
+        self.NFS_server_ready = True
+        self.NFS_ready = True
+        self.nodes = pd.concat([
+          self._load_node_list(pd.read_pickle("/mnt/nfs/clust_conf/slurm/host_LuT.pickle")),
+          pd.DataFrame({ "machine_type" : "nfs" }, index = [config["worker_prefix"] + "-nfs"])
+        ])
+        return self
 
     def _get_container(self, container_name):
+        """
+        Returns a function which returns the named container.
+        The container object (and its status) is cached until invalidate_container is called
+        """
+        self.invalidate_container()
         def closure():
-            return self.dkr.containers.get(container_name)
+            container = self._container_obj
+            if container is None:
+                container = self.dkr.containers.get(container_name)
+                self._container_obj = container
+            return container
 
         return closure
 
@@ -292,18 +404,22 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
         instances = self.list_instances_all_zones()
 
         # NFS doesn't exist; create it
-        # TODO: use API for this
         nfs_inst = instances.loc[instances["name"] == nfs_nodename].squeeze()
         if nfs_inst.empty:
             canine_logging.info("Creating NFS server " + nfs_nodename)
-            subprocess.check_call(
-                """gcloud compute instances create {nfs_nodename} \
-                   --image {image} --machine-type n1-standard-4 --zone {compute_zone} \
-                   {nfs_compute_script} \
-                   --tags caninetransientimage
-                """.format(nfs_nodename = nfs_nodename, **self.config),
-                shell = True
+            errors = self.create_instances(
+              [nfs_nodename],
+              body = lambda node, zone: self.instance_body(
+                node,
+                machine_type = "n1-standard-4",
+                metadata = self.config["nfs_compute_metadata"],
+                preemptible = False,
+                gpus = False,
+                zone = zone
+              )
             )
+            if len(errors):
+                raise GCEOperationError("create", errors)
 
         # otherwise, check that NFS is a valid node, and if so, start if necessary
         else:
@@ -314,9 +430,9 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
                 raise RuntimeError("Preexisting NFS server was not created by Canine.")
 
             # make sure boot disk image matches image in config.
-            nfs_inst_details = self._pzw(gce.instances().get)(instance = nfs_nodename).execute()
+            nfs_inst_details = self._pzw(gce.instances().get, zone = nfs_inst["zone"])(instance = nfs_nodename).execute()
             nfs_boot_disk = [x for x in nfs_inst_details["disks"] if x["boot"]][0]
-            nfs_disk = self._pzw(gce.disks().get)(
+            nfs_disk = self._pzw(gce.disks().get, zone = nfs_inst["zone"])(
                          disk = re.sub(r".*/(.*)$", r"\1", nfs_boot_disk["source"])
                        ).execute()
             nfs_image = re.sub(r".*/(.*)$", r"\1", nfs_disk["sourceImage"])
@@ -324,24 +440,13 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
                 raise RuntimeError("Preexisting NFS server's image {ni} does not match image {ci} defined in configuration.".format(ni = nfs_image, ci = self.config["image"]))
 
             # if we passed these checks, start the NFS if necessary
-            # TODO: use the API for this
             if nfs_inst["status"] == "TERMINATED":
                 canine_logging.print("Starting preexisting NFS server ... ", end = "", flush = True)
-                subprocess.check_call(
-                    """gcloud compute instances start {ni} --zone {z} \
-                    """.format(ni = nfs_nodename, z = nfs_inst["zone"]),
-                    shell = True
-                )
+                errors = self.instance_operations("start", [nfs_nodename])
+                if len(errors):
+                    raise GCEOperationError("start", errors)
                 canine_logging.print("done", flush = True)
 
-        # start NFS monitoring thread
-        self.NFS_monitor_lock = threading.Event()
-        self.NFS_monitor_thread = threading.Thread(
-          target = self.autorestart_preempted_node,
-          args = (nfs_nodename,)
-        )
-        self.NFS_monitor_thread.start()
-
         self.NFS_server_ready = True
 
     def mount_NFS(self):
@@ -367,85 +472,158 @@ class DockerTransientImageSlurmBackend(TransientImageSlurmBackend): # {{{
             ans = gce.images().getFromFamily(family = image_family, project = self.config["project"]).execute()
         return ans
 
-    def invoke(self, command, interactive = False, bypass_docker = False):
+    def invoke(self, command, interactive = False, bypass_docker = False, timeout = None):
         """
         Set bypass_docker to True to execute the command directly on the host,
         rather than in the controller container. Useful for debugging.
+        Non-interactive commands are run through the Docker API (bash -c in the
+        controller container). Transient Docker daemon errors are retried.
+        If timeout is given, commands still running after that many seconds are
+        killed and subprocess.TimeoutExpired is raised
         """
         if not isatty(sys.stdout, sys.stdin):
             interactive = False
 
         # re-purpose LocalSlurmBackend's invoke
         local_invoke = super(TransientImageSlurmBackend, self).invoke
-        if self.container is not None and self.container().status == "running":
-            if not bypass_docker:
-                cmd = "docker exec {ti_flag} {container} {command}".format(
-                  ti_flag = "-ti" if interactive else "",
-                  container = self.config["cluster_name"],
-                  command = command
-                )
-                # if command fails for a recoverable reason, retry up to 7 times
-                # with exponential backoff (max ~2 minute wait)
-                timeout = 8
-                tries = 0
-                while tries < 7:
-                    ret, stdout, stderr = local_invoke(cmd, interactive)
-                    stderr_str = stderr.read().decode().rstrip()
-                    stderr.seek(0)
-
-                    # no stderr; assume command ran successfully
-                    if stderr_str == "":
-                        break
-
-                    # stderr corresponds to a known Docker failure mode than can
-                    # be recovered from
-                    if any([stderr_str.startswith(reason) for reason in [
-                      "Error response from daemon: No such exec instance",
-                      "OCI runtime exec failed: exec failed"
-                    ]]):
-                        canine_logging.warning(
-                          'Command {cmd} failed with known recoverable error reason "{err}"; retrying in {timeout} seconds up to {tries} times'.format(
-                            cmd = command,
-                            err = stderr_str,
-                            timeout = timeout,
-                            tries = 5 - tries
-                          )
-                        )
-                        time.sleep(timeout)
-                        timeout *= 2
-                        tries += 1
-
-                    # warn the user that the command had stuff written to stderr,
-                    # since this may indicate something is wrong
-                    else:
-                        # TODO: when we implement verbosity, this should be "verbose"
-                        canine_logging.info(
-                          'Command {cmd} returned stderr "{err}"'.format(
-                            cmd = command,
-                            err = stderr_str
-                          )
-                        )
-                        break
-            else:
-                cmd = command
-                ret, stdout, stderr = local_invoke(cmd, interactive)
-            return (ret, stdout, stderr)
-        else:
+        if bypass_docker:
+            return local_invoke(command, interactive, timeout = timeout)
+        if not self.container_running():
             return (1, io.BytesIO(), io.BytesIO(b"Container is not running!"))
+        if interactive:
+            # TTYs still go through the docker CLI
+            return local_invoke(
+              "docker exec -ti {container} {command}".format(
+                container = self.config["cluster_name"],
+                command = command
+              ),
+              interactive,
+              timeout = timeout
+            )
 
-    def autorestart_preempted_node(self, nodename):
-        while not self.NFS_monitor_lock.is_set():
+        # if the Docker daemon fails for a recoverable reason, retry up to 7 times
+        # with exponential backoff (max ~2 minute wait)
+        backoff = 8
+        tries = 0
+        while True:
             try:
-                inst_details = self._pzw(gce.instances().get)(instance = nodename).execute()
-                if inst_details["status"] != "RUNNING":
-                    self._pzw(gce.instances().start)(instance = nodename).execute()
-            except:
-                canine_logging.warning("Error querying NFS server status; retrying in 60s ...")
+                start = time.monotonic()
+                ret, (stdout, stderr) = self.container().exec_run(
+                  ["/bin/bash", "-c", command if timeout is None else "timeout -k 5 {} bash -c {}".format(timeout, shlex.quote(command))],
+                  demux = True
+                )
+                break
+            except docker.errors.NotFound:
+                # container was removed since we last checked
+                self.invalidate_container()
+                if not self.container_running():
+                    return (1, io.BytesIO(), io.BytesIO(b"Container is not running!"))
+                # the daemon also returns 404 for lost exec instances of a running container
+                if tries >= 6:
+                    raise
+                err = "container was replaced"
+            except docker.errors.APIError as e:
+                # 409: container is stopped, paused, or restarting; 5xx: daemon or runtime failure
+                if not (e.is_server_error() or e.status_code == 409) or tries >= 6:
+                    raise
+                self.invalidate_container()
+                if e.status_code == 409 and self.container().status in {"exited", "dead", "created"}:
+                    return (1, io.BytesIO(), io.BytesIO(b"Container is not running!"))
+                err = e.explanation or str(e)
+            except (RConnectionError, ProtocolError) as e:
+                if tries >= 6:
+                    raise
+                err = str(e)
+            canine_logging.warning(
+              'Command {cmd} failed with recoverable Docker error "{err}"; retrying in {backoff} seconds up to {tries} times'.format(
+                cmd = command,
+                err = err,
+                backoff = backoff,
+                tries = 6 - tries
+              )
+            )
+            time.sleep(backoff)
+            backoff *= 2
+            tries += 1
+
+        stdout = stdout if stdout is not None else b""
+        stderr = stderr if stderr is not None else b""
+        # timeout exits 124 (or 137 once killed), but so may the command itself;
+        # only report a timeout if the command actually ran that long
+        if timeout is not None and ret in {124, 137} and time.monotonic() - start >= timeout:
+            raise subprocess.TimeoutExpired(command, timeout, stdout, stderr)
+
+        # warn the user that the command had stuff written to stderr,
+        # since this may indicate something is wrong
+        if len(stderr):
+            # TODO: when we implement verbosity, this should be "verbose"
+            canine_logging.info(
+              'Command {cmd} returned stderr "{err}"'.format(
+                cmd = command,
+                err = stderr.decode(errors = "replace").rstrip()
+              )
+            )
+        return (ret, io.BytesIO(stdout), io.BytesIO(stderr))
+
+    def container_running(self):
+        """
+        Returns True if the controller container is running.
+        A cached running status is trusted until invalidate_container is called
+        """
+        if self.container is None:
+            return False
+        try:
+            if self.container().status == "running":
+                return True
+            # only a running status is trusted from the cache
+            self.invalidate_container()
+            return self.container().status == "running"
+        except docker.errors.NotFound:
+            self.invalidate_container()
+            return False
+
+    def invalidate_container(self):
+        """
+        Discards the cached container object, so that its status is
+        reloaded from the Docker daemon on next use
+        """
+        self._container_obj = None
 
-            time.sleep(60)
+    def open_channel(self, command: str) -> typing.ContextManager[typing.Tuple[typing.BinaryIO, typing.BinaryIO]]:
+        """
+        Starts a long-running command in the controller container.
+        See LocalSlurmBackend.open_channel
+        """
+        if not self.container_running():
+            raise RuntimeError("Container is not running!")
+        return super().open_channel("docker exec -i {container} bash -c {command}".format(
+          container = self.config["cluster_name"],
+          command = shlex.quote(command)
+        ))
+
+    def watched_nodes(self):
+        """
+        The NFS server, and worker nodes which are running jobs.
+        Slurm stops idle workers itself, so only busy workers stopping indicates
+        that they were preempted
+        """
+        states = self.sinfo('N', fresh = True)["STATE"].str.rstrip("*")
+        return { self.config["worker_prefix"] + "-nfs" } | set(states.index[states.isin(["alloc", "mix", "comp"])])
+
+    def node_machine_type(self, node = None):
+        """
+        Returns the machine type of the named worker node, from Slurm's node
+        lookup table
+        """
+        if node is not None and "machine_type" in self.nodes and node in self.nodes.index:
+            mtype = self.nodes["machine_type"][node]
+            if isinstance(mtype, str) and mtype != "nfs":
+                return mtype
+        return super().node_machine_type(node)
 
     def wait_for_container_to_be_ready(self, timeout = 3000):
         canine_logging.info("Waiting up to {} seconds for Slurm controller to start ...".format(timeout))
+        self.invalidate_container()
         (rc, _, _) = self.invoke(
           "timeout {} bash -c 'while [ ! -f /.started ]; do sleep 1; done'".format(timeout),
           interactive = True
@@ -8,7 +8,7 @@ import os
 import sys
 import warnings
 from .remote import RemoteSlurmBackend
-from ..utils import get_default_gcp_zone, get_default_gcp_project, ArgumentHelper, check_call, gcp_hourly_cost, canine_logging
+from ..utils import get_default_gcp_zone, get_default_gcp_project, ArgumentHelper, check_call, gcp_hourly_cost, gcp_mtype_cpus, canine_logging
 # import paramiko
 import yaml
 import pandas as pd
@@ -281,11 +281,13 @@ class TransientGCPSlurmBackend(RemoteSlurmBackend):
         """
         super().wait_for_cluster_ready(elastic = False)
 
-    def estimate_cost(self, clock_uptime: typing.Optional[float] = None, node_uptime: typing.Optional[float] = None, job_cpu_time: typing.Optional[typing.Dict[str, float]] = None) -> typing.Tuple[float, typing.Optional[typing.Dict[str, float]]]:
+    def estimate_cost(self, clock_uptime: typing.Optional[float] = None, node_uptime: typing.Optional[typing.Union[float, typing.Dict[str, float]]] = None, job_cpu_time: typing.Optional[typing.Dict[str, typing.Union[float, typing.Dict[str, float]]]] = None) -> typing.Tuple[float, typing.Optional[typing.Dict[str, float]]]:
         """
         Returns a cost estimate for the cluster, based on any cost information available
         to the backend. May provide total node uptime (for cluster cost estimate)
         and/or cpu_time for each job to get job specific cost estimates.
+        Uptime and cpu_time broken down by node ({node: hours}) are summed, since
+        all workers share one machine type.
         Clock uptime may be provided and is useful if the cluster has an inherrant
         overhead for uptime (ie: controller nodes).
         Note: Job cost estimates may not sum up to the total cluster cost if the
@@ -293,31 +295,26 @@ class TransientGCPSlurmBackend(RemoteSlurmBackend):
         All units are in hours
         """
         cluster_cost = 0
-        worker_cpu_cost = 0
         job_cost = None
+        if isinstance(node_uptime, dict):
+            node_uptime = sum(node_uptime.values())
+        worker_info = {
+            'mtype': self.config['compute_machine_type'],
+            'preemptible': self.config['preemptible_bursting']
+        }
+        if self.config['compute_disk_type'] == 'pd-ssd':
+            worker_info['ssd_size'] = self.config['compute_disk_size_gb']
+        else:
+            worker_info['hdd_size'] = self.config['compute_disk_size_gb']
+        if 'gpu_type' in self.config and 'gpu_count' in self.config and self.config['gpu_count'] > 0:
+            worker_info['gpu_type'] = self.config['gpu_type']
+            worker_info['gpu_count'] = self.config['gpu_count']
+        worker_hourly_cost = gcp_hourly_cost(**worker_info)
         if node_uptime is not None:
-            worker_info = {
-                'mtype': self.config['compute_machine_type'],
-                'preemptible': self.config['preemptible_bursting']
-            }
-            if self.config['compute_disk_type'] == 'pd-ssd':
-                worker_info['ssd_size'] = self.config['compute_disk_size_gb']
-            else:
-                worker_info['hdd_size'] = self.config['compute_disk_size_gb']
-            if 'gpu_type' in self.config and 'gpu_count' in self.config and self.config['gpu_count'] > 0:
-                worker_info['gpu_type'] = self.config['gpu_type']
-                worker_info['gpu_count'] = self.config['gpu_count']
-            worker_hourly_cost = gcp_hourly_cost(**worker_info)
             cluster_cost += node_uptime * worker_hourly_cost
-            mtype_prefix = self.config['compute_machine_type'][:3]
-            if mtype_prefix in {'f1-', 'g1-'}:
-                ncpus = 1
-            elif mtype_prefix == 'cus': # n1-custom-X
-                ncpus = int(self.config['compute_machine_type'].split('-')[1])
-            else:
-                ncpus = int(self.config['compute_machine_type'].split('-')[2])
-            # Approximates the cost burden / CPU hour of the VM
-            worker_cpu_cost = worker_hourly_cost / ncpus
+        ncpus = gcp_mtype_cpus(self.config['compute_machine_type'])
+        # Approximates the cost burden / CPU hour of the VM
+        worker_cpu_cost = worker_hourly_cost / ncpus
         if clock_uptime is not None:
             controller_info = {
                 'mtype': self.config['controller_machine_type'],
@@ -335,7 +332,7 @@ class TransientGCPSlurmBackend(RemoteSlurmBackend):
             cluster_cost += clock_uptime * gcp_hourly_cost(**controller_info)
         if job_cpu_time is not None:
             job_cost = {
-                job_id: worker_cpu_cost * cpu_time
+                job_id: worker_cpu_cost * (sum(cpu_time.values()) if isinstance(cpu_time, dict) else cpu_time)
                 for job_id, cpu_time in job_cpu_time.items()
             }
         return cluster_cost, job_cost
@@ -5,12 +5,18 @@ import typing
 import subprocess
 import os
 import sys
+import threading
+import math
+import re
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
 from .local import LocalSlurmBackend
-from ..utils import get_default_gcp_zone, get_default_gcp_project, gcp_hourly_cost, canine_logging
+from ..utils import get_default_gcp_zone, get_default_gcp_project, gcp_hourly_cost, gcp_mtype_cpus, run_task_graph, canine_logging
 
 import googleapiclient.discovery as gd
 import googleapiclient.errors
+import httplib2
 import pandas as pd
 
 try:
@@ -21,24 +27,131 @@ except gd._auth.google.auth.exceptions.GoogleAuthError:
     )
     gce = None
 
-def list_instances(zone: str, project: str) -> pd.DataFrame:
+# Maximum number of concurrent compute API requests for instance operations
+GCE_MAX_WORKERS = 32
+
+# Default scopes granted to instances by `gcloud compute instances create`
+GCE_DEFAULT_SCOPES = [
+    "https://www.googleapis.com/auth/devstorage.read_only",
+    "https://www.googleapis.com/auth/logging.write",
+    "https://www.googleapis.com/auth/monitoring.write",
+    "https://www.googleapis.com/auth/servicecontrol",
+    "https://www.googleapis.com/auth/service.management.readonly",
+    "https://www.googleapis.com/auth/trace.append"
+]
+
+# Operation error codes for zones which are out of capacity (stockouts)
+GCE_CAPACITY_ERRORS = ["ZONE_RESOURCE_POOL_EXHAUSTED", "ZONE_RESOURCE_POOL_EXHAUSTED_WITH_DETAILS"]
+
+_gce_http = threading.local()
+
+def gce_http() -> httplib2.Http:
     """
-    List all instances in a given zone and project
+    Returns an http object for executing compute API requests on the calling thread.
+    httplib2 is not thread safe, so each thread needs its own connection
     """
-    inst_dict = gce.instances().list(project = project, zone = zone).execute()
+    if getattr(_gce_http, "service", None) is not gce:
+        credentials = getattr(gce._http, "credentials", None)
+        _gce_http.http = gd._auth.authorized_http(credentials) if credentials is not None else httplib2.Http()
+        _gce_http.service = gce
+    return _gce_http.http
+
+def _http_error_message(e: googleapiclient.errors.HttpError) -> str:
+    """
+    (Internal)
+    Extracts a readable message from a compute API error
+    """
+    try:
+        return "{} {}".format(e.resp.status, e._get_reason().strip())
+    except Exception:
+        return str(e)
 
-    fnames = ['name', 'machineType', 'status', 'zone', 'selfLink', 'tags']
+def is_capacity_error(message: str) -> bool:
+    """
+    Returns True if an instance operation error message means that the zone
+    is out of capacity
+    """
+    return any(re.search(r"\b{}\b".format(code), message) for code in GCE_CAPACITY_ERRORS)
+
+class GCEOperationError(RuntimeError):
+    """
+    Raised when compute instance operations fail for one or more instances.
+    errors maps each failed instance name to its error message
+    """
+
+    def __init__(self, action: str, errors: typing.Dict[str, str]):
+        self.action = action
+        self.errors = errors
+        super().__init__("Failed to {} {} instance(s):\n{}".format(
+            action,
+            len(errors),
+            "\n".join(" - {}: {}".format(node, err) for node, err in sorted(errors.items()))
+        ))
+
+INSTANCE_FIELDS = ['name', 'machineType', 'status', 'zone', 'selfLink', 'tags']
+
+def _instance_frame(items: typing.List[typing.Dict[str, typing.Any]]) -> pd.DataFrame:
+    """
+    (Internal)
+    Converts instance resources returned by the API into a dataframe
+    """
+    if not len(items):
+        return pd.DataFrame(columns = INSTANCE_FIELDS)
 
-    if "items" in inst_dict:
-        inst_DF = pd.DataFrame([[x[y] for y in fnames] for x in inst_dict['items']], columns = fnames)
-        inst_DF["tags"] = inst_DF["tags"].apply(lambda x : x["items"] if "items" in x else [])
-    else:
-        return pd.DataFrame()
+    inst_DF = pd.DataFrame([[x.get(y) for y in INSTANCE_FIELDS] for x in items], columns = INSTANCE_FIELDS)
+    inst_DF["tags"] = inst_DF["tags"].apply(lambda x : x["items"] if x is not None and "items" in x else [])
 
     # API returns selfLinks; parse these into something human-readable
-    return inst_DF.apply(lambda x : x.str.replace(r'.*/', '')
+    return inst_DF.apply(lambda x : x.str.replace(r'.*/', '', regex = True)
                          if x.name in ["machineType", "zone"] else x)
 
+def list_instances(zone: str, project: str) -> pd.DataFrame:
+    """
+    List all instances in a given zone and project
+    """
+    inst_dict = gce.instances().list(project = project, zone = zone).execute()
+    return _instance_frame(inst_dict.get("items", []))
+
+def list_instances_aggregated(project: str) -> pd.DataFrame:
+    """
+    List all instances across all zones in a given project.
+    Uses a single paginated aggregated list request, fetching only the fields we need
+    """
+    items = []
+    request = gce.instances().aggregatedList(
+      project = project,
+      fields = "nextPageToken,items/*/instances({})".format(",".join(INSTANCE_FIELDS)),
+      maxResults = 500
+    )
+    while request is not None:
+        response = request.execute(num_retries = 3)
+        for scope in response.get("items", {}).values():
+            items.extend(scope.get("instances", []))
+        request = gce.instances().aggregatedList_next(request, response)
+    return _instance_frame(items)
+
+def list_instance_images(project: str) -> typing.Dict[str, str]:
+    """
+    Returns {instance name: boot disk image name} for all instances in a given project.
+    Uses a single paginated aggregated list of disks
+    """
+    images = {}
+    request = gce.disks().aggregatedList(
+      project = project,
+      fields = "nextPageToken,items/*/disks(sourceImage,users)",
+      maxResults = 500
+    )
+    while request is not None:
+        response = request.execute(num_retries = 3)
+        for scope in response.get("items", {}).values():
+            for disk in scope.get("disks", []):
+                # only boot disks are created from images
+                if "sourceImage" in disk:
+                    for user in disk.get("users", []):
+                        images[re.sub(r".*/", "", user)] = re.sub(r".*/", "", disk["sourceImage"])
+        request = gce.disks().aggregatedList_next(request, response)
+    return images
+
 class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
     """
     Backend for starting a Slurm cluster using a preconfigured GCE image.
@@ -56,6 +169,43 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
     * If GPUs are added, drivers must already be installed
     """
 
+    # Whether init_nodes needs the Slurm controller to be running. If not,
+    # nodes are started while the controller starts
+    nodes_require_controller = False
+
+    # Seconds between polls of pending compute operations
+    operation_poll_interval = 2
+
+    # Seconds for which the project's instance list is cached
+    instance_list_ttl = 30
+    _instance_list = None
+
+    # Start time of each running node's current uptime interval, and the
+    # total seconds of completed intervals (see node_hours)
+    _node_start = None
+    _node_seconds = 0
+    _autoscaler_thread = None
+
+    # Seconds between preemption checks, the instance status seen at the last
+    # check, and nodes waiting to be restarted
+    preemption_check_interval = 60
+    _preemption_thread = None
+    _instance_status = None
+
+    # Thread (re)creating stopped warm pool nodes, and the nodes it is working on
+    _pool_thread = None
+    _pool_pending = frozenset()
+
+    # Zone of each instance outside compute_zone
+    _node_zones = None
+
+    # Slurm node feature of non-preemptible nodes, the nodes provisioned with
+    # it, nodes being provisioned, and the tasks moved onto them
+    on_demand_feature = "ondemand"
+    _on_demand_nodes = frozenset()
+    _on_demand_pending = frozenset()
+    _on_demand_jobs = frozenset()
+
     def __init__(
         self, *, image: str, worker_prefix: str = 'slurm-canine', tot_node_count: int = 50,
         init_node_count: typing.Optional[int] = None, compute_zone: typing.Optional[str] = None,
@@ -67,8 +217,10 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
         shutdown_script: typing.Optional[str] = None,
         project: typing.Optional[str] = None,
         user: typing.Optional[str] = None, slurm_conf_path: typing.Optional[str] = None,
-        action_on_stop: str = "stop",
-        **kwargs
+        action_on_stop: str = "stop", fallback_zones: typing.Optional[typing.List[str]] = None,
+        autoscale: bool = False,
+        min_node_count: int = 0, autoscale_interval: int = 60, idle_timeout: int = 300,
+        warm_pool_size: int = 0, **kwargs
     ):
         #
         # validate inputs that will not be caught later on (e.g. by gcloud invocations)
@@ -82,6 +234,9 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
             if init_node_count > tot_node_count:
                 raise ValueError("init_node_count cannot exceed tot_node_count.")
 
+        if min_node_count < 0 or min_node_count > tot_node_count:
+            raise ValueError("min_node_count must be between 0 and tot_node_count.")
+
         if startup_script_file is not None and startup_script is not None:
             raise ValueError("Cannot simultaneously specifiy startup_script_file and startup_script.")
         if shutdown_script_file is not None and shutdown_script is not None:
@@ -110,6 +265,7 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
             "tot_node_count" : tot_node_count,
             "init_node_count" : init_node_count if init_node_count else tot_node_count,
             "compute_zone" : compute_zone,
+            "fallback_zones" : [zone for zone in fallback_zones or [] if zone != compute_zone],
             "worker_type" : worker_type,
             "preemptible" : "--preemptible" if preemptible else "",
             "gpu_type" : gpu_type,
@@ -127,7 +283,15 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
             "project" : project if project else get_default_gcp_project(),
             "user" : user if user else "root",
             "slurm_conf_path" : slurm_conf_path,
-            "action_on_stop" : action_on_stop
+            "action_on_stop" : action_on_stop,
+            "autoscale" : autoscale,
+            "min_node_count" : min_node_count,
+            "autoscale_interval" : autoscale_interval,
+            "idle_timeout" : idle_timeout,
+            "warm_pool_size" : warm_pool_size,
+            # raw metadata for the compute API (the above are gcloud flags)
+            "compute_metadata" : { k : v for k, v in compute_script.items() if v is not None },
+            "compute_metadata_files" : { k : v for k, v in compute_script_file.items() if v is not None }
         }
 
         if self.config['project'] is None:
@@ -136,6 +300,8 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
         # this backend resets itself on startup; no need for the orchestrator
         # to do this.
         self.hard_reset_on_orch_init = False
+        if kwargs.get('status_cache_ttl') is not None:
+            self.status_cache_ttl = float(kwargs['status_cache_ttl'])
 
         # list of nodes under the purview of Canine
         self.nodes = pd.DataFrame()
@@ -145,11 +311,22 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
 
     def __enter__(self):
         try:
-            # start Slurm controller (and associated programs)
-            self.init_slurm()
+            # start Slurm controller (and associated programs), and nodes
+            timings = run_task_graph({
+              "controller" : (self.init_slurm, []),
+              "nodes" : (self.init_nodes, ["controller"] if self.nodes_require_controller else [])
+            })
+            canine_logging.info("Cluster startup phases: " + ", ".join(
+              "{} {:.1f}s".format(phase, t) for phase, t in timings.items()
+            ))
+
+            # nodes created outside compute_zone need their zonal addresses
+            self.update_node_addresses(self.nodes.index)
+
+            self.start_preemption_watcher()
 
-            # start nodes
-            self.init_nodes()
+            if self.config.get("autoscale"):
+                self.start_autoscaler()
 
             return self
         except KeyboardInterrupt:
@@ -169,7 +346,6 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
         #
         # check if Slurm is already running locally; start (with hard reset) if not
 
-        canine_logging.print("Checking for running Slurm controller ... ", end = "", flush = True)
 
         subprocess.check_call(
             """sudo -E -u {user} bash -c 'pgrep slurmctld || slurmctld -c -f {slurm_conf_path} &&
@@ -183,7 +359,8 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
         subprocess.check_call("pgrep slurmctld && pgrep slurmdbd && pgrep munged", shell = True,
                               stdout = subprocess.DEVNULL)
 
-        canine_logging.print("done", flush = True)
+        # (nodes may be starting concurrently; avoid splitting their progress messages)
+        canine_logging.print("Slurm controller is running", flush = True)
 
     def init_nodes(self):
         #
@@ -231,59 +408,88 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
             # WARN if any nodes (Canine or external) are already defined but
             # present in other zones
             zonemismatch_idx = ~instances.loc[:, "zone"].isna() & \
-                               (instances.loc[:, "zone"] != self.config["compute_zone"])
+                               ~instances.loc[:, "zone"].isin(self.zone_ranking())
 
             if zonemismatch_idx.any():
-                canine_logging.warning("Nodes that already exist do not match specified compute zone ({compute_zone}), which may result in degraded performance or egress charges.".format(**self.config))
+                canine_logging.warning("Nodes that already exist do not match specified compute zones ({}), which may result in degraded performance or egress charges.".format(", ".join(self.zone_ranking())))
                 canine_logging.warning(instances.drop(columns = "selfLink").loc[zonemismatch_idx].to_string(index = False))
 
-        self.nodes = nodenames.loc[~nodenames["is_ex_node"]]
+        self.nodes = nodenames.loc[~nodenames["is_ex_node"]].copy()
+
+        initial = self.nodes.index[:self.config["init_node_count"]]
+        extras = self.nodes.index[self.config["init_node_count"]:]
+        warm_pool = self.config.get("warm_pool_size", 0) > 0
+
+        # stopped Canine nodes whose boot disks come from a different image are
+        # replaced. With a warm pool, nodes not needed right away are replaced
+        # in the background
+        stopped = pd.Index(instances.loc[instances["is_k9_node"] & (instances["status"] == "TERMINATED"), "name"])
+        stale = pd.Index([])
+        if len(stopped):
+            images = list_instance_images(self.config["project"])
+            image = re.sub(r".*/", "", self.config["image"])
+            stale = pd.Index([node for node in stopped if images.get(node, image) != image])
+            stopped = stopped.difference(stale)
+        replace_now = stale.intersection(initial) if warm_pool else stale
+        if len(replace_now):
+            canine_logging.info("Replacing {} worker nodes with outdated images".format(len(replace_now)))
+            errors = self.instance_operations("delete", replace_now, ignore_missing = True)
+            if len(errors):
+                raise GCEOperationError("delete", errors)
+            self.nodes.loc[replace_now, "is_k9_node"] = False
 
         # create the nodes
-
-        # TODO: support the other config flags
-        # TODO: use API to launch these
-
-        if (~self.nodes["is_k9_node"]).any():
-            nodes_to_create = self.nodes.index[~self.nodes["is_k9_node"]].values
-
-            canine_logging.print("Creating {0:d} worker nodes ... ".format(nodes_to_create.shape[0]),
+        missing = self.nodes.index[~self.nodes["is_k9_node"]]
+        nodes_to_create = missing.intersection(initial) if warm_pool else missing
+        if len(nodes_to_create):
+            canine_logging.print("Creating {0:d} worker nodes ... ".format(len(nodes_to_create)),
                   end = "", flush = True)
-            subprocess.check_call(
-                """gcloud compute instances create {workers} \
-                   --image {image} --machine-type {worker_type} --zone {compute_zone} \
-                   {compute_script} {compute_script_file} {preemptible} \
-                   --tags caninetransientimage
-                """.format(**self.config, workers = " ".join(nodes_to_create)),
-                shell = True
-            )
+            errors = self.create_instances(nodes_to_create)
+            if len(errors):
+                raise GCEOperationError("create", errors)
             canine_logging.print("done", flush = True)
 
         # start nodes previously created by Canine
 
-        instances_to_start = instances.loc[instances["is_k9_node"] &
-          (instances["status"] == "TERMINATED"), "name"]
+        instances_to_start = stopped.intersection(initial)
 
-        # TODO: use API to start these
-        if instances_to_start.shape[0] > 0:
-            canine_logging.print("Starting {0:d} preexisting worker nodes ... ".format(instances_to_start.shape[0]),
+        if len(instances_to_start):
+            canine_logging.print("Starting {0:d} preexisting worker nodes ... ".format(len(instances_to_start)),
                   end = "", flush = True)
-            subprocess.check_call(
-                """gcloud compute instances start {workers} --zone {compute_zone} \
-                """.format(**self.config, workers = " ".join(instances_to_start.values)),
-                shell = True
-            )
+            errors = self.start_instances(instances_to_start)
+            if len(errors):
+                raise GCEOperationError("start", errors)
             canine_logging.print("done", flush = True)
 
         #
         # shut down nodes exceeding init_node_count
 
-        for node in self.nodes.index[self.config["init_node_count"]:]:
-            try:
-                self._pzw(gce.instances().stop)(instance = node).execute()
-            except Exception as e:
-                canine_logging.warning("Couldn't shutdown instance {}".format(node))
-                canine_logging.warning(e)
+        to_fill = missing.intersection(extras) if warm_pool else pd.Index([])
+        to_replace = stale.intersection(extras) if warm_pool else pd.Index([])
+        errors = self.instance_operations(
+          "stop",
+          extras.difference(stopped).difference(to_fill).difference(to_replace),
+          wait = False
+        )
+        for node, err in errors.items():
+            canine_logging.warning("Couldn't shutdown instance {}".format(node))
+            canine_logging.warning(err)
+
+        # create missing or outdated warm pool nodes in the background
+        if len(to_fill) or len(to_replace):
+            self._pool_pending = frozenset(to_fill.union(to_replace))
+            self._pool_thread = threading.Thread(
+              target = self.refresh_pool,
+              args = (list(to_fill), list(to_replace)),
+              daemon = True
+            )
+            self._pool_thread.start()
+
+        self._node_start = {}
+        self._node_seconds = 0
+        self._on_demand_nodes = frozenset()
+        self._on_demand_jobs = frozenset()
+        self._track_uptime(self.nodes.index[:self.config["init_node_count"]], running = True)
 
     def stop(self, action_on_stop = None, kill_straggling_jobs = True):
         """
@@ -292,6 +498,12 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
         if action_on_stop is None:
             action_on_stop = self.config["action_on_stop"]
 
+        self.stop_autoscaler()
+        self.stop_preemption_watcher()
+        if self._pool_thread is not None:
+            self._pool_thread.join()
+            self._pool_thread = None
+
         #
         # kill any still-running jobs
         if kill_straggling_jobs:
@@ -302,7 +514,7 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
                 canine_logging.print("Terminating all jobs ... ", end = "", flush = True)
                 tot_time = 0
                 while True:
-                    if self.squeue().empty or tot_time > 60:
+                    if self.squeue(fresh=True).empty or tot_time > 60:
                         break
                     tot_time += 1
                     time.sleep(1)
@@ -313,37 +525,624 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
 
         #
         # stop, delete, or leave running compute nodes
-        for node in self.nodes.index:
+        # default behavior is to shut down
+        if action_on_stop != "run":
+            # the first warm_pool_size nodes are kept (stopped) for the next cluster.
+            # Non-preemptible nodes are never kept
+            on_demand = self.nodes.index.intersection(list(self._on_demand_nodes), sort = False)
+            pool = self.nodes.index[:self.config.get("warm_pool_size", 0)] if action_on_stop == "delete" else self.nodes.index[:0]
+            pool = pool.difference(on_demand, sort = False)
+            errors = self.instance_operations(
+              "delete" if action_on_stop == "delete" else "stop",
+              self.nodes.index.difference(pool.union(on_demand, sort = False), sort = False),
+              ignore_missing = True,
+              wait = False
+            )
+            errors.update(self.instance_operations("stop", pool, ignore_missing = True, wait = False))
+            errors.update(self.instance_operations("delete", on_demand, ignore_missing = True, wait = False))
+            for node, err in errors.items():
+                canine_logging.error("Couldn't shutdown instance {}".format(node))
+                canine_logging.error(err)
+            self._track_uptime([node for node in self.nodes.index if node not in errors], running = False)
+
+    def start_preemption_watcher(self):
+        """
+        Starts a thread which restarts preempted nodes (see check_preemption)
+        """
+        if self._preemption_thread is not None:
+            return
+        self._preemption_lock = threading.Event()
+        self._preemption_thread = threading.Thread(target = self._preemption_loop, daemon = True)
+        self._preemption_thread.start()
+
+    def stop_preemption_watcher(self):
+        """
+        Stops the preemption watcher thread, if it is running
+        """
+        if self._preemption_thread is not None:
+            self._preemption_lock.set()
+            self._preemption_thread.join()
+            self._preemption_thread = None
+
+    def _preemption_loop(self):
+        """
+        (Internal)
+        Runs check_preemption every preemption_check_interval seconds until stopped
+        """
+        while not self._preemption_lock.wait(self.preemption_check_interval):
+            try:
+                self.check_preemption()
+            except Exception as e:
+                canine_logging.warning("Error checking for preempted nodes: {}: {}; retrying in {}s ...".format(
+                  type(e).__name__, e, self.preemption_check_interval
+                ))
+
+    def watched_nodes(self) -> typing.Set[str]:
+        """
+        Returns the nodes which should be running. If one of these stops, it
+        was preempted (see check_preemption)
+        """
+        return set(self._node_start or ())
+
+    def check_preemption(self) -> typing.List[str]:
+        """
+        Compares instance statuses (from one aggregated listing) with those seen
+        at the last check. Watched nodes which have stopped were preempted:
+        their tasks are requeued, and the nodes are restarted once fully stopped.
+        Preemptions are counted per node and per zone (preemption_counts and
+        zone_preemption_counts). Returns the newly preempted nodes
+        """
+        if self._instance_status is None:
+            self._instance_status = {}
+            self._restart_pending = set()
+            self.preemption_counts = collections.Counter()
+            self.zone_preemption_counts = collections.Counter()
+
+        watched = self.watched_nodes()
+        instances = self.list_instances_all_zones(fresh = True).set_index("name")
+        instances = instances.loc[~instances.index.duplicated()]
+        previous, status = self._instance_status, instances["status"].to_dict()
+        self._instance_status = status
+
+        # nodes may have been stopped deliberately (e.g. by the autoscaler)
+        # while we were listing
+        watched &= self.watched_nodes()
+        preempted = sorted(
+          node for node in watched
+          if previous.get(node) == "RUNNING" and status.get(node) in {"STOPPING", "TERMINATED"}
+        )
+        for node in preempted:
+            self.preemption_counts[node] += 1
+            self.zone_preemption_counts[instances.loc[node, "zone"]] += 1
+            canine_logging.warning("Node {} ({}) was preempted".format(node, instances.loc[node, "zone"]))
+        if len(preempted):
+            self.requeue_preempted(preempted)
+            self._restart_pending.update(preempted)
+
+        # restart preempted nodes once they have fully stopped
+        to_restart = [node for node in sorted(self._restart_pending) if status.get(node) == "TERMINATED"]
+        restarted = []
+        for zone, nodes in instances.loc[to_restart].groupby("zone"):
+            errors = self.instance_operations("start", nodes.index, zone = zone, wait = False)
+            for node, err in errors.items():
+                canine_logging.warning("Couldn't restart preempted node {}: {}".format(node, err))
+            restarted.extend(node for node in nodes.index if node not in errors)
+        self._restart_pending.difference_update(restarted)
+        self._restart_pending.intersection_update(status)
+
+        # Slurm brings the nodes back once they register
+        slurm_nodes = self._slurm_nodes(restarted)
+        if len(slurm_nodes):
+            self.invoke("sudo -E scontrol update nodename={} state=resume".format(",".join(slurm_nodes)))
+        return preempted
+
+    def _slurm_nodes(self, nodes: typing.Iterable[str]) -> typing.List[str]:
+        """
+        (Internal)
+        Returns the given nodes which are Slurm nodes (e.g. not the NFS server)
+        """
+        nodes = list(nodes)
+        if not len(nodes):
+            return []
+        known = set(self.sinfo('N', fresh = True).index)
+        return [node for node in nodes if node in known]
+
+    def requeue_preempted(self, nodes: typing.Iterable[str]):
+        """
+        Requeues the tasks running on preempted nodes, and marks the nodes
+        down so that Slurm dispatches the tasks elsewhere right away
+        """
+        nodes = self._slurm_nodes(nodes)
+        if not len(nodes):
+            return
+        queue = self.squeue(fresh = True, nodelist = ",".join(nodes))
+        jobs = queue.index[queue["ST"].isin(["R", "CG", "CF"])]
+        if len(jobs):
+            canine_logging.info("Requeueing {} tasks from preempted nodes".format(len(jobs)))
+            self.invoke("sudo -E scontrol requeue {}".format(",".join(jobs)))
+            self._constrain_on_demand(jobs.intersection(list(self._on_demand_jobs)))
+        self.invoke("sudo -E scontrol update nodename={} state=down reason=preempted".format(",".join(nodes)))
+
+    def request_on_demand(self, jobs: typing.Iterable[str], partition: typing.Optional[str] = None) -> typing.List[str]:
+        """
+        Moves tasks which keep getting preempted onto non-preemptible nodes.
+        Enough worker nodes to fit all moved tasks are recreated as non-preemptible
+        instances (see provision_on_demand). Pending tasks are constrained to
+        these nodes right away; running tasks are constrained if they are
+        preempted again (see requeue_preempted).
+        If a partition is given, pending tasks are moved to it instead.
+        Returns the tasks which were moved (or will be, once requeued)
+        """
+        if partition is not None:
+            return super().request_on_demand(jobs, partition)
+        jobs = [job for job in jobs if job not in self._on_demand_jobs]
+        if not len(jobs):
+            return []
+        queue = self.squeue('r', fresh = True)
+        queue = queue.loc[~queue.index.duplicated()]
+
+        # cover the CPUs of every unfinished task moved so far
+        moved = [job for job in [*self._on_demand_jobs, *jobs] if job in queue.index]
+        needed = math.ceil(queue.loc[moved, "CPUS"].sum() / gcp_mtype_cpus(self.config["worker_type"]))
+        if needed > len(self._on_demand_nodes):
+            self.provision_on_demand(needed - len(self._on_demand_nodes))
+        if not len(self._on_demand_nodes):
+            canine_logging.warning("No worker nodes are available to run preempted tasks on demand")
+            return []
+
+        self._on_demand_jobs = self._on_demand_jobs | set(jobs)
+        self._constrain_on_demand(queue.index[queue["ST"] == "PD"].intersection(jobs))
+        return jobs
+
+    def _constrain_on_demand(self, jobs: typing.Iterable[str]):
+        """
+        (Internal)
+        Restricts the given pending tasks to non-preemptible nodes
+        """
+        jobs = list(jobs)
+        if len(jobs):
+            self.invoke("sudo -E scontrol update jobid={} features={}".format(",".join(jobs), self.on_demand_feature))
+
+    def provision_on_demand(self, count: int) -> typing.List[str]:
+        """
+        Recreates up to count worker nodes as non-preemptible instances, and
+        adds the on_demand_feature to them in Slurm. Stopped nodes are used
+        first, then idle ones. Returns the provisioned nodes
+        """
+        exclude = self._on_demand_nodes | self._pool_pending
+        states = self.sinfo('N', fresh = True)["STATE"]
+        states = states.loc[~states.index.duplicated()]
+        stopped = [node for node in reversed(self.nodes.index) if node not in self._node_start and node not in exclude]
+        idle = [node for node in reversed(self.nodes.index) if node in self._node_start and node not in exclude and states.get(node) == "idle"]
+        nodes = (stopped + idle)[:count]
+        if not len(nodes):
+            return []
+
+        self._on_demand_pending = frozenset(nodes)
+        try:
+            # drain idle nodes, so that Slurm does not dispatch to them as they
+            # are deleted (and so that they are not mistaken for preempted nodes)
+            idle = [node for node in nodes if node in idle]
+            if len(idle):
+                self.invoke("sudo -E scontrol update nodename={} state=drain reason=on_demand".format(",".join(idle)))
+                self._track_uptime(idle, running = False)
+            canine_logging.info("Recreating {} worker nodes as non-preemptible instances".format(len(nodes)))
+            errors = self.instance_operations("delete", nodes, ignore_missing = True)
+            resume = [node for node in idle if node in errors]
+            if len(resume):
+                self.invoke("sudo -E scontrol update nodename={} state=resume".format(",".join(resume)))
+                self._track_uptime(resume, running = True)
+            errors.update(self.create_instances(
+              [node for node in nodes if node not in errors],
+              body = lambda name, zone: self.instance_body(name, zone = zone, preemptible = False)
+            ))
+            for node, err in errors.items():
+                canine_logging.warning("Couldn't provision non-preemptible node {}: {}".format(node, err))
+
+            provisioned = [node for node in nodes if node not in errors]
+            if len(provisioned):
+                self.update_node_addresses(provisioned)
+                self.invoke("sudo -E scontrol update nodename={} availablefeatures={feature} activefeatures={feature} state=resume".format(
+                  ",".join(provisioned), feature = self.on_demand_feature
+                ))
+                self._track_uptime(provisioned, running = True)
+                self._on_demand_nodes = self._on_demand_nodes | set(provisioned)
+                if hasattr(self, "_autoscaler_drained"):
+                    self._autoscaler_drained.difference_update(provisioned)
+            return provisioned
+        finally:
+            self._on_demand_pending = frozenset()
+
+    def refresh_pool(self, create: typing.Iterable[str], replace: typing.Iterable[str] = ()) -> typing.Dict[str, str]:
+        """
+        Creates stopped warm pool nodes: nodes in replace are deleted first
+        (e.g. because their image is outdated), then all are created and stopped.
+        Returns {node: error message} for nodes which could not be refreshed
+        """
+        errors = self.instance_operations("delete", replace, ignore_missing = True)
+        create = [node for node in [*create, *replace] if node not in errors]
+        if len(create):
+            canine_logging.info("Creating {} warm pool nodes in the background".format(len(create)))
+        errors.update(self.create_instances(create))
+        errors.update(self.instance_operations("stop", [node for node in create if node not in errors]))
+        for node, err in errors.items():
+            canine_logging.warning("Couldn't refresh warm pool node {}: {}".format(node, err))
+        self._pool_pending = frozenset()
+        return errors
+
+    def _track_uptime(self, nodes: typing.Iterable[str], running: bool):
+        """
+        (Internal)
+        Records that the given nodes have started or stopped running
+        """
+        if self._node_start is None:
+            return
+        now = time.monotonic()
+        for node in nodes:
+            if running:
+                self._node_start.setdefault(node, now)
+            elif node in self._node_start:
+                self._node_seconds += now - self._node_start.pop(node)
+
+    def node_hours(self) -> typing.Optional[float]:
+        """
+        Returns the total node-hours for which worker nodes have been running
+        """
+        if self._node_start is None:
+            return None
+        now = time.monotonic()
+        return (self._node_seconds + sum(now - start for start in list(self._node_start.values()))) / 3600
+
+    def start_autoscaler(self):
+        """
+        Starts a thread which periodically resizes the cluster (see autoscale)
+        """
+        if self._autoscaler_thread is not None:
+            return
+        self._autoscaler_lock = threading.Event()
+        self._idle_since = {}
+        self._autoscaler_drained = set()
+        self._autoscaler_thread = threading.Thread(target = self._autoscaler_loop, daemon = True)
+        self._autoscaler_thread.start()
+
+    def stop_autoscaler(self):
+        """
+        Stops the autoscaler thread, if it is running
+        """
+        if self._autoscaler_thread is not None:
+            self._autoscaler_lock.set()
+            self._autoscaler_thread.join()
+            self._autoscaler_thread = None
+
+        # nodes stopped by the autoscaler remain drained in Slurm; return them
+        # to service so that they are usable by the next cluster
+        if len(getattr(self, "_autoscaler_drained", ())):
+            self.invoke("sudo -E scontrol update nodename={} state=resume".format(",".join(sorted(self._autoscaler_drained))))
+            self._autoscaler_drained = set()
+
+    def _autoscaler_loop(self):
+        """
+        (Internal)
+        Runs autoscale every autoscale_interval seconds until stopped
+        """
+        while not self._autoscaler_lock.wait(self.config["autoscale_interval"]):
             try:
-                if action_on_stop == "delete":
-                    self._pzw(gce.instances().delete)(instance = node).execute()
-                elif action_on_stop == "run":
-                    # leave it running
-                    pass
+                self.autoscale()
+            except Exception as e:
+                canine_logging.warning("Autoscaler failed: {}: {}; retrying in {}s ...".format(
+                  type(e).__name__, e, self.config["autoscale_interval"]
+                ))
+
+    def autoscale(self) -> typing.Tuple[typing.List[str], typing.List[str]]:
+        """
+        Resizes the cluster once, within min_node_count and tot_node_count.
+        Stopped nodes are started to cover the CPUs requested by pending tasks.
+        Nodes which have been idle for idle_timeout seconds, and which are not
+        needed for pending tasks, are drained and stopped.
+        Returns (started nodes, stopped nodes)
+        """
+        now = time.monotonic()
+        if not hasattr(self, "_idle_since"):
+            self._idle_since = {}
+            self._autoscaler_drained = set()
+        ncpus = gcp_mtype_cpus(self.config["worker_type"])
+
+        queue = self.squeue('r', fresh = True)
+        pending_cpus = queue.loc[queue["ST"] == "PD", "CPUS"].sum()
+        demand = math.ceil(pending_cpus / ncpus)
+
+        states = self.sinfo('N', fresh = True)["STATE"]
+        states = states.loc[~states.index.duplicated()]
+
+        running = [node for node in self.nodes.index if node in self._node_start]
+        stopped = [node for node in self.nodes.index if node not in self._node_start and node not in self._pool_pending | self._on_demand_pending]
+        busy = {node for node in running if states.get(node) in {"alloc", "mix", "comp"}}
+        idle = [node for node in running if states.get(node) == "idle"]
+
+        # nodes must stay idle for idle_timeout before they are stopped
+        for node in running:
+            if node in idle:
+                self._idle_since.setdefault(node, now)
+            else:
+                self._idle_since.pop(node, None)
+
+        # idle and still booting nodes will absorb pending tasks first
+        available = len(running) - len(busy)
+
+        #
+        # scale up
+        if demand > available and len(stopped):
+            to_start = stopped[:min(demand - available, self.config["tot_node_count"] - len(running))]
+            canine_logging.info("Autoscaler: starting {} nodes for {} pending CPUs".format(len(to_start), pending_cpus))
+            errors = self.start_instances(to_start)
+            for node, err in errors.items():
+                canine_logging.warning("Autoscaler: couldn't start instance {}: {}".format(node, err))
+            started = [node for node in to_start if node not in errors]
+            if len(started):
+                self.update_node_addresses(started)
+                self.invoke("sudo -E scontrol update nodename={} state=resume".format(",".join(started)))
+                self._track_uptime(started, running = True)
+                self._autoscaler_drained.difference_update(started)
+            return started, []
+
+        #
+        # scale down
+        expired = [
+            node for node in reversed(idle)
+            if now - self._idle_since[node] >= self.config["idle_timeout"]
+        ][:max(0, min(available - demand, len(running) - self.config["min_node_count"]))]
+        if not len(expired):
+            return [], []
+
+        # drain first, so that Slurm does not dispatch to nodes as they stop
+        rc, _, _ = self.invoke("sudo -E scontrol update nodename={} state=drain reason=autoscaler".format(",".join(expired)))
+        if rc != 0:
+            canine_logging.warning("Autoscaler: could not drain nodes")
+            return [], []
+        states = self.sinfo('N', fresh = True)["STATE"]
+        drained = [node for node in expired if node in states.index and states.loc[[node]].iloc[0] == "drain"]
+
+        # nodes which picked up work while draining are returned to service
+        errors = self.instance_operations("stop", drained, wait = False)
+        for node, err in errors.items():
+            canine_logging.warning("Autoscaler: couldn't stop instance {}: {}".format(node, err))
+        resume = [node for node in expired if node not in drained or node in errors]
+        if len(resume):
+            self.invoke("sudo -E scontrol update nodename={} state=resume".format(",".join(resume)))
+        stopped = [node for node in drained if node not in errors]
+        if len(stopped):
+            canine_logging.info("Autoscaler: stopped {} idle nodes".format(len(stopped)))
+        self._track_uptime(stopped, running = False)
+        for node in stopped:
+            self._idle_since.pop(node, None)
+        self._autoscaler_drained.update(stopped)
+        return [], stopped
+
+    def instance_body(self, name: str, machine_type: typing.Optional[str] = None, metadata: typing.Optional[typing.Dict[str, str]] = None, metadata_files: typing.Optional[typing.Dict[str, str]] = None, preemptible: typing.Optional[bool] = None, gpus: bool = True, zone: typing.Optional[str] = None) -> typing.Dict[str, typing.Any]:
+        """
+        Returns the compute API request body for creating the named instance.
+        Defaults to a worker node in compute_zone, as configured for this backend
+        """
+        zone = zone if zone is not None else self.config["compute_zone"]
+        machine_type = machine_type if machine_type is not None else self.config["worker_type"]
+        preemptible = preemptible if preemptible is not None else bool(self.config["preemptible"])
+        if metadata is None:
+            metadata = self.config["compute_metadata"]
+            metadata_files = self.config["compute_metadata_files"]
+        items = dict(metadata)
+        for key, path in (metadata_files or {}).items():
+            with open(path) as r:
+                items[key] = r.read()
+        image = self.config["image"]
+        body = {
+            "name" : name,
+            "machineType" : "zones/{}/machineTypes/{}".format(zone, machine_type),
+            "disks" : [{
+                "boot" : True,
+                "autoDelete" : True,
+                "initializeParams" : {
+                    "sourceImage" : image if "/" in image else "projects/{}/global/images/{}".format(self.config["project"], image)
+                }
+            }],
+            "networkInterfaces" : [{
+                "network" : "global/networks/default",
+                "accessConfigs" : [{ "type" : "ONE_TO_ONE_NAT", "name" : "External NAT" }]
+            }],
+            "scheduling" : {
+                "preemptible" : preemptible,
+                "automaticRestart" : not preemptible,
+                "onHostMaintenance" : "TERMINATE" if preemptible else "MIGRATE"
+            },
+            "serviceAccounts" : [{ "email" : "default", "scopes" : GCE_DEFAULT_SCOPES }],
+            "tags" : { "items" : ["caninetransientimage"] },
+            "metadata" : { "items" : [{ "key" : k, "value" : v } for k, v in items.items()] }
+        }
+        if gpus and self.config.get("gpu_type") is not None and self.config.get("gpu_count", 0) > 0:
+            body["guestAccelerators"] = [{
+                "acceleratorType" : "zones/{}/acceleratorTypes/{}".format(zone, self.config["gpu_type"]),
+                "acceleratorCount" : self.config["gpu_count"]
+            }]
+            body["scheduling"]["onHostMaintenance"] = "TERMINATE"
+        return body
+
+    def instance_operations(self, action: str, nodes: typing.Iterable[str], body: typing.Optional[typing.Callable[[str], typing.Dict[str, typing.Any]]] = None, zone: typing.Optional[str] = None, ignore_missing: bool = False, wait: bool = True, timeout: float = 600) -> typing.Dict[str, str]:
+        """
+        Runs a compute API instance action ("insert", "start", "stop", or "delete")
+        on all of the given nodes in parallel. For "insert", body is called with each
+        node name to build its request body.
+        Nodes are looked up in their own zones (see node_zone), unless zone is given.
+        If wait is True, the resulting zone operations are then polled together
+        until all are done (or timeout seconds have passed).
+        Returns {node: error message} for every node which failed.
+        Missing instances are not considered failures if ignore_missing is True
+        """
+        nodes = list(nodes)
+        if not len(nodes):
+            return {}
+        self.invalidate_instance_list()
+        project = self.config["project"]
+        zones = { node : zone if zone is not None else self.node_zone(node) for node in nodes }
+        errors = {}
+
+        def submit(node):
+            try:
+                if action == "insert":
+                    request = gce.instances().insert(project = project, zone = zones[node], body = body(node))
                 else:
-                    # default behavior is to shut down
-                    self._pzw(gce.instances().stop)(instance = node).execute()
+                    request = getattr(gce.instances(), action)(project = project, zone = zones[node], instance = node)
+                return node, request.execute(http = gce_http(), num_retries = 3), None
             except googleapiclient.errors.HttpError as e:
-                if "status" in e.resp and e.resp["status"] != "404":
-                    canine_logging.error("Couldn't shutdown instance {}".format(node))
-                    canine_logging.error(e)
-                elif "status" not in e.resp:
-                    canine_logging.error("Unknown error shutting down instance {}".format(node))
-                    canine_logging.error(e)
+                if ignore_missing and e.resp.status == 404:
+                    return node, None, None
+                return node, None, _http_error_message(e)
             except Exception as e:
-                canine_logging.error("Couldn't shutdown instance {}".format(node))
-                canine_logging.error(e)
+                return node, None, "{}: {}".format(type(e).__name__, e)
 
-    def list_instances_all_zones(self):
+        def poll(item):
+            node, operation = item
+            try:
+                return node, gce.zoneOperations().get(project = project, zone = zones[node], operation = operation).execute(http = gce_http(), num_retries = 3), None
+            except Exception as e:
+                return node, None, _http_error_message(e) if isinstance(e, googleapiclient.errors.HttpError) else "{}: {}".format(type(e).__name__, e)
+
+        def check(node, operation, err):
+            # returns True if the operation is still pending
+            if err is not None:
+                errors[node] = err
+            elif operation is not None and operation.get("status") == "DONE":
+                if "error" in operation:
+                    errors[node] = "; ".join(
+                        "{}: {}".format(x.get("code"), x.get("message"))
+                        for x in operation["error"].get("errors", [])
+                    )
+            elif operation is not None:
+                return True
+            return False
+
+        with ThreadPoolExecutor(min(GCE_MAX_WORKERS, len(nodes))) as executor:
+            pending = {
+                node: operation["name"]
+                for node, operation, err in executor.map(submit, nodes)
+                if check(node, operation, err)
+            }
+            deadline = time.monotonic() + timeout
+            while wait and len(pending):
+                if time.monotonic() > deadline:
+                    for node in pending:
+                        errors[node] = "Timed out waiting for {} operation".format(action)
+                    break
+                time.sleep(self.operation_poll_interval)
+                pending = {
+                    node: pending[node]
+                    for node, operation, err in executor.map(poll, pending.items())
+                    if check(node, operation, err)
+                }
+        self.invalidate_instance_list()
+        return errors
+
+    def zone_ranking(self) -> typing.List[str]:
         """
-        List all instances across all zones in `self.config["project"]`
+        Returns the zones in which to create instances, in order of preference:
+        compute_zone, then fallback_zones, with zones in which nodes were
+        preempted during this run moved towards the end
+        """
+        counts = getattr(self, "zone_preemption_counts", {})
+        return [self.config["compute_zone"], *sorted(
+          self.config.get("fallback_zones", []),
+          key = lambda zone : counts.get(zone, 0)
+        )]
+
+    def node_zone(self, node: str) -> str:
+        """
+        Returns the zone of the named instance
+        """
+        return (self._node_zones or {}).get(node, self.config["compute_zone"])
+
+    def record_zones(self, zones: typing.Dict[str, str]):
+        """
+        Records the zones of the given instances (see node_zone)
+        """
+        if self._node_zones is None:
+            self._node_zones = {}
+        for node, zone in zones.items():
+            if zone == self.config["compute_zone"]:
+                self._node_zones.pop(node, None)
+            elif isinstance(zone, str):
+                self._node_zones[node] = zone
+
+    def create_instances(self, nodes: typing.Iterable[str], body: typing.Optional[typing.Callable[[str, str], typing.Dict[str, typing.Any]]] = None) -> typing.Dict[str, str]:
+        """
+        Creates the given instances in the first zone of zone_ranking. Instances
+        which could not be created because a zone is out of capacity are retried
+        in the next zone. body is called with each node name and zone to build
+        its request body (default: instance_body).
+        Returns {node: error message} for nodes which could not be created in any zone
+        """
+        body = body if body is not None else lambda name, zone: self.instance_body(name, zone = zone)
+        remaining = list(nodes)
+        errors = {}
+        for zone in self.zone_ranking():
+            if not len(remaining):
+                break
+            attempt = self.instance_operations("insert", remaining, body = lambda name: body(name, zone), zone = zone)
+            self.record_zones({ node : zone for node in remaining if node not in attempt })
+            for node in remaining:
+                errors.pop(node, None)
+            errors.update(attempt)
+            remaining = [node for node, err in attempt.items() if is_capacity_error(err)]
+            if len(remaining):
+                canine_logging.warning("Zone {} is out of capacity for {} instances".format(zone, len(remaining)))
+        return errors
+
+    def start_instances(self, nodes: typing.Iterable[str]) -> typing.Dict[str, str]:
+        """
+        Starts the given stopped instances. Instances which cannot start because
+        their zone is out of capacity are deleted, and recreated in another zone
+        (see create_instances).
+        Returns {node: error message} for nodes which could not be started
+        """
+        errors = self.instance_operations("start", nodes)
+        exhausted = [node for node, err in errors.items() if is_capacity_error(err)]
+        if len(exhausted):
+            canine_logging.warning("Recreating {} instances which could not start for lack of capacity".format(len(exhausted)))
+            deleted = self.instance_operations("delete", exhausted, ignore_missing = True)
+            retry = [node for node in exhausted if node not in deleted]
+            for node in retry:
+                del errors[node]
+            errors.update(self.create_instances(retry))
+        return errors
+
+    def update_node_addresses(self, nodes: typing.Iterable[str]):
         """
-        zone_dict = gce.zones().list(project = self.config["project"]).execute()
+        Points Slurm at the zonal DNS names of the given nodes which are outside
+        compute_zone, since their short hostnames do not resolve across zones
+        """
+        nodes = [node for node in nodes if self.node_zone(node) != self.config["compute_zone"]]
+        for node in self._slurm_nodes(nodes):
+            self.invoke("sudo -E scontrol update nodename={node} nodeaddr={node}.{zone}.c.{project}.internal".format(
+              node = node, zone = self.node_zone(node), project = self.config["project"]
+            ))
 
-        return pd.concat([
-          list_instances(zone = x["name"], project = self.config["project"])
-          for x in zone_dict["items"]
-        ], axis = 0).reset_index(drop = True)
+    def list_instances_all_zones(self, fresh: bool = False) -> pd.DataFrame:
+        """
+        List all instances across all zones in `self.config["project"]`
+        The listing is cached for instance_list_ttl seconds, unless fresh is True.
+        Instance operations invalidate the cache. Listed zones are recorded
+        (see node_zone)
+        """
+        cached = self._instance_list
+        if not fresh and cached is not None and time.monotonic() - cached[0] < self.instance_list_ttl:
+            return cached[1].copy()
+        instances = list_instances_aggregated(self.config["project"])
+        self.record_zones(dict(zip(instances["name"], instances["zone"])))
+        self._instance_list = (time.monotonic(), instances)
+        return instances.copy()
+
+    def invalidate_instance_list(self):
+        """
+        Discards the cached instance listing
+        """
+        self._instance_list = None
 
     def wait_for_cluster_ready(self, elastic = False, timeout = 0):
         """
@@ -355,48 +1154,67 @@ class TransientImageSlurmBackend(LocalSlurmBackend): # {{{
     # GCP API calls
     # TODO: for bonus points, can we automatically apply this to all relevant
     #       methods in a GCE class instance?
-    def _pzw(self, f):
+    def _pzw(self, f, zone = None):
         def x(*args, **kwargs):
-            return f(project = self.config["project"], zone = self.config["compute_zone"], *args, **kwargs)
+            return f(project = self.config["project"], zone = zone if zone is not None else self.config["compute_zone"], *args, **kwargs)
 
         return x
 
-    def estimate_cost(self, clock_uptime: typing.Optional[float] = None, node_uptime: typing.Optional[float] = None, job_cpu_time: typing.Optional[typing.Dict[str, float]] = None) -> typing.Tuple[float, typing.Optional[typing.Dict[str, float]]]:
+    def node_machine_type(self, node: typing.Optional[str] = None) -> str:
+        """
+        Returns the machine type of the named worker node (default: worker_type)
+        """
+        return self.config["worker_type"]
+
+    def node_hourly_cost(self, node: typing.Optional[str] = None) -> typing.Tuple[float, int]:
+        """
+        Returns the hourly cost and the number of CPUs of the named worker node
+        (default: a typical worker node)
+        """
+        mtype = self.node_machine_type(node)
+        worker_info = {
+            'mtype': mtype,
+            'preemptible': bool(self.config['preemptible']) and node not in self._on_demand_nodes
+        }
+        if mtype == self.config['worker_type'] and self.config.get('gpu_type') is not None and self.config.get('gpu_count', 0) > 0:
+            worker_info['gpu_type'] = self.config['gpu_type']
+            worker_info['gpu_count'] = self.config['gpu_count']
+        return gcp_hourly_cost(**worker_info), gcp_mtype_cpus(mtype)
+
+    def estimate_cost(self, clock_uptime: typing.Optional[float] = None, node_uptime: typing.Optional[typing.Union[float, typing.Dict[str, float]]] = None, job_cpu_time: typing.Optional[typing.Dict[str, typing.Union[float, typing.Dict[str, float]]]] = None) -> typing.Tuple[float, typing.Optional[typing.Dict[str, float]]]:
         """
         Returns a cost estimate for the cluster, based on any cost information available
         to the backend. May provide total node uptime (for cluster cost estimate)
         and/or cpu_time for each job to get job specific cost estimates.
+        Node uptime and each job's cpu_time may also be broken down by node
+        ({node: hours}), in which case each node is priced by its machine type.
         Clock uptime may be provided and is useful if the cluster has an inherrant
         overhead for uptime (ie: controller nodes).
         Note: Job cost estimates may not sum up to the total cluster cost if the
         cluster was not at full utilization.
         All units are in hours
         """
+        costs = {}
+        def cost(node = None):
+            if node not in costs:
+                costs[node] = self.node_hourly_cost(node)
+            return costs[node]
+
+        def cpu_cost(node = None):
+            # Approximates the cost burden / CPU hour of the VM
+            hourly, ncpus = cost(node)
+            return hourly / ncpus
+
         cluster_cost = 0
-        worker_cpu_cost = 0
         job_cost = None
-        if node_uptime is not None:
-            worker_info = {
-                'mtype': self.config['worker_type'],
-                'preemptible': bool(self.config['preemptible'])
-            }
-            if 'gpu_type' in self.config and 'gpu_count' in self.config and self.config['gpu_count'] > 0:
-                worker_info['gpu_type'] = self.config['gpu_type']
-                worker_info['gpu_count'] = self.config['gpu_count']
-            worker_hourly_cost = gcp_hourly_cost(**worker_info)
-            cluster_cost = node_uptime * worker_hourly_cost
-            mtype_prefix = self.config['worker_type'][:3]
-            if mtype_prefix in {'f1-', 'g1-'}:
-                ncpus = 1
-            elif mtype_prefix == 'cus': # n1-custom-X
-                ncpus = int(self.config['worker_type'].split('-')[1])
-            else:
-                ncpus = int(self.config['worker_type'].split('-')[2])
-            # Approximates the cost burden / CPU hour of the VM
-            worker_cpu_cost = worker_hourly_cost / ncpus
+        if isinstance(node_uptime, dict):
+            cluster_cost = sum(hours * cost(node)[0] for node, hours in node_uptime.items())
+        elif node_uptime is not None:
+            cluster_cost = node_uptime * cost()[0]
         if job_cpu_time is not None:
             job_cost = {
-                job_id: worker_cpu_cost * cpu_time
+                job_id: sum(hours * cpu_cost(node) for node, hours in cpu_time.items())
+                  if isinstance(cpu_time, dict) else cpu_time * cpu_cost()
                 for job_id, cpu_time in job_cpu_time.items()
             }
         return cluster_cost, job_cost
@@ -0,0 +1,218 @@
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+import psutil
+from ..utils import canine_logging
+
+class Lease(object):
+    """
+    Keep-alive lease on a cluster which is shared by consecutive pipelines.
+    The lease is a JSON file (guarded by an flock) recording the idle TTL,
+    the pipelines currently holding the lease, and when it was last released.
+    Once the last holder releases the lease, a watchdog process shuts the
+    cluster down if no pipeline acquires it again within the TTL
+    """
+
+    def __init__(self, path: str):
+        """
+        path is the lease file. It should be on storage shared with the cluster
+        """
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.holder = '{}:{}'.format(socket.gethostname(), os.getpid())
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """
+        (Internal)
+        Holds an exclusive lock on the lease
+        """
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """
+        (Internal)
+        Returns the lease state, or None if there is no lease.
+        Must be called with the lock held
+        """
+        try:
+            with open(self.path) as r:
+                return json.load(r)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, state: typing.Dict[str, typing.Any]):
+        """
+        (Internal)
+        Atomically replaces the lease state.
+        Must be called with the lock held
+        """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as w:
+            json.dump(state, w)
+        os.rename(tmp, self.path)
+
+    @staticmethod
+    def _alive(holder: str) -> bool:
+        """
+        (Internal)
+        Returns False if the holder was a process on this host which has exited.
+        Holders on other hosts are assumed to be alive
+        """
+        host, pid = holder.rsplit(':', 1)
+        return host != socket.gethostname() or psutil.pid_exists(int(pid))
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def acquire(self, ttl: typing.Optional[float] = None, create: bool = True) -> bool:
+        """
+        Adds this process as a holder of the lease.
+        ttl (in minutes) replaces the lease's TTL, if given.
+        A new lease is created only if create is True.
+        If the watchdog is already shutting the cluster down, waits for it to
+        finish and returns False without acquiring the lease
+        """
+        with self._locked():
+            state = self._read()
+            stopping = state.get('stopping') if state is not None else None
+            if stopping is None or not self._alive(stopping):
+                if state is None or stopping is not None:
+                    if not create:
+                        return False
+                    state = {'ttl': ttl, 'holders': [], 'released': time.time(), 'watchdog': None}
+                if ttl is not None:
+                    state['ttl'] = ttl
+                if state['ttl'] is None:
+                    raise ValueError("A TTL is required to create a lease")
+                if self.holder not in state['holders']:
+                    state['holders'].append(self.holder)
+                self._write(state)
+                return True
+        self._wait_stopping(stopping)
+        return False
+
+    def _wait_stopping(self, stopping: str):
+        """
+        (Internal)
+        Waits for the given watchdog to finish shutting the cluster down
+        """
+        canine_logging.info("Waiting for the previous cluster to shut down ...")
+        while self._alive(stopping):
+            time.sleep(5)
+
+    def wait_stopped(self) -> bool:
+        """
+        If the watchdog is shutting the cluster down, waits for it to finish.
+        Returns True if it had to wait
+        """
+        if not self.exists():
+            return False
+        with self._locked():
+            state = self._read()
+            stopping = state.get('stopping') if state is not None else None
+        if stopping is None or not self._alive(stopping):
+            return False
+        self._wait_stopping(stopping)
+        return True
+
+    def release(self):
+        """
+        Removes this process as a holder of the lease, and makes sure that a
+        watchdog is running to shut the cluster down once the lease expires
+        """
+        with self._locked():
+            state = self._read()
+            if state is None:
+                return
+            state['holders'] = [holder for holder in state['holders'] if holder != self.holder]
+            state['released'] = time.time()
+            if state['watchdog'] is None or not self._alive(state['watchdog']):
+                state['watchdog'] = '{}:{}'.format(socket.gethostname(), self.spawn_watchdog())
+            self._write(state)
+
+    def remove(self):
+        """
+        Deletes the lease
+        """
+        with self._locked():
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def spawn_watchdog(self) -> int:
+        """
+        Starts a detached watchdog process for this lease. Returns its pid
+        """
+        with open(os.path.join(tempfile.gettempdir(), 'canine_lease_watchdog.log'), 'a') as log:
+            return subprocess.Popen(
+                [sys.executable, '-m', 'canine.backends.lease', self.path],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True
+            ).pid
+
+    def watch(self, teardown: typing.Callable[[], typing.Any], interval: float = 60) -> bool:
+        """
+        Checks the lease every interval seconds. Once no live process has held
+        the lease for its TTL, marks it as stopping and calls teardown.
+        Returns False without calling teardown if the lease is removed or
+        another watchdog takes over
+        """
+        watchdog = '{}:{}'.format(socket.gethostname(), os.getpid())
+        while True:
+            time.sleep(interval)
+            with self._locked():
+                state = self._read()
+                if state is None or state.get('stopping') is not None:
+                    return False
+                if state['watchdog'] is not None and state['watchdog'] != watchdog and self._alive(state['watchdog']):
+                    return False
+                state['watchdog'] = watchdog
+                holders = [holder for holder in state['holders'] if self._alive(holder)]
+                if len(holders) < len(state['holders']):
+                    # holders which exited without releasing the lease
+                    state['holders'] = holders
+                    if not len(holders):
+                        state['released'] = time.time()
+                expired = not len(holders) and time.time() - state['released'] >= state['ttl'] * 60
+                if expired:
+                    state['stopping'] = watchdog
+                self._write(state)
+            if expired:
+                canine_logging.info("Lease {} expired; shutting down cluster".format(self.path))
+                teardown()
+                # teardown may already have removed the lease
+                if self.exists():
+                    self.remove()
+                return True
+
+def watchdog(path: str):
+    """
+    Watchdog process for a DockerTransientImage cluster lease.
+    The cluster's saved configuration is next to the lease file
+    """
+    import pickle
+    from .dockerTransient import DockerTransientImageSlurmBackend
+
+    def teardown():
+        with open(os.path.join(os.path.dirname(path), 'backend_conf.pickle'), 'rb') as r:
+            config = pickle.load(r)
+        DockerTransientImageSlurmBackend.from_config(config).teardown()
+
+    Lease(path).watch(teardown)
+
+if __name__ == '__main__':
+    watchdog(sys.argv[1])
@@ -4,7 +4,9 @@ import os
 import io
 import sys
 import subprocess
+import signal
 import shutil
+from contextlib import contextmanager
 from .base import AbstractSlurmBackend, AbstractTransport
 from ..utils import ArgumentHelper, check_call, isatty
 from agutil import StdOutAdapter
@@ -32,6 +34,8 @@ class LocalTransport(AbstractTransport):
         """
         Returns a File-Like object open on the slurm cluster
         """
+        if 'r' not in mode or '+' in mode:
+            self._invalidate(filename)
         return open(filename, mode, buffering=bufsize)
 
     def listdir(self, path: str) -> typing.List[str]:
@@ -40,10 +44,20 @@ class LocalTransport(AbstractTransport):
         """
         return os.listdir(path)
 
+    def listdir_attr(self, path: str) -> typing.List[typing.Tuple[str, typing.Any]]:
+        """
+        Lists the contents of the requested path, alongside the stat information
+        of each entry (symlinks are not followed)
+        Returns a list of (name, stat) tuples
+        """
+        with os.scandir(path) as entries:
+            return [(entry.name, entry.stat(follow_symlinks=False)) for entry in entries]
+
     def mkdir(self, path: str):
         """
         Creates the requested directory
         """
+        self._invalidate(path)
         return os.mkdir(path)
 
     def stat(self, path: str, follow_symlinks: bool = True) -> typing.Any:
@@ -59,6 +73,7 @@ class LocalTransport(AbstractTransport):
         """
         Change file permissions
         """
+        self._invalidate(path)
         os.chmod(path, mode)
 
     def normpath(self, path: str) -> str:
@@ -71,18 +86,21 @@ class LocalTransport(AbstractTransport):
         """
         Removes the file at the given path
         """
+        self._invalidate(path)
         os.remove(path)
 
     def rmdir(self, path: str):
         """
         Removes the directory at the given path
         """
+        self._invalidate(path)
         os.rmdir(path)
 
     def mklink(self, src: str, dest: str):
         """
         Creates a symlink from dest->src
         """
+        self._invalidate(dest)
         os.symlink(src, dest)
 
     def rename(self, src: str, dest: str):
@@ -90,8 +108,16 @@ class LocalTransport(AbstractTransport):
         Move the file or folder 'src' to 'dest'
         Will overwrite dest if it exists
         """
+        self._invalidate(src, dest)
         os.rename(src, dest)
 
+    def utime(self, path: str, times: typing.Tuple[float, float]):
+        """
+        Sets the access and modified times (atime, mtime) of the given path
+        """
+        self._invalidate(path)
+        os.utime(path, times)
+
     def walk(self, path: str) -> typing.Generator[typing.Tuple[str, typing.List[str], typing.List[str]], None, None]:
         """
         Walk through a directory tree
@@ -103,30 +129,40 @@ class LocalTransport(AbstractTransport):
         """
         yield from os.walk(path)
 
-    def _rmtree(self, path: str, pathstat: os.stat_result):
+    def _rmtree(self, path: str, pathstat: os.stat_result) -> int:
         """
         (Internal)
         Recursively remove the directory tree rooted at the given path.
         Automatically retries failures after a brief timeout
+        Returns the number of entries removed
         """
+        self._invalidate(path)
+        n_removed = 1 + sum(
+            len(dirnames) + len(filenames)
+            for dirpath, dirnames, filenames in os.walk(path)
+        )
         shutil.rmtree(path)
+        return n_removed
 
 class LocalSlurmBackend(AbstractSlurmBackend):
     """
     SLURM backend for interacting with a local slurm node
     """
 
-    def invoke(self, command: str, interactive: bool = False, **kwargs) -> typing.Tuple[int, typing.BinaryIO, typing.BinaryIO]:
+    def invoke(self, command: str, interactive: bool = False, timeout: typing.Optional[float] = None, **kwargs) -> typing.Tuple[int, typing.BinaryIO, typing.BinaryIO]:
         """
         Invoke an arbitrary command on the Slurm controller node
         Returns a tuple containing (exit status, byte stream of standard out from the command, byte stream of stderr from the command).
         If interactive is True, stdin, stdout, and stderr should all be connected live to the user's terminal.
+        Non-interactive commands are run without helper threads, and may be invoked
+        concurrently. If timeout is given, non-interactive commands still running after
+        that many seconds are killed and subprocess.TimeoutExpired is raised
         """
-        stdinFD = None
         if not isatty(sys.stdout, sys.stdin):
             interactive = False
-        if interactive:
-            stdinFD = os.dup(sys.stdin.fileno())
+        if not interactive:
+            return self._invoke_captured(command, timeout)
+        stdinFD = os.dup(sys.stdin.fileno())
         stdout = StdOutAdapter(interactive)
         stderr = StdOutAdapter(interactive)
         proc = subprocess.Popen(
@@ -141,14 +177,71 @@ class LocalSlurmBackend(AbstractSlurmBackend):
         proc.wait()
         stdout.kill()
         stderr.kill()
-        if stdinFD is not None:
-            os.close(stdinFD)
+        os.close(stdinFD)
         return (
             proc.returncode,
             io.BytesIO(stdout.buffer),
             io.BytesIO(stderr.buffer)
         )
 
+    @staticmethod
+    def _invoke_captured(command: str, timeout: typing.Optional[float] = None) -> typing.Tuple[int, typing.BinaryIO, typing.BinaryIO]:
+        """
+        (Internal)
+        Runs a non-interactive command, capturing its output through pipes.
+        The command runs in its own process group, so that a timeout also kills
+        any children started by the shell
+        """
+        proc = subprocess.Popen(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=False,
+            executable='/bin/bash',
+            start_new_session=timeout is not None
+        )
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            stdout, stderr = proc.communicate()
+            raise subprocess.TimeoutExpired(command, timeout, stdout, stderr)
+        return (
+            proc.returncode,
+            io.BytesIO(stdout),
+            io.BytesIO(stderr)
+        )
+
+    @contextmanager
+    def open_channel(self, command: str) -> typing.ContextManager[typing.Tuple[typing.BinaryIO, typing.BinaryIO]]:
+        """
+        Starts a long-running command on the Slurm controller node
+        Yields a tuple of (stdin, stdout) byte streams connected to the command.
+        The command's stdin is closed on exit, and its stderr is discarded
+        """
+        proc = subprocess.Popen(
+            command,
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            executable='/bin/bash'
+        )
+        try:
+            yield proc.stdin, proc.stdout
+        finally:
+            proc.stdin.close()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+
     def __enter__(self):
         """
         Allows the Local backend to serve as a context manager
@@ -8,8 +8,11 @@ import warnings
 import binascii
 import traceback
 import shlex
+import stat
+import time
 import atexit
-from .base import AbstractSlurmBackend, AbstractTransport
+from contextlib import contextmanager
+from .base import AbstractSlurmBackend, AbstractTransport, RmtreeResult
 from ..utils import ArgumentHelper, make_interactive, check_call, isatty, canine_logging
 from agutil import StdOutAdapter
 import pandas as pd
@@ -20,6 +23,11 @@ logging.getLogger('paramiko').setLevel(logging.WARNING)
 
 SSH_AGENT_PATTERN = re.compile(r'SSH_AUTH_SOCK=(.+); export SSH_AUTH_SOCK')
 SSH_AGENT_PID = re.compile(r'SSH_AGENT_PID=(\d+); export SSH_AGENT_PID')
+COMMAND_BATCH_LENGTH = 65536 # Max characters of arguments in batched remote commands
+FIND_TYPE_MODES = {
+    b'f': stat.S_IFREG,
+    b'd': stat.S_IFDIR,
+}
 
 class IgnoreKeyPolicy(paramiko.client.AutoAddPolicy):
     """
@@ -30,6 +38,22 @@ class IgnoreKeyPolicy(paramiko.client.AutoAddPolicy):
     def missing_host_key(self, client, hostname, key):
         client._host_keys.add(hostname, key.get_name(), key)
 
+def _command_batches(paths: typing.Iterable[str], max_length: int = COMMAND_BATCH_LENGTH) -> typing.Generator[typing.List[str], None, None]:
+    """
+    Splits the given paths into batches which fit within a single remote command line
+    """
+    batch = []
+    length = 0
+    for path in paths:
+        if len(batch) and length + len(path) + 3 > max_length:
+            yield batch
+            batch = []
+            length = 0
+        batch.append(path)
+        length += len(path) + 3
+    if len(batch):
+        yield batch
+
 class RemoteTransport(AbstractTransport):
     """
     Transport for working with remote files over ssh
@@ -63,6 +87,8 @@ class RemoteTransport(AbstractTransport):
         """
         if self.session is None:
             raise paramiko.SSHException("Transport is not connected")
+        if 'r' not in mode or '+' in mode:
+            self._invalidate(filename)
         handle = self.session.open(filename, mode, bufsize)
         handle.mode = mode
         handle.name = filename
@@ -83,12 +109,23 @@ class RemoteTransport(AbstractTransport):
             raise paramiko.SSHException("Transport is not connected")
         return self.session.listdir(path)
 
+    def listdir_attr(self, path: str) -> typing.List[typing.Tuple[str, typing.Any]]:
+        """
+        Lists the contents of the requested path, alongside the stat information
+        of each entry (symlinks are not followed)
+        Returns a list of (name, stat) tuples
+        """
+        if self.session is None:
+            raise paramiko.SSHException("Transport is not connected")
+        return [(attr.filename, attr) for attr in self.session.listdir_attr(path)]
+
     def mkdir(self, path: str):
         """
         Creates the requested directory
         """
         if self.session is None:
             raise paramiko.SSHException("Transport is not connected")
+        self._invalidate(path)
         return self.session.mkdir(path)
 
     def stat(self, path: str, follow_symlinks: bool = True) -> typing.Any:
@@ -99,20 +136,70 @@ class RemoteTransport(AbstractTransport):
             raise paramiko.SSHException("Transport is not connected")
         if follow_symlinks:
             return self.session.stat(path)
-        else:
-            try:
-                dirname = os.path.dirname(path)
-                if dirname == '':
-                    dirname = '.'
-                return {
-                    attr.filename: attr
-                    for attr in self.session.listdir_attr(dirname)
-                }[os.path.basename(path)]
-            except KeyError as e:
-                raise FileNotFoundError(path) from e
+        return self.session.lstat(path)
+
+    def stat_many(self, paths: typing.Iterable[str], follow_symlinks: bool = True) -> typing.Dict[str, typing.Any]:
+        """
+        Returns stat information for each of the requested paths
+        Paths which do not exist map to None
+        Paths are checked in batches using a single remote stat command per batch
+        """
+        if self.session is None:
+            raise paramiko.SSHException("Transport is not connected")
+        results = {}
+        for batch in _command_batches(paths):
+            results.update({path: None for path in batch})
+            rc, stdout, stderr = self._exec(
+                'stat {} --printf "%n\\0%f\\0%s\\0%X\\0%Y\\0" -- {}'.format(
+                    '-L' if follow_symlinks else '',
+                    ' '.join(shlex.quote(path) for path in batch)
+                )
+            )
+            if rc not in {0, 1}:
+                # stat unavailable. Fall back to sftp
+                results.update(super().stat_many(batch, follow_symlinks=follow_symlinks))
+                continue
+            fields = stdout.split(b'\0')
+            for i in range(0, len(fields) - 4, 5):
+                name, mode, size, atime, mtime = fields[i:i+5]
+                attr = paramiko.SFTPAttributes()
+                attr.st_mode = int(mode, 16)
+                attr.st_size = int(size)
+                attr.st_atime = int(atime)
+                attr.st_mtime = int(mtime)
+                attr.filename = os.path.basename(name.decode())
+                results[name.decode()] = attr
+        return results
+
+    def makedirs_many(self, paths: typing.Iterable[str]):
+        """
+        Recursively build each of the requested directory structures
+        Directories which already exist are ignored
+        Directories are created in batches using a single remote mkdir command per batch
+        """
+        if self.session is None:
+            raise paramiko.SSHException("Transport is not connected")
+        for batch in _command_batches(paths):
+            self._invalidate(*batch)
+            command = 'mkdir -p -- {}'.format(' '.join(shlex.quote(path) for path in batch))
+            rc, stdout, stderr = self._exec(command)
+            check_call(command, rc, io.BytesIO(stdout), io.BytesIO(stderr))
 
     def glob(self, path: str) -> typing.List[str]:
-        raise NotImplementedError("globbing not yet implemented for remote transport!")
+        """
+        Returns an array matching the glob pattern, or an empty list if no match.
+        The pattern is expanded by a single remote shell command. As with
+        glob.glob, a pattern without wildcards only matches an existing path
+        """
+        if self.session is None:
+            raise paramiko.SSHException("Transport is not connected")
+        command = "bash -c {} _ {}".format(
+            shlex.quote('shopt -s nullglob; IFS=; for f in $1; do [[ -e $f || -L $f ]] && printf "%s\\0" "$f"; done; true'),
+            shlex.quote(path)
+        )
+        rc, stdout, stderr = self._exec(command)
+        check_call(command, rc, io.BytesIO(stdout), io.BytesIO(stderr))
+        return [match.decode() for match in stdout.split(b'\0') if len(match)]
 
     def chmod(self, path: str, mode: int):
         """
@@ -120,6 +207,7 @@ class RemoteTransport(AbstractTransport):
         """
         if self.session is None:
             raise paramiko.SSHException("Transport is not connected")
+        self._invalidate(path)
         self.session.chmod(path, mode)
 
     def normpath(self, path: str) -> str:
@@ -145,6 +233,7 @@ class RemoteTransport(AbstractTransport):
         """
         if self.session is None:
             raise paramiko.SSHException("Transport is not connected")
+        self._invalidate(path)
         self.session.remove(path)
 
     def rmdir(self, path: str):
@@ -153,6 +242,7 @@ class RemoteTransport(AbstractTransport):
         """
         if self.session is None:
             raise paramiko.SSHException("Transport is not connected")
+        self._invalidate(path)
         self.session.rmdir(path)
 
     def mklink(self, src: str, dest: str):
@@ -161,6 +251,7 @@ class RemoteTransport(AbstractTransport):
         """
         if self.session is None:
             raise paramiko.SSHException("Transport is not connected")
+        self._invalidate(dest)
         self.session.symlink(src, dest)
 
     def rename(self, src: str, dest: str):
@@ -170,11 +261,145 @@ class RemoteTransport(AbstractTransport):
         """
         if self.session is None:
             raise paramiko.SSHException("Transport is not connected")
+        self._invalidate(src, dest)
         try:
             self.session.posix_rename(src, dest)
         except IOError:
             self.session.rename(src, dest)
 
+    def _rmtree(self, path: str, pathstat: typing.Any) -> int:
+        """
+        (Internal)
+        Recursively remove the directory tree rooted at the given path.
+        The tree is removed by a single remote command
+        Returns the number of entries removed
+        """
+        return self._rmtree_remote([path])[path]
+
+    def rmtree_many(self, paths: typing.Iterable[str], max_retries: int = 5, timeout: int = 5, root: typing.Optional[str] = None) -> typing.List[RmtreeResult]:
+        """
+        Recursively remove each of the given directory trees.
+        Same safety checks as rmtree. Paths which do not exist are skipped and
+        reported as having 0 entries removed
+        All trees are removed by a single remote command per batch
+        Returns a list of RmtreeResults
+        """
+        if self.session is None:
+            raise paramiko.SSHException("Transport is not connected")
+        paths = [self._check_rmtree_path(path, root) for path in paths]
+        stats = self.stat_many(paths)
+        for path, pathstat in stats.items():
+            if pathstat is not None and not stat.S_ISDIR(pathstat.st_mode):
+                raise NotADirectoryError(path)
+        targets = [path for path in paths if stats[path] is not None]
+        counts = {}
+        for batch in _command_batches(targets):
+            for attempt in range(max_retries):
+                try:
+                    counts.update(self._rmtree_remote(batch))
+                    break
+                except OSError:
+                    if attempt >= (max_retries - 1):
+                        raise
+                time.sleep(timeout)
+        return [RmtreeResult(path, counts.get(path, 0)) for path in paths]
+
+    def _rmtree_remote(self, paths: typing.List[str]) -> typing.Dict[str, int]:
+        """
+        (Internal)
+        Removes the given directory trees using one remote find command
+        Returns a dictionary of {path: number of entries removed}
+        """
+        self._invalidate(*paths)
+        command = 'find {} -depth -delete -printf "%H\\0"'.format(
+            ' '.join(shlex.quote(path) for path in paths)
+        )
+        rc, stdout, stderr = self._exec(command)
+        counts = {path: 0 for path in paths}
+        for start in stdout.split(b'\0'):
+            if len(start):
+                counts[start.decode()] += 1
+        if rc != 0:
+            raise OSError(rc, "Failed to remove directory tree: {}".format(stderr.decode().strip()))
+        return counts
+
+    def utime(self, path: str, times: typing.Tuple[float, float]):
+        """
+        Sets the access and modified times (atime, mtime) of the given path
+        """
+        if self.session is None:
+            raise paramiko.SSHException("Transport is not connected")
+        self._invalidate(path)
+        self.session.utime(path, times)
+
+    def _exec(self, command: str) -> typing.Tuple[int, bytes, bytes]:
+        """
+        (Internal)
+        Runs a command over the transport's ssh client
+        Returns (exit status, stdout bytes, stderr bytes)
+        """
+        stdin, stdout, stderr = self.client.exec_command(command)
+        stdin.close()
+        out = stdout.read()
+        err = stderr.read()
+        return stdout.channel.recv_exit_status(), out, err
+
+    def listtree(self, path: str) -> typing.Dict[str, typing.Any]:
+        """
+        Returns stat information for every entry beneath the given directory,
+        keyed by path relative to the starting directory.
+        Symlinks are followed. Returns an empty dictionary if the directory does not exist
+        Uses a single remote find command rather than one sftp request per entry
+        """
+        if self.session is None:
+            raise paramiko.SSHException("Transport is not connected")
+        rc, stdout, stderr = self._exec(
+            'test -d {0} && find -L {0} -mindepth 1 -printf "%Y\\0%s\\0%T@\\0%m\\0%P\\0"'.format(
+                shlex.quote(path)
+            )
+        )
+        if rc != 0 and not len(stdout):
+            # Directory missing, or find unavailable
+            if self.isdir(path):
+                return super().listtree(path)
+            return {}
+        fields = stdout.split(b'\0')
+        tree = {}
+        for i in range(0, len(fields) - 4, 5):
+            ftype, size, mtime, mode, relpath = fields[i:i+5]
+            if ftype not in FIND_TYPE_MODES:
+                # Broken symlink or loop
+                continue
+            attr = paramiko.SFTPAttributes()
+            attr.st_size = int(size)
+            attr.st_mtime = int(float(mtime))
+            attr.st_atime = attr.st_mtime
+            attr.st_mode = FIND_TYPE_MODES[ftype] | int(mode, 8)
+            attr.filename = os.path.basename(relpath.decode())
+            tree[relpath.decode()] = attr
+        return tree
+
+    def checksum_many(self, paths: typing.Iterable[str]) -> typing.Dict[str, str]:
+        """
+        Returns the md5 hex digest of each of the requested files
+        Files are checksummed in batches using a single remote md5sum command per batch
+        """
+        if self.session is None:
+            raise paramiko.SSHException("Transport is not connected")
+        checksums = {}
+        for batch in _command_batches(paths):
+            rc, stdout, stderr = self._exec(
+                'md5sum -z -- {}'.format(' '.join(shlex.quote(path) for path in batch))
+            )
+            if rc != 0:
+                checksums.update(super().checksum_many(batch))
+                continue
+            for line in stdout.split(b'\0'):
+                if len(line):
+                    digest, path = line.decode().split(' ', 1)
+                    checksums[path[1:]] = digest
+        return checksums
+
 class RemoteSlurmBackend(AbstractSlurmBackend):
     """
     SLURM backend for interacting with a remote slurm node
@@ -217,13 +442,13 @@ class RemoteSlurmBackend(AbstractSlurmBackend):
             executable='/bin/bash'
         )
 
-    def __init__(self, hostname: str, hard_reset_on_orch_init: bool = True, **kwargs: typing.Any):
+    def __init__(self, hostname: str, hard_reset_on_orch_init: bool = True, status_cache_ttl: typing.Optional[float] = None, **kwargs: typing.Any):
         """
         Initializes the backend.
         No connection is established until the context is entered.
         provided arguments and keyword arguments are passed to paramiko.SSHClient.Connect
         """
-        super().__init__(hard_reset_on_orch_init=hard_reset_on_orch_init)
+        super().__init__(hard_reset_on_orch_init=hard_reset_on_orch_init, status_cache_ttl=status_cache_ttl)
         self.hostname = hostname
         self.__hostname = hostname
         self.__sshkwargs = {
@@ -339,6 +564,24 @@ class RemoteSlurmBackend(AbstractSlurmBackend):
             canine_logging.warning("Warning: Command will continue running on remote server as Paramiko has no way to interrupt commands")
             raise
 
+    @contextmanager
+    def open_channel(self, command: str) -> typing.ContextManager[typing.Tuple[typing.BinaryIO, typing.BinaryIO]]:
+        """
+        Starts a long-running command on the remote server over a single ssh channel.
+        Yields a tuple of (stdin, stdout) byte streams connected to the command.
+        The command's stdin is closed on exit, and its stderr is discarded
+        """
+        self.early_rekey()
+        raw_stdin, raw_stdout, raw_stderr = self._invoke('{} 2>/dev/null'.format(command))
+        try:
+            yield raw_stdin, raw_stdout
+        finally:
+            raw_stdin.close()
+            raw_stdout.channel.shutdown_write()
+            if not raw_stdout.channel.status_event.wait(10):
+                canine_logging.warning("Remote command did not exit after its input was closed: {}".format(command))
+            raw_stdout.channel.close()
+
     def interactive_login(self) -> int:
         """
         Connects to the client interactively.
@@ -0,0 +1,524 @@
+import typing
+import os
+import time
+import datetime
+import subprocess
+import threading
+from .local import LocalSlurmBackend
+from ..utils import ArgumentHelper
+import pandas as pd
+import requests
+
+# Compact state codes used by squeue %t and sinfo %t
+JOB_STATE_CODES = {
+    'BOOT_FAIL': 'BF',
+    'CANCELLED': 'CA',
+    'COMPLETED': 'CD',
+    'COMPLETING': 'CG',
+    'CONFIGURING': 'CF',
+    'DEADLINE': 'DL',
+    'FAILED': 'F',
+    'NODE_FAIL': 'NF',
+    'OUT_OF_MEMORY': 'OOM',
+    'PENDING': 'PD',
+    'PREEMPTED': 'PR',
+    'REQUEUED': 'RQ',
+    'RESIZING': 'RS',
+    'REVOKED': 'RV',
+    'RUNNING': 'R',
+    'SPECIAL_EXIT': 'SE',
+    'STOPPED': 'ST',
+    'SUSPENDED': 'S',
+    'TIMEOUT': 'TO',
+}
+
+NODE_STATE_CODES = {
+    'allocated': 'alloc',
+    'completing': 'comp',
+    'down': 'down',
+    'draining': 'drng',
+    'drained': 'drain',
+    'error': 'err',
+    'fail': 'fail',
+    'future': 'futr',
+    'idle': 'idle',
+    'maint': 'maint',
+    'mixed': 'mix',
+    'planned': 'plnd',
+    'reserved': 'resv',
+    'unknown': 'unk',
+}
+
+# Node state flags, in the order of precedence used by sinfo
+NODE_FLAG_SUFFIXES = [
+    ('NOT_RESPONDING', '*'),
+    ('POWERING_UP', '#'),
+    ('POWERED_DOWN', '~'),
+    ('POWER_DOWN', '!'),
+    ('POWERING_DOWN', '%'),
+    ('REBOOT_REQUESTED', '@'),
+    ('MAINTENANCE', '$'),
+]
+
+# sacct format fields which can be answered from slurmdbd job records
+SACCT_DEFAULT_FORMAT = 'JobID,JobName,Partition,Account,AllocCPUS,State,ExitCode'
+
+# Environment variables which are not forwarded to submitted jobs.
+# Otherwise, jobs inherit the caller's environment, like sbatch --export=ALL
+SBATCH_ENVIRONMENT_EXCLUDE = {'SLURM_JWT'}
+
+# sbatch options which map directly onto fields of the job submission
+SBATCH_FIELDS = {
+    'account': 'account',
+    'array': 'array',
+    'chdir': 'current_working_directory',
+    'constraint': 'constraints',
+    'cpus_per_task': 'cpus_per_task',
+    'dependency': 'dependency',
+    'error': 'standard_error',
+    'exclude': 'exclude',
+    'gres': 'gres',
+    'input': 'standard_input',
+    'job_name': 'name',
+    'J': 'name',
+    'nodelist': 'nodelist',
+    'nodes': 'nodes',
+    'N': 'nodes',
+    'ntasks': 'tasks',
+    'n': 'tasks',
+    'output': 'standard_output',
+    'o': 'standard_output',
+    'partition': 'partition',
+    'p': 'partition',
+    'qos': 'qos',
+    'requeue': 'requeue',
+    'reservation': 'reservation',
+}
+
+class SlurmRestdError(subprocess.CalledProcessError):
+    """
+    Raised when slurmrestd rejects a request.
+    Subclasses CalledProcessError so that callers handling failed slurm
+    commands also handle failed REST requests
+    """
+
+    def __init__(self, status: int, request: str, errors: typing.Any):
+        super().__init__(status, request, stderr=str(errors))
+        self.errors = errors
+
+    def __str__(self):
+        return "Request '{}' failed with status {}: {}".format(self.cmd, self.returncode, self.errors)
+
+def _format_elapsed(seconds: int) -> str:
+    """
+    Formats a duration the way squeue does (M:SS, H:MM:SS, or D-HH:MM:SS)
+    """
+    seconds = max(0, int(seconds))
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return '{}-{:02d}:{:02d}:{:02d}'.format(days, hours, minutes, seconds)
+    if hours:
+        return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+    return '{}:{:02d}'.format(minutes, seconds)
+
+def _format_timestamp(timestamp: typing.Optional[int]) -> str:
+    """
+    Formats a unix timestamp the way sacct does
+    """
+    if not timestamp:
+        return 'Unknown'
+    return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%S')
+
+def _parse_memory(value: str) -> int:
+    """
+    Converts an sbatch memory string (ie: 4G) to megabytes
+    """
+    value = str(value).strip().upper()
+    units = {'K': 1/1024, 'M': 1, 'G': 1024, 'T': 1048576}
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+def _parse_time_limit(value: str) -> int:
+    """
+    Converts an sbatch time string to minutes
+    Accepts M, M:S, H:M:S, D-H, D-H:M, and D-H:M:S
+    """
+    value = str(value)
+    days = 0
+    if '-' in value:
+        days, value = value.split('-', 1)
+        days = int(days)
+        parts = [int(part) for part in value.split(':')] + [0, 0]
+        hours, minutes, seconds = parts[:3]
+    else:
+        parts = [int(part) for part in value.split(':')]
+        if len(parts) == 1:
+            hours, minutes, seconds = 0, parts[0], 0
+        elif len(parts) == 2:
+            hours, minutes, seconds = 0, parts[0], parts[1]
+        else:
+            hours, minutes, seconds = parts[:3]
+    return days * 1440 + hours * 60 + minutes + (1 if seconds else 0)
+
+class SlurmRestdBackend(LocalSlurmBackend):
+    """
+    SLURM backend which queries and submits jobs through slurmrestd.
+    Requests reuse a single keep-alive HTTP connection and return JSON,
+    so status polling does not spawn a process per query.
+    Files are handled by the local filesystem, so the staging directory must
+    be shared with the cluster (as with the Local backend).
+    Commands without a REST equivalent (srun, or unsupported options) fall
+    back to the slurm command line tools
+    """
+
+    def __init__(
+        self, url: str = 'http://localhost:6820', token: typing.Optional[str] = None,
+        user: typing.Optional[str] = None, api_version: str = 'v0.0.37',
+        request_timeout: float = 30, **kwargs
+    ):
+        """
+        url: Base url of slurmrestd
+        token: JWT to authenticate with. Defaults to $SLURM_JWT
+        user: User to authenticate as. Defaults to $USER
+        api_version: slurmrestd OpenAPI plugin version to use
+        """
+        super().__init__(**kwargs)
+        self.url = url.rstrip('/')
+        self.api_version = api_version
+        self.request_timeout = request_timeout
+        self.user = user if user is not None else os.environ.get('USER')
+        self.token = token if token is not None else os.environ.get('SLURM_JWT')
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        The keep-alive HTTP session used for all requests
+        """
+        with self._session_lock:
+            if self._session is None:
+                self._session = requests.Session()
+                if self.user is not None:
+                    self._session.headers['X-SLURM-USER-NAME'] = self.user
+                if self.token is not None:
+                    self._session.headers['X-SLURM-USER-TOKEN'] = self.token
+            return self._session
+
+    def __exit__(self, *args):
+        """
+        Closes the HTTP session
+        """
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def request(self, method: str, endpoint: str, api: str = 'slurm', **kwargs) -> typing.Dict[str, typing.Any]:
+        """
+        Sends a request to slurmrestd and returns the decoded response.
+        endpoint is relative to the api root (ie: 'jobs' for /slurm/v0.0.37/jobs)
+        Raises a SlurmRestdError if the request fails or slurm reports errors
+        """
+        path = '/{}/{}/{}'.format(api, self.api_version, endpoint.lstrip('/'))
+        response = self.session.request(
+            method,
+            self.url + path,
+            timeout=self.request_timeout,
+            **kwargs
+        )
+        try:
+            data = response.json()
+        except ValueError:
+            data = {'errors': [response.text]} if response.status_code >= 400 else {}
+        errors = [
+            error for error in data.get('errors', [])
+            if not isinstance(error, dict) or error.get('error_number', error.get('errno', 1)) != 0
+        ]
+        if response.status_code >= 400 or len(errors):
+            raise SlurmRestdError(response.status_code, '{} {}'.format(method, path), errors)
+        return data
+
+    def ping(self) -> bool:
+        """
+        Returns False if slurmrestd or the Slurm controller cannot be contacted yet
+        """
+        try:
+            data = self.request('GET', 'ping')
+        except (requests.ConnectionError, requests.Timeout, SlurmRestdError):
+            return False
+        return all(
+            str(ping.get('ping', ping.get('pinged', 'UP'))).upper() == 'UP'
+            for ping in data.get('pings', [])
+        )
+
+    def _squeue(self, *slurmopts: str, **slurmparams: typing.Any) -> pd.DataFrame:
+        """
+        (Internal)
+        Shows the current status of the job queue
+        All jobs are fetched in a single request and filtered locally.
+        Supports the jobs, array, all, and user options. Other options fall
+        back to the squeue command
+        """
+        args = ArgumentHelper(*slurmopts, **slurmparams)
+        supported = {'jobs', 'j', 'array', 'r', 'all', 'a', 'user', 'u'}
+        if len(set(args.flags) - supported) or len(set(args.params) - supported):
+            return super()._squeue(*slurmopts, **slurmparams)
+        jobs = args.jobs if args.jobs is not None else args.j
+        jobs = None if jobs is None else set(str(jobs).split(','))
+        user = args.user if args.user is not None else args.u
+        now = time.time()
+        rows = []
+        for job in self.request('GET', 'jobs').get('jobs', []):
+            if job.get('job_state') not in {'PENDING', 'RUNNING', 'COMPLETING', 'CONFIGURING', 'SUSPENDED', 'REQUEUED', 'RESIZING', 'STOPPED'}:
+                continue
+            job_id = str(job['job_id'])
+            array_id = job.get('array_job_id')
+            if array_id:
+                if job.get('array_task_string'):
+                    job_id = '{}_[{}]'.format(array_id, job['array_task_string'])
+                elif job.get('array_task_id') is not None:
+                    job_id = '{}_{}'.format(array_id, job['array_task_id'])
+            if jobs is not None and not ({job_id, job_id.split('_')[0], str(job['job_id'])} & jobs):
+                continue
+            if user is not None and job.get('user_name') != user:
+                continue
+            running = job['job_state'] != 'PENDING'
+            rows.append({
+                'JOBID': job_id,
+                'PARTITION': job.get('partition'),
+                'NAME': job.get('name'),
+                'USER': job.get('user_name'),
+                'ST': JOB_STATE_CODES.get(job['job_state'], job['job_state']),
+                'TIME': _format_elapsed(now - job['start_time']) if running and job.get('start_time') else '0:00',
+                'NODES': int(job.get('node_count', 1) or 1),
+                'CPUS': int(job.get('cpus', 1) or 1),
+                'NODELIST(REASON)': job.get('nodes') if running else '({})'.format(job.get('state_reason', 'None')),
+            })
+        return pd.DataFrame(
+            rows,
+            columns=['JOBID', 'PARTITION', 'NAME', 'USER', 'ST', 'TIME', 'NODES', 'CPUS', 'NODELIST(REASON)']
+        ).astype({'NODES': int, 'CPUS': int}).set_index('JOBID')
+
+    def _sacct(self, *slurmopts: str, **slurmparams: typing.Any) -> pd.DataFrame:
+        """
+        (Internal)
+        Shows the current job accounting information
+        Jobs are fetched from slurmdbd in a single request per requested job.
+        Supports the job, format, duplicates, and allocations options,
+        and a subset of format fields. Other options fall back to the sacct command
+        """
+        args = ArgumentHelper(*slurmopts, **slurmparams)
+        supported = {'job', 'jobs', 'j', 'format', 'o', 'D', 'duplicates', 'X', 'allocations', 'P', 'parsable2'}
+        fields = [
+            field.split('%')[0]
+            for field in str(args.format if args.format is not None else (args.o if args.o is not None else SACCT_DEFAULT_FORMAT)).split(',')
+        ]
+        if (
+            len(set(args.flags) - supported)
+            or len(set(args.params) - supported)
+            or len({field.lower() for field in fields} - set(SACCT_FIELDS))
+        ):
+            return super()._sacct(*slurmopts, **slurmparams)
+        jobs = args.job if args.job is not None else (args.jobs if args.jobs is not None else args.j)
+        if jobs is None:
+            midnight = datetime.datetime.combine(datetime.date.today(), datetime.time())
+            records = self.request('GET', 'jobs', api='slurmdb', params={'start_time': int(midnight.timestamp())}).get('jobs', [])
+        else:
+            records = [
+                record
+                for job in str(jobs).split(',')
+                for record in self.request('GET', 'job/{}'.format(job), api='slurmdb').get('jobs', [])
+            ]
+        steps = not (args.X or args.allocations)
+        rows = []
+        for record in records:
+            rows.append([SACCT_FIELDS[field.lower()][1](record, None) for field in fields])
+            if steps:
+                for step in record.get('steps', []):
+                    rows.append([SACCT_FIELDS[field.lower()][1](record, step) for field in fields])
+        header = [SACCT_FIELDS[field.lower()][0] for field in fields]
+        df = pd.DataFrame(rows, columns=header, dtype=str)
+        df = df.set_index(header[0])
+        df.index = df.index.map(str)
+        return df
+
+    def _sinfo(self, *slurmopts: str, **slurmparams: typing.Any) -> pd.DataFrame:
+        """
+        (Internal)
+        Shows the current cluster information
+        Nodes and partitions are fetched in two requests and summarized locally.
+        Supports the N (node oriented) option. Other options fall back to the sinfo command
+        """
+        args = ArgumentHelper(*slurmopts, **slurmparams)
+        node_oriented = args.N or args.Node
+        if len(set(args.flags) - {'N', 'Node'}) or len(args.params):
+            return super()._sinfo(*slurmopts, **slurmparams)
+        partitions = {
+            partition['name']: partition
+            for partition in self.request('GET', 'partitions').get('partitions', [])
+        }
+        rows = []
+        groups = {}
+        for node in self.request('GET', 'nodes').get('nodes', []):
+            state = self._node_state(node)
+            for partition in node.get('partitions', []) or ['']:
+                name = partition
+                if 'default' in [str(flag).lower() for flag in partitions.get(partition, {}).get('flags', [])]:
+                    name += '*'
+                if node_oriented:
+                    rows.append([node['name'], 1, name, state])
+                else:
+                    groups.setdefault((name, state), []).append(node['name'])
+        if node_oriented:
+            return pd.DataFrame(
+                rows,
+                columns=['NODELIST', 'NODES', 'PARTITION', 'STATE']
+            ).astype({'NODES': int}).set_index('NODELIST')
+        for (name, state), nodes in groups.items():
+            partition = partitions.get(name.rstrip('*'), {})
+            time_limit = partition.get('maximum_time', None)
+            rows.append([
+                name,
+                'up' if str(partition.get('state', 'UP')).upper() == 'UP' else str(partition.get('state')).lower(),
+                'infinite' if time_limit is None or time_limit in {0xffffffff, 0xfffffffe} else _format_elapsed(int(time_limit) * 60),
+                len(nodes),
+                state,
+                ','.join(nodes)
+            ])
+        return pd.DataFrame(
+            rows,
+            columns=['PARTITION', 'AVAIL', 'TIMELIMIT', 'NODES', 'STATE', 'NODELIST']
+        ).astype({'NODES': int}).set_index('PARTITION')
+
+    @staticmethod
+    def _node_state(node: typing.Dict[str, typing.Any]) -> str:
+        """
+        (Internal)
+        Converts a node record to the compact state displayed by sinfo
+        """
+        state = str(node.get('state', 'unknown')).lower()
+        flags = {str(flag).upper() for flag in node.get('state_flags', [])}
+        if 'DRAIN' in flags:
+            state = 'drng' if state in {'allocated', 'mixed', 'completing'} else 'drain'
+        else:
+            state = NODE_STATE_CODES.get(state, state)
+        for flag, suffix in NODE_FLAG_SUFFIXES:
+            if flag in flags:
+                return state + suffix
+        return state
+
+    def sbatch(self, command: str, *slurmopts: str, **slurmparams: typing.Any) -> str:
+        """
+        Submits the given batch script
+        The first argument MUST be the path to the script on the shared filesystem
+        Additional arguments and keyword arguments provided are passed as slurm arguments to sbatch.
+        Options without a REST equivalent fall back to the sbatch command
+        Returns the jobID of the batch request
+        """
+        args = ArgumentHelper(*slurmopts, **slurmparams)
+        job = {}
+        try:
+            for key in args.flags:
+                if key != 'requeue':
+                    raise KeyError(key)
+                job['requeue'] = True
+            for key, value in args.params.items():
+                key = key.replace('-', '_')
+                if key in SBATCH_FIELDS:
+                    job[SBATCH_FIELDS[key]] = int(value) if SBATCH_FIELDS[key] in {'cpus_per_task', 'tasks'} else str(value)
+                elif key in {'mem', 'mem_per_cpu'}:
+                    job['memory_per_node' if key == 'mem' else 'memory_per_cpu'] = _parse_memory(value)
+                elif key in {'time', 't'}:
+                    job['time_limit'] = _parse_time_limit(value)
+                else:
+                    raise KeyError(key)
+            with self.transport() as transport:
+                with transport.open(command, 'r') as r:
+                    script = r.read()
+        except (KeyError, ValueError, OSError):
+            return super().sbatch(command, *slurmopts, **slurmparams)
+        job.setdefault('current_working_directory', os.getcwd())
+        job['environment'] = {
+            key: value for key, value in os.environ.items()
+            if key not in SBATCH_ENVIRONMENT_EXCLUDE
+        }
+        data = self.request('POST', 'job/submit', json={'job': job, 'script': script})
+        self.invalidate_status_cache()
+        if 'job_id' not in data:
+            raise SlurmRestdError(200, 'POST job/submit', data)
+        return str(data['job_id'])
+
+    def scancel(self, jobID: str, *slurmopts: str, **slurmparams: typing.Any):
+        """
+        Cancels the given jobID
+        Additional arguments fall back to the scancel command
+        """
+        if len(slurmopts) or len(slurmparams):
+            return super().scancel(jobID, *slurmopts, **slurmparams)
+        try:
+            for job in str(jobID).split(','):
+                self.request('DELETE', 'job/{}'.format(job.strip()))
+        finally:
+            self.invalidate_status_cache()
+
+def _record_id(record: typing.Dict[str, typing.Any], step: typing.Optional[typing.Dict[str, typing.Any]]) -> str:
+    """
+    Returns the sacct JobID of a slurmdbd job or step record
+    """
+    array = record.get('array', {})
+    if array.get('job_id') and array.get('task_id') is not None:
+        job_id = '{}_{}'.format(array['job_id'], array['task_id'])
+    else:
+        job_id = str(record['job_id'])
+    if step is None:
+        return job_id
+    step_id = step.get('step', {}).get('id', step.get('step', {}).get('name', ''))
+    return '{}.{}'.format(job_id, str(step_id).split('.')[-1])
+
+def _record_cpus(record: typing.Dict[str, typing.Any], step: typing.Optional[typing.Dict[str, typing.Any]]) -> int:
+    """
+    Returns the allocated cpus of a slurmdbd job or step record
+    """
+    tres = (step if step is not None else record).get('tres', {})
+    for item in tres.get('allocated', []):
+        if item.get('type') == 'cpu':
+            return int(item.get('count', 0))
+    return int(record.get('required', {}).get('CPUs', 0))
+
+def _record_elapsed(record: typing.Dict[str, typing.Any], step: typing.Optional[typing.Dict[str, typing.Any]]) -> int:
+    """
+    Returns the elapsed seconds of a slurmdbd job or step record
+    """
+    return int((step if step is not None else record).get('time', {}).get('elapsed', 0))
+
+def _record_exit_code(record: typing.Dict[str, typing.Any], step: typing.Optional[typing.Dict[str, typing.Any]]) -> str:
+    """
+    Returns the sacct style (return code:signal) exit code of a slurmdbd job or step record
+    """
+    exit_code = (step if step is not None else record).get('exit_code', {})
+    return '{}:{}'.format(
+        exit_code.get('return_code', 0),
+        exit_code.get('signal', {}).get('signal_id', 0)
+    )
+
+# {lowercase sacct field: (column header, value from (job record, step record or None))}
+SACCT_FIELDS = {
+    'jobid': ('JobID', _record_id),
+    'jobname': ('JobName', lambda record, step: record.get('name') if step is None else step.get('step', {}).get('name')),
+    'partition': ('Partition', lambda record, step: record.get('partition') if step is None else None),
+    'account': ('Account', lambda record, step: record.get('account')),
+    'alloccpus': ('AllocCPUS', lambda record, step: str(_record_cpus(record, step))),
+    'state': ('State', lambda record, step: record.get('state', {}).get('current') if step is None else step.get('state')),
+    'exitcode': ('ExitCode', _record_exit_code),
+    'cputimeraw': ('CPUTimeRAW', lambda record, step: str(_record_elapsed(record, step) * _record_cpus(record, step))),
+    'resvcpuraw': ('ResvCPURAW', lambda record, step: None),
+    'elapsedraw': ('ElapsedRaw', lambda record, step: str(_record_elapsed(record, step))),
+    'submit': ('Submit', lambda record, step: _format_timestamp(record.get('time', {}).get('submission'))),
+    'start': ('Start', lambda record, step: _format_timestamp((step if step is not None else record).get('time', {}).get('start'))),
+    'end': ('End', lambda record, step: _format_timestamp((step if step is not None else record).get('time', {}).get('end'))),
+    'nodelist': ('NodeList', lambda record, step: record.get('nodes') if step is None else step.get('nodes', {}).get('range')),
+}
@@ -0,0 +1,274 @@
+import base64
+import glob
+import json
+import os
+import struct
+import subprocess
+import sys
+
+"""
+This is not actually part of the canine package
+This is helper code which is run in the backend
+
+The agent runs on the slurm controller for the life of the pipeline and answers
+batched requests over its stdin and stdout. Each frame is a 4-byte big-endian
+length followed by that many bytes of UTF-8 JSON.
+
+Request frames are {"ops": [{"op": name, ...arguments}, ...]}
+Response frames are {"results": [{"value": ...} or {"error": type, "errno": n, "message": str}, ...]}
+Binary data (file contents, command output) is base64 encoded.
+An empty frame or end of input stops the agent.
+
+AgentClient (below) is the orchestrator side of the protocol. It is kept in this
+file so that both sides of the framing stay in sync; it only needs a pair of
+byte streams connected to a running agent
+"""
+
+VERSION = 1
+HEADER = struct.Struct('>I')
+
+def read_frame(stream):
+    """
+    Reads one frame from the stream.
+    Returns None at end of input
+    """
+    header = stream.read(HEADER.size)
+    if header is None or len(header) < HEADER.size:
+        return None
+    length = HEADER.unpack(header)[0]
+    data = b''
+    while len(data) < length:
+        chunk = stream.read(length - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return json.loads(data.decode()) if length else None
+
+def write_frame(stream, obj):
+    """
+    Writes one frame to the stream
+    """
+    data = json.dumps(obj, separators=(',', ':')).encode()
+    stream.write(HEADER.pack(len(data)) + data)
+    stream.flush()
+
+def encode(data):
+    return base64.b64encode(data).decode()
+
+def decode(data):
+    return base64.b64decode(data.encode())
+
+def op_run(command, cwd=None):
+    proc = subprocess.Popen(
+        command,
+        shell=True,
+        executable='/bin/bash',
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    stdout, stderr = proc.communicate()
+    return {'rc': proc.returncode, 'stdout': encode(stdout), 'stderr': encode(stderr)}
+
+def op_stat(path, follow_symlinks=True):
+    try:
+        st = os.stat(path) if follow_symlinks else os.lstat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return [st.st_mode, st.st_ino, st.st_dev, st.st_nlink, st.st_uid, st.st_gid, st.st_size, st.st_atime, st.st_mtime, st.st_ctime]
+
+def op_glob(pattern):
+    return sorted(glob.glob(pattern))
+
+def op_read(path):
+    with open(path, 'rb') as r:
+        return encode(r.read())
+
+def op_write(path, data, mode=None, times=None):
+    tmp = os.path.join(os.path.dirname(path), '.{}.agent'.format(os.path.basename(path)))
+    with open(tmp, 'wb') as w:
+        w.write(decode(data))
+    if mode is not None:
+        os.chmod(tmp, mode)
+    if times is not None:
+        os.utime(tmp, tuple(times))
+    os.rename(tmp, path)
+
+def op_makedirs(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+def op_chmod(path, mode):
+    os.chmod(path, mode)
+
+OPS = {
+    'run': op_run,
+    'stat': op_stat,
+    'glob': op_glob,
+    'read': op_read,
+    'write': op_write,
+    'makedirs': op_makedirs,
+    'chmod': op_chmod,
+}
+
+def handle(op):
+    """
+    Runs one operation and returns its result entry
+    """
+    try:
+        args = dict(op)
+        return {'value': OPS[args.pop('op')](**args)}
+    except EnvironmentError as e:
+        return {'error': type(e).__name__, 'errno': e.errno, 'message': str(e)}
+    except Exception as e:
+        return {'error': type(e).__name__, 'errno': None, 'message': str(e)}
+
+def serve(stdin, stdout):
+    """
+    Answers request frames until end of input
+    """
+    write_frame(stdout, {'agent': VERSION, 'pid': os.getpid()})
+    while True:
+        request = read_frame(stdin)
+        if request is None:
+            return
+        write_frame(stdout, {'results': [handle(op) for op in request['ops']]})
+
+class AgentError(OSError):
+    """
+    Raised when the agent fails to complete an operation
+    """
+    pass
+
+class AgentClient(object):
+    """
+    Sends batched requests to a running agent over a pair of byte streams
+    """
+
+    # Error names which map to more specific OSError subclasses
+    ERRORS = {
+        'FileNotFoundError': FileNotFoundError,
+        'FileExistsError': FileExistsError,
+        'IsADirectoryError': IsADirectoryError,
+        'NotADirectoryError': NotADirectoryError,
+        'PermissionError': PermissionError,
+    }
+
+    def __init__(self, stdin, stdout):
+        """
+        stdin and stdout are the agent's input and output streams
+        """
+        self.stdin = stdin
+        self.stdout = stdout
+        hello = read_frame(self.stdout)
+        if hello is None or hello.get('agent') != VERSION:
+            raise AgentError("Agent did not start (got {})".format(hello))
+        self.requests = 0
+
+    def request(self, ops):
+        """
+        Sends a batch of operations in one round trip.
+        Returns the list of result entries, in order
+        """
+        ops = list(ops)
+        if not len(ops):
+            return []
+        write_frame(self.stdin, {'ops': ops})
+        self.requests += 1
+        response = read_frame(self.stdout)
+        if response is None:
+            raise AgentError("Agent exited unexpectedly")
+        return response['results']
+
+    def close(self):
+        """
+        Asks the agent to exit
+        """
+        try:
+            self.stdin.write(HEADER.pack(0))
+            self.stdin.flush()
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def unwrap(cls, result):
+        """
+        Returns the value of a result entry, or raises its error
+        """
+        if 'error' in result:
+            raise cls.ERRORS.get(result['error'], AgentError)(result['errno'], result['message'])
+        return result['value']
+
+    def run_many(self, commands):
+        """
+        Runs each command on the controller.
+        Returns a list of (exit status, stdout bytes, stderr bytes)
+        """
+        return [
+            (value['rc'], decode(value['stdout']), decode(value['stderr']))
+            for value in (self.unwrap(result) for result in self.request({'op': 'run', 'command': command} for command in commands))
+        ]
+
+    def stat_many(self, paths, follow_symlinks=True):
+        """
+        Returns {path: os.stat_result or None if missing}
+        """
+        paths = list(paths)
+        return {
+            path: os.stat_result(value) if value is not None else None
+            for path, value in zip(paths, (self.unwrap(result) for result in self.request(
+                {'op': 'stat', 'path': path, 'follow_symlinks': follow_symlinks} for path in paths
+            )))
+        }
+
+    def glob_many(self, patterns):
+        """
+        Returns {pattern: [matching paths]}
+        """
+        patterns = list(patterns)
+        return {
+            pattern: self.unwrap(result)
+            for pattern, result in zip(patterns, self.request({'op': 'glob', 'pattern': pattern} for pattern in patterns))
+        }
+
+    def read_many(self, paths):
+        """
+        Returns {path: file contents as bytes or None if missing}
+        """
+        paths = list(paths)
+        contents = {}
+        for path, result in zip(paths, self.request({'op': 'read', 'path': path} for path in paths)):
+            try:
+                contents[path] = decode(self.unwrap(result))
+            except FileNotFoundError:
+                contents[path] = None
+        return contents
+
+    def write_many(self, files, mode=None, times=None, dirs=()):
+        """
+        Writes each file in {path: str or bytes contents}.
+        mode is a permission mode for every file, or {path: mode}.
+        times optionally sets {path: (atime, mtime)}.
+        Parent directories, and any extra dirs, are created as needed
+        """
+        ops = []
+        for path in sorted({*dirs, *(os.path.dirname(path) for path in files)}):
+            ops.append({'op': 'makedirs', 'path': path})
+        for path, data in files.items():
+            ops.append({
+                'op': 'write',
+                'path': path,
+                'data': encode(data.encode() if isinstance(data, str) else data),
+                'mode': mode.get(path, None) if isinstance(mode, dict) else mode,
+                'times': times.get(path, None) if times is not None else None
+            })
+        for result in self.request(ops):
+            self.unwrap(result)
+
+if __name__ == '__main__':
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    # Anything else printed to stdout would corrupt the framing
+    sys.stdout = sys.stderr
+    serve(stdin, stdout)
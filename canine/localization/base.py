@@ -11,12 +11,14 @@ import shutil
 import warnings
 import crayons
 import re
+import csv
 from uuid import uuid4
 from collections import namedtuple
 from contextlib import ExitStack, contextmanager
 from ..backends import AbstractSlurmBackend, AbstractTransport, LocalSlurmBackend
 from ..utils import get_default_gcp_project, check_call, canine_logging
-from hound.client import _getblob_bucket
+from .agent import AgentClient
+from .listing import GSListingIndex, RequesterPaysCache
 from agutil import status_bar
 import pandas as pd
 
@@ -31,19 +33,26 @@ PathType = namedtuple(
 
 class OverrideValueError(ValueError):
     def __init__(self, override, arg, value):
-        super().__init__("'{}' override is invalid for input {} with value {}".format(arg, value))
+        super().__init__("'{}' override is invalid for input {} with value {}".format(override, arg, value))
 
 class AbstractLocalizer(abc.ABC):
     """
     Base class for localization.
     """
 
+    # Helper agent state. Set lazily by agent()
+    _agent = None
+    _agent_stack = None
+    _agent_unavailable = False
 
     def __init__(
         self, backend: AbstractSlurmBackend, transfer_bucket: typing.Optional[str] = None,
         common: bool = True, staging_dir: str = None,
         project: typing.Optional[str] = None, temporary_disk_type: str = 'standard',
-        local_download_dir: typing.Optional[str] = None, **kwargs
+        local_download_dir: typing.Optional[str] = None, incremental_sync: bool = True,
+        sync_checksum: bool = False, use_agent: bool = True,
+        gs_transfer_threads: typing.Optional[int] = None, gs_listing_ttl: typing.Optional[float] = None,
+        requester_pays_ttl: typing.Optional[float] = 86400, **kwargs
     ):
         """
         Initializes the Localizer using the given transport.
@@ -54,6 +63,13 @@ class AbstractLocalizer(abc.ABC):
         temporary_disk_type: "standard" or "ssd". Default "standard".
         NOTE: If temporary_disk_type is explicitly "None", disks will not be created. Files will be downloaded
         to local_download_dir without mounting a disk there. The directory will not be created in that case
+        incremental_sync: If True, directory transfers into an existing destination skip files which are unchanged
+        sync_checksum: If True, incremental transfers compare md5 checksums instead of size and modification time
+        use_agent: If True, batches of file operations are sent through a helper agent on the controller
+        gs_transfer_threads: Maximum number of objects copied at once by batched gs:// transfers. Default: gsutil's own limit
+        gs_listing_ttl: If set, gs:// listings are cached on disk and reused by later pipelines for this many seconds
+        requester_pays_ttl: How long (seconds) requester pays checks are cached on disk and shared with later pipelines.
+        If None, buckets are checked once per localizer
         """
         self.transfer_bucket = transfer_bucket
         if transfer_bucket is not None and self.transfer_bucket.startswith('gs://'):
@@ -79,45 +95,174 @@ class AbstractLocalizer(abc.ABC):
         self.local_download_dir = local_download_dir if local_download_dir is not None else '/mnt/canine-local-downloads/{}'.format(self.disk_key)
         self.temporary_disk_type = temporary_disk_type
         self.requester_pays = {}
+        self.requester_pays_cache = RequesterPaysCache(requester_pays_ttl) if requester_pays_ttl is not None else None
+        self.incremental_sync = incremental_sync
+        self.sync_checksum = sync_checksum
+        self.use_agent = use_agent
+        self.gs_transfer_threads = gs_transfer_threads
+        self.gs_index = GSListingIndex(
+            lambda bucket: self.project if self.get_requester_pays(bucket) else None,
+            cache_ttl=gs_listing_ttl
+        )
+
+    def agent(self) -> typing.Optional[AgentClient]:
+        """
+        Returns a client for the helper agent on the slurm controller, starting it if needed.
+        The agent runs for the rest of the localizer's life and answers batched
+        commands and file operations in a single round trip.
+        Returns None if the agent is disabled or the backend cannot run it.
+        Callers must fall back to the transport
+        """
+        if self._agent is None and self.use_agent and not self._agent_unavailable:
+            stack = ExitStack()
+            try:
+                path = os.path.join(self.environment('remote')['CANINE_ROOT'], 'agent.py')
+                with self.backend.transport() as transport:
+                    if not transport.isdir(os.path.dirname(path)):
+                        transport.makedirs(os.path.dirname(path))
+                    transport.send(os.path.join(os.path.dirname(__file__), 'agent.py'), path)
+                # the agent is python 3 only. Without python3 it exits before its
+                # hello, and the client raises so that we fall back to the transport
+                stdin, stdout = stack.enter_context(self.backend.open_channel(
+                    'if which python3 2>/dev/null >/dev/null; then python3 {0}; else echo "The controller agent requires python3" >&2; exit 1; fi'.format(path)
+                ))
+                self._agent = AgentClient(stdin, stdout)
+                self._agent_stack = stack
+            except Exception as e:
+                stack.close()
+                self._agent_unavailable = True
+                canine_logging.debug("Controller agent unavailable ({}: {}). Falling back to individual operations".format(type(e).__name__, e))
+        return self._agent
+
+    def close_agent(self):
+        """
+        Stops the helper agent, if it is running
+        """
+        if self._agent is not None:
+            self._agent.close()
+            self._agent_stack.close()
+            self._agent = None
+            self._agent_stack = None
 
     def get_requester_pays(self, path: str) -> bool:
         """
         Returns True if the requested gs:// object or bucket resides in a
-        requester pays bucket
+        requester pays bucket.
+        Results are cached for this localizer, and shared with later pipelines
+        through self.requester_pays_cache
         """
         if path.startswith('gs://'):
             path = path[5:]
         bucket = path.split('/')[0]
         if bucket not in self.requester_pays:
-            command = 'gsutil requesterpays get gs://{}'.format(bucket)
-            # We check on the remote host because scope differences may cause
-            # a requester pays bucket owned by this account to require -u on the controller
-            # better safe than sorry
-            rc, sout, serr = self.backend.invoke(command)
+            cached = self.requester_pays_cache.get(bucket) if self.requester_pays_cache is not None else None
+            if cached is None:
+                flags = self.check_requester_pays(path)
+                if bucket not in flags:
+                    raise subprocess.CalledProcessError(1, 'gsutil ls gs://{}'.format(path))
+                self.requester_pays[bucket] = flags[bucket]
+                if self.requester_pays_cache is not None:
+                    self.requester_pays_cache.update({bucket: self.requester_pays[bucket]})
+            else:
+                self.requester_pays[bucket] = cached
+        return self.requester_pays[bucket]
+
+    def check_requester_pays(self, *paths: str) -> typing.Dict[str, bool]:
+        """
+        Checks on the slurm controller whether the buckets of the given gs://
+        objects are requester pays, bypassing any cached results.
+        Buckets are checked concurrently.
+        Returns {bucket: requester pays}. Buckets which do not exist are left out
+        """
+        buckets = {}
+        for path in paths:
+            if path.startswith('gs://'):
+                path = path[5:]
+            buckets.setdefault(path.split('/')[0], path)
+        flags = {}
+        retry = {}
+        # We check on the remote host because scope differences may cause
+        # a requester pays bucket owned by this account to require -u on the controller
+        # better safe than sorry
+        results = self.backend.invoke_many(
+            'gsutil requesterpays get gs://{}'.format(bucket) for bucket in buckets
+        )
+        for (bucket, path), (rc, sout, serr) in zip(buckets.items(), results):
             text = serr.read()
             if rc == 0 or b'BucketNotFoundException: 404' not in text:
-                self.requester_pays[bucket] = (
+                flags[bucket] = (
                     b'requester pays bucket but no user project provided' in text
                     or 'gs://{}: Enabled'.format(bucket).encode() in sout.read()
                 )
             else:
-                # Try again ls-ing the object itself
-                # sometimes permissions can disallow bucket inspection
-                # but allow object inspection
-                command = 'gsutil ls gs://{}'.format(path)
-                rc, sout, serr = self.backend.invoke(command)
-                text = serr.read()
-                self.requester_pays[bucket] = b'requester pays bucket but no user project provided' in text
+                retry[bucket] = path
+        # Try again ls-ing the object itself
+        # sometimes permissions can disallow bucket inspection
+        # but allow object inspection
+        results = self.backend.invoke_many(
+            'gsutil ls gs://{}'.format(path) for path in retry.values()
+        ) if len(retry) else []
+        for (bucket, path), (rc, sout, serr) in zip(retry.items(), results):
+            text = serr.read()
             if rc == 1 and b'BucketNotFoundException: 404' in text:
                 canine_logging.error(text.decode())
-                raise subprocess.CalledProcessError(rc, command)
-        return bucket in self.requester_pays and self.requester_pays[bucket]
+            else:
+                flags[bucket] = b'requester pays bucket but no user project provided' in text
+        return flags
+
+    def prefetch_requester_pays(self, inputs: typing.Dict[str, typing.Dict[str, typing.Any]]):
+        """
+        Resolves whether each bucket referenced by the given job inputs (and the
+        transfer bucket) is requester pays, checking all uncached buckets at once.
+        Buckets which cannot be checked are left for get_requester_pays to report
+        """
+        paths = {}
+        for data in inputs.values():
+            for value in (data.values() if data is not None else []):
+                for v in (value if isinstance(value, list) else [value]):
+                    if isinstance(v, str) and v.startswith('gs://'):
+                        paths.setdefault(v[5:].split('/')[0], v)
+        if self.transfer_bucket is not None:
+            paths.setdefault(self.transfer_bucket, self.transfer_bucket)
+        for bucket in [*paths]:
+            cached = self.requester_pays_cache.get(bucket) if self.requester_pays_cache is not None else None
+            if bucket in self.requester_pays or cached is not None:
+                self.requester_pays.setdefault(bucket, cached)
+                del paths[bucket]
+        if len(paths):
+            canine_logging.info("Checking {} buckets for requester pays".format(len(paths)))
+            flags = self.check_requester_pays(*paths.values())
+            self.requester_pays.update(flags)
+            if self.requester_pays_cache is not None:
+                self.requester_pays_cache.update(flags)
+
+    def prefetch_local_sizes(self, inputs: typing.Dict[str, typing.Dict[str, typing.Any]], overrides: typing.Dict[str, typing.Optional[str]]):
+        """
+        Lists all gs:// inputs with the 'local' override in one bulk pass, so that
+        sizing each job's node-local disk does not query objects one at a time
+        """
+        paths = [
+            v
+            for data in inputs.values() if data is not None
+            for arg, value in data.items() if overrides.get(arg, False) == 'local'
+            for v in (value if isinstance(value, list) else [value])
+            if isinstance(v, str) and v.startswith('gs://')
+        ]
+        if len(paths):
+            canine_logging.info("Sizing {} node-local inputs".format(len(paths)))
+            self.gs_index.prefetch(paths, threads=self.gs_transfer_threads if self.gs_transfer_threads else 16)
 
     def get_object_size(self, path: str) -> int:
         """
         Returns the total number of bytes of the given gsutil object.
         If a directory is given, this will return the total space used by all objects in the directory
         """
+        try:
+            return self.gs_index.size(path)
+        except FileNotFoundError:
+            raise
+        except:
+            canine_logging.debug("Unable to size {} from bucket listings: {}".format(path, traceback.format_exc()))
         cmd = 'gsutil {} du -s {}'.format(
             '-u {}'.format(self.project) if self.get_requester_pays(path) else '',
             path
@@ -200,13 +345,27 @@ class AbstractLocalizer(abc.ABC):
             check_call(command, rc, sout, serr)
         else:
             subprocess.check_call(command, shell=True)
-        if not dest.startswith('gs://'):
+        if dest.startswith('gs://'):
+            self.gs_index.invalidate(dest)
+        else:
             # Clean up .dir file
             if context == 'remote':
                 self.backend.invoke('rm -f {}/*/.canine_dir_marker'.format(dest))
             else:
                 subprocess.run(['rm', '-f', '{}/*/.canine_dir_marker'.format(dest)])
 
+    def is_gs_directory(self, path: str) -> bool:
+        """
+        Returns True if the given gs:// path is a directory, and not an object itself.
+        Answers from self.gs_index. Returns False if the bucket cannot be listed
+        """
+        try:
+            return self.gs_index.is_directory(path)
+        except:
+            # If there is an exception, procede as a regular object
+            traceback.print_exc()
+            return False
+
     def gs_copy(self, src: str, dest: str, context: str):
         """
         Copy a google storage (gs://) object
@@ -217,22 +376,9 @@ class AbstractLocalizer(abc.ABC):
         """
         assert context in {'local', 'remote'}
         gs_obj = src if src.startswith('gs://') else dest
-        try:
-            components = gs_obj[5:].split('/')
-            bucket = _getblob_bucket(None, components[0], None)
-            blobs = {
-                blob.name
-                for page in bucket.list_blobs(prefix='/'.join(components[1:]), fields='items/name,nextPageToken').pages
-                for blob in page
-            }
-            if len([blob for blob in blobs if blob == '/'.join(components[1:])]) == 0:
-                # This is a directory
-                canine_logging.print("Copying directory:", gs_obj)
-                return self.gs_dircp(src, os.path.dirname(dest), context)
-        except:
-            # If there is an exception, or the above condition is false
-            # Procede as a regular gs_copy
-            traceback.print_exc()
+        if self.is_gs_directory(gs_obj):
+            canine_logging.print("Copying directory:", gs_obj)
+            return self.gs_dircp(src, os.path.dirname(dest), context)
 
         command = "gsutil -o GSUtil:check_hashes=if_fast_else_skip -o GSUtil:parallel_composite_upload_threshold=150M {} cp {} {}".format(
             '-u {}'.format(self.project) if self.get_requester_pays(gs_obj) else '',
@@ -244,13 +390,173 @@ class AbstractLocalizer(abc.ABC):
             check_call(command, rc, sout, serr)
         else:
             subprocess.check_call(command, shell=True)
+        if dest.startswith('gs://'):
+            self.gs_index.invalidate(dest)
+
+    def gs_copy_many(self, copies: typing.Iterable[typing.Tuple[str, str]], context: str, transport: typing.Optional[AbstractTransport] = None) -> typing.Dict[str, str]:
+        """
+        Downloads many gs:// objects, given as (src, dest) pairs.
+        context must be one of {'local', 'remote'}, which specifies
+        where the commands should be run.
+        Objects are downloaded by one gsutil -m cp -I per batch (objects sharing
+        a basename go in separate batches), then moved to their destinations.
+        Directories are copied individually, as by gs_copy.
+        Returns {src: error} for each object which could not be copied
+        """
+        assert context in {'local', 'remote'}
+        copies = list(copies)
+        failures = {}
+        if not len(copies):
+            return failures
+        sources = sorted({src for src, dest in copies})
+        self.gs_index.prefetch(sources, threads=self.gs_transfer_threads if self.gs_transfer_threads else 16)
+        directories = {src for src in sources if self.is_gs_directory(src)}
+
+        # {requester pays: [{basename: (src, [dest, ...])}, ...]}
+        batches = {}
+        for src, dest in copies:
+            if src in directories:
+                canine_logging.print("Copying directory:", src)
+                try:
+                    self.gs_dircp(src, os.path.dirname(dest), context, transport=transport)
+                except subprocess.CalledProcessError as e:
+                    failures[src] = str(e)
+                continue
+            name = os.path.basename(src)
+            for batch in batches.setdefault(self.get_requester_pays(src), []):
+                if name not in batch or batch[name][0] == src:
+                    break
+            else:
+                batch = {}
+                batches[self.get_requester_pays(src)].append(batch)
+            batch.setdefault(name, (src, []))[1].append(dest)
+
+        with self.transport_context(transport if context == 'remote' else None) as transport:
+            for requester_pays, batch_list in batches.items():
+                for batch in batch_list:
+                    failures.update(self._gs_copy_batch(batch, requester_pays, context, transport))
+        for src, error in failures.items():
+            canine_logging.error("Failed to copy {}: {}".format(src, error))
+        return failures
+
+    def _gs_copy_batch(self, batch: typing.Dict[str, typing.Tuple[str, typing.List[str]]], requester_pays: bool, context: str, transport: AbstractTransport) -> typing.Dict[str, str]:
+        """
+        (Internal) Downloads one batch of gs_copy_many, {basename: (src, [dest, ...])}.
+        Returns {src: error} for each object which could not be copied
+        """
+        tempdir = os.path.join(self.environment(context)['CANINE_ROOT'], '.gs_transfer', uuid4().hex)
+        manifest = os.path.join(tempdir, 'manifest.txt')
+        log = os.path.join(tempdir, 'log.csv')
+        output = os.path.join(tempdir, 'gsutil.out')
+        downloads = os.path.join(tempdir, 'objects')
+        manifest_text = ''.join(src + '\n' for src, dests in batch.values())
+        # gsutil's output is shown as usual, and also kept to explain failures
+        command = "bash -o pipefail -c {}".format(shlex.quote(
+            "gsutil -m -o GSUtil:check_hashes=if_fast_else_skip {} {} cp -c -L {} -I {}/ < {} 2>&1 | tee {}".format(
+                '-o GSUtil:parallel_process_count=1 -o GSUtil:parallel_thread_count={}'.format(self.gs_transfer_threads) if self.gs_transfer_threads else '',
+                '-u {}'.format(self.project) if requester_pays else '',
+                shlex.quote(log),
+                shlex.quote(downloads),
+                shlex.quote(manifest),
+                shlex.quote(output)
+            )
+        ))
+        canine_logging.info("Copying {} objects from gs://".format(len(batch)))
+        try:
+            if context == 'remote':
+                transport.makedirs(downloads)
+                with transport.open(manifest, 'w') as w:
+                    w.write(manifest_text)
+                rc = self.backend.invoke(command, True)[0]
+                log_text = ''
+                if transport.isfile(log):
+                    with transport.open(log, 'r') as r:
+                        log_text = r.read()
+                output_text = ''
+                if rc != 0 and transport.isfile(output):
+                    with transport.open(output, 'r') as r:
+                        output_text = r.read()
+            else:
+                os.makedirs(downloads)
+                with open(manifest, 'w') as w:
+                    w.write(manifest_text)
+                rc = subprocess.run(command, shell=True, executable='/bin/bash').returncode
+                log_text = ''
+                if os.path.isfile(log):
+                    with open(log) as r:
+                        log_text = r.read()
+                output_text = ''
+                if rc != 0 and os.path.isfile(output):
+                    with open(output) as r:
+                        output_text = r.read()
+            # gsutil logs one row per object. Objects without a row were never attempted
+            results = {
+                row['Source']: row
+                for row in csv.DictReader((log_text.decode() if isinstance(log_text, bytes) else log_text).splitlines())
+            }
+            not_copied = 'Not copied'
+            if rc != 0:
+                output_text = (output_text.decode(errors='replace') if isinstance(output_text, bytes) else output_text).strip()
+                not_copied = 'Not copied (gsutil exited with status {}){}'.format(
+                    rc,
+                    ': ' + '\n'.join(output_text.splitlines()[-10:]) if len(output_text) else ''
+                )
+
+            failures = {}
+            moves = []
+            for name, (src, dests) in batch.items():
+                if src in results and results[src]['Result'] == 'OK':
+                    # Copy to every destination but the last, which takes the downloaded file
+                    moves += [('cp', os.path.join(downloads, name), dest, src) for dest in dests[:-1]]
+                    moves.append(('mv', os.path.join(downloads, name), dests[-1], src))
+                else:
+                    failures[src] = results[src]['Description'] if src in results else not_copied
+            if context == 'remote' and len(moves):
+                # Each move which fails prints the source object
+                script = os.path.join(tempdir, 'move.sh')
+                with transport.open(script, 'w') as w:
+                    w.write(''.join(
+                        '{{ mkdir -p {} && {} {} {}; }} || echo {}\n'.format(
+                            shlex.quote(os.path.dirname(dest)),
+                            action,
+                            shlex.quote(path),
+                            shlex.quote(dest),
+                            shlex.quote(src)
+                        )
+                        for action, path, dest, src in moves
+                    ))
+                rc, sout, serr = self.backend.invoke('bash {}'.format(shlex.quote(script)))
+                error = serr.read().decode(errors='replace').strip()
+                for src in sout.read().decode().splitlines():
+                    failures[src] = 'Failed to move to its destination{}'.format(': ' + error if len(error) else '')
+            else:
+                for action, path, dest, src in moves:
+                    try:
+                        os.makedirs(os.path.dirname(dest), exist_ok=True)
+                        if action == 'cp':
+                            shutil.copyfile(path, dest)
+                        else:
+                            os.replace(path, dest)
+                    except OSError as e:
+                        failures[src] = 'Failed to move to its destination: {}'.format(e)
+            return failures
+        finally:
+            if context == 'remote':
+                self.backend.invoke('rm -rf {}'.format(shlex.quote(tempdir)))
+            else:
+                shutil.rmtree(tempdir, ignore_errors=True)
 
     def sendtree(self, src: str, dest: str, transport: typing.Optional[AbstractTransport] = None, exist_okay=False):
         """
         Transfers the given local folder to the given remote destination.
         Source must be a local folder, and destination must not exist
+        (unless exist_okay is True). If incremental_sync is enabled, files already
+        present and unchanged at the destination are not transferred again
         """
         if isinstance(self.backend, LocalSlurmBackend):
+            if exist_okay and self.incremental_sync:
+                with self.transport_context(transport) as transport:
+                    return transport.sendtree(src, dest, incremental=True, checksum=self.sync_checksum)
             if exist_okay:
                 canine_logging.warning("exist_okay not supported by LocalSlurmBackend")
             return shutil.copytree(src, dest)
@@ -299,14 +605,27 @@ class AbstractLocalizer(abc.ABC):
                 )
             else:
                 canine_logging.info("Transferring directly over SFTP")
-                transport.sendtree(src, dest)
+                # small files are batched through the controller agent, if available
+                transferred = transport.sendtree(
+                    src,
+                    dest,
+                    incremental=self.incremental_sync,
+                    checksum=self.sync_checksum,
+                    agent=self.agent()
+                )
+                canine_logging.info("Transferred {} files to {}".format(len(transferred), dest))
 
     def receivetree(self, src: str, dest: str, transport: typing.Optional[AbstractTransport] = None, exist_okay=False):
         """
         Transfers the given remote folder to the given local destination.
         Source must be a remote folder, and dest must not exist
+        (unless exist_okay is True). If incremental_sync is enabled, files already
+        present and unchanged at the destination are not transferred again
         """
         if isinstance(self.backend, LocalSlurmBackend):
+            if exist_okay and self.incremental_sync:
+                with self.transport_context(transport) as transport:
+                    return transport.receivetree(src, dest, incremental=True, checksum=self.sync_checksum)
             if exist_okay:
                 canine_logging.warning("exist_okay not supported by LocalSlurmBackend")
             return shutil.copytree(src, dest)
@@ -355,7 +674,15 @@ class AbstractLocalizer(abc.ABC):
                 )
             else:
                 canine_logging.info("Transferring directly over SFTP")
-                transport.receivetree(src, dest)
+                # small files are batched through the controller agent, if available
+                transferred = transport.receivetree(
+                    src,
+                    dest,
+                    incremental=self.incremental_sync,
+                    checksum=self.sync_checksum,
+                    agent=self.agent()
+                )
+                canine_logging.info("Transferred {} files to {}".format(len(transferred), dest))
 
     def reserve_path(self, *args: typing.Any) -> PathType:
         """
@@ -422,7 +749,7 @@ class AbstractLocalizer(abc.ABC):
         Scans input configuration and overrides to choose inputs which should be treated as common.
         Returns the dictionary of common inputs {input path: common path}
         """
-        with self.transport_context(transport) as transport:
+        with self.transport_context(transport) as transport, transport.stat_cache():
             self.common_inputs = set()
             seen = set()
 
@@ -443,24 +770,34 @@ class AbstractLocalizer(abc.ABC):
 
             # 2. see if any of these duplicate values correspond to files; if so, localize them now.
             common_dests = {}
-            for path in self.common_inputs:
-                if path.startswith('gs://') or os.path.exists(path):
-                    basename = os.path.basename(os.path.abspath(path))
+            reserved = set()
+            localizable = [
+                path for path in self.common_inputs
+                if path.startswith('gs://') or os.path.exists(path)
+            ]
+            # Check all initial destinations in one batch
+            transport.exists_many(
+                self.reserve_path('common', os.path.basename(os.path.abspath(path))).remotepath
+                for path in localizable
+            )
+            for path in localizable:
+                basename = os.path.basename(os.path.abspath(path))
+                common_dests[path] = self.reserve_path('common', basename)
+                n = 2
+                while common_dests[path].remotepath in reserved or transport.exists(common_dests[path].remotepath):
+                    if n == 2:
+                        basename += "_2"
+                    else:
+                        basename = re.sub(r"_\d+$", "_" + str(n), basename)
+                    n += 1
                     common_dests[path] = self.reserve_path('common', basename)
-                    n = 2
-                    while transport.exists(common_dests[path].remotepath):
-                        if n == 2:
-                            basename += "_2"
-                        else:
-                            basename = re.sub(r"_\d+$", "_" + str(n), basename)
-                        n += 1
-                        common_dests[path] = self.reserve_path('common', basename)
+                reserved.add(common_dests[path].remotepath)
 
-                    try:
-                        self.localize_file(path, common_dests[path], transport=transport)
-                    except:
-                        canine_logging.error("Unknown error localizing common file {}".format(path))
-                        raise
+                try:
+                    self.localize_file(path, common_dests[path], transport=transport)
+                except:
+                    canine_logging.error("Unknown error localizing common file {}".format(path))
+                    raise
             return {key: value for key, value in common_dests.items()}
 
     def finalize_staging_dir(self, jobs: typing.Iterable[str], transport: typing.Optional[AbstractTransport] = None) -> str:
@@ -496,13 +833,14 @@ class AbstractLocalizer(abc.ABC):
                 path = self.reserve_path('jobs', jobId, 'inputs', basename)
                 n = 2
                 with self.transport_context(transport) as transport:
-                    while transport.exists(path.remotepath):
+                    while path.remotepath in reserved or transport.exists(path.remotepath):
                         if n == 2:
                             basename += "_2"
                         else:
                             basename = re.sub(r"_\d+$", "_" + str(n), basename)
                         n += 1
                         path = self.reserve_path('jobs', jobId, 'inputs', basename)
+                reserved.add(path.remotepath)
 
                 ret = Localization(
                     None,
@@ -557,6 +895,17 @@ class AbstractLocalizer(abc.ABC):
                         value
                     )
 
+                elif mode == 'local':
+                    if not value.startswith('gs://'):
+                        raise OverrideValueError(mode, arg, value)
+                    # Sizes the job's node-local disk. Usually answered from
+                    # listings fetched by prefetch_local_sizes
+                    self.local_download_size[jobId] = self.local_download_size.get(jobId, 0) + self.get_object_size(value)
+                    return Localization(
+                        'local',
+                        value
+                    )
+
                 elif mode == "ro_disk":
                     if not value.startswith('rodisk://'):
                         raise OverrideValueError(mode, arg, value)
@@ -589,15 +938,26 @@ class AbstractLocalizer(abc.ABC):
             overrides['CANINE_JOB_ALIAS'] = None
         self.inputs[jobId] = {}
         self.input_array_flag[jobId] = {}
-        for arg, value in job_inputs.items():
-            mode = overrides[arg] if arg in overrides else False
-            self.input_array_flag[jobId][arg] = isinstance(value, list)
-            value = [value] if not self.input_array_flag[jobId][arg] else value
+        self.local_download_size[jobId] = 0
+        reserved = set()
+        with self.transport_context(transport) as transport, transport.stat_cache():
+            # Check the initial destination of every potentially localized input in one batch
+            transport.exists_many(
+                self.reserve_path('jobs', jobId, 'inputs', os.path.basename(os.path.abspath(v))).remotepath
+                for arg, value in job_inputs.items()
+                if overrides.get(arg, False) not in {None, 'null', 'stream', 'delayed', 'local', 'ro_disk'}
+                for v in (value if isinstance(value, list) else [value])
+                if isinstance(v, str) and v not in common_dests and (v.startswith('gs://') or os.path.exists(v))
+            )
+            for arg, value in job_inputs.items():
+                mode = overrides[arg] if arg in overrides else False
+                self.input_array_flag[jobId][arg] = isinstance(value, list)
+                value = [value] if not self.input_array_flag[jobId][arg] else value
 
-            self.inputs[jobId][arg] = [None]*len(value)
+                self.inputs[jobId][arg] = [None]*len(value)
 
-            for i, v in enumerate(value):
-                self.inputs[jobId][arg][i] = handle_input(v, mode)
+                for i, v in enumerate(value):
+                    self.inputs[jobId][arg][i] = handle_input(v, mode)
 
     def job_setup_teardown(self, jobId: str, patterns: typing.Dict[str, str]) -> typing.Tuple[str, str, str, typing.Dict[str, typing.List[str]]]:
         """
@@ -659,6 +1019,11 @@ class AbstractLocalizer(abc.ABC):
                 'fi'
             ]
             docker_args.append('-v $CANINE_LOCAL_DISK_DIR:$CANINE_LOCAL_DISK_DIR')
+        # Without a disk, local inputs are downloaded to a job directory on the node's boot disk
+        local_dir = os.path.join(self.local_download_dir, disk_name if disk_name is not None else jobId)
+        # Local inputs are grouped by their gs:// directory, so that names never
+        # collide and index files (.bai, .tbi) stay next to their data files
+        local_dirs = {} # {gs:// directory: subdirectory of local_dir}
 
         def export_writer(key, value, is_array):
             if not is_array:
@@ -692,13 +1057,9 @@ class AbstractLocalizer(abc.ABC):
                     ]
                     export_writer(key, dest, is_array)
 
-                elif val.type in {'download', 'local'}:
+                elif val.type == 'download':
                     job_vars.add(shlex.quote(key))
-                    if val.type == 'download':
-                        dest = self.reserve_path('jobs', jobId, 'inputs', os.path.basename(os.path.abspath(val.path)))
-                    else:
-                        # Local and controller paths not needed on this object
-                        dest = PathType(None, os.path.join(self.local_download_dir, disk_name, os.path.basename(val.path)))
+                    dest = self.reserve_path('jobs', jobId, 'inputs', os.path.basename(os.path.abspath(val.path)))
                     localization_tasks += [
                         "if [[ ! -e {2}.fin ]]; then gsutil {0} -o GSUtil:check_hashes=if_fast_else_skip cp {1} {2} && touch {2}.fin; fi".format(
                             '-u {}'.format(shlex.quote(self.project)) if self.get_requester_pays(val.path) else '',
@@ -708,6 +1069,26 @@ class AbstractLocalizer(abc.ABC):
                     ]
                     export_writer(key, dest.remotepath, is_array)
 
+                elif val.type == 'local':
+                    job_vars.add(shlex.quote(key))
+                    parent = os.path.dirname(val.path.rstrip('/'))
+                    if parent not in local_dirs:
+                        local_dirs[parent] = os.path.join(local_dir, str(len(local_dirs) + 1))
+                    dest = os.path.join(local_dirs[parent], os.path.basename(val.path.rstrip('/')))
+                    # directories are copied into the subdirectory, under their own name
+                    directory = self.is_gs_directory(val.path)
+                    localization_tasks += [
+                        "if [[ ! -e {3}.fin ]]; then mkdir -p {4} && gsutil {0} -o GSUtil:check_hashes=if_fast_else_skip {1} {2} {5} && touch {3}.fin; fi".format(
+                            '-u {}'.format(shlex.quote(self.project)) if self.get_requester_pays(val.path) else '',
+                            '-m cp -r' if directory else 'cp',
+                            shlex.quote(val.path.rstrip('/')),
+                            dest,
+                            local_dirs[parent],
+                            local_dirs[parent] if directory else dest
+                        )
+                    ]
+                    export_writer(key, dest, is_array)
+
                 elif val.type == 'ro_disk':
                     assert val.path.startswith("rodisk://")
 
@@ -825,7 +1206,9 @@ class AbstractLocalizer(abc.ABC):
                 'mkdir -p $CANINE_JOB_ROOT',
                 'chmod 755 $CANINE_JOB_LOCALIZATION',
             ] + exports
-        ) + '\nexport CANINE_DOCKER_ARGS="{docker}"\ncd $CANINE_JOB_ROOT\n'.format(docker=' '.join(set(docker_args)))
+        ) + '\nexport CANINE_DOCKER_ARGS="{docker}"\ncd $CANINE_JOB_ROOT\n'.format(docker=' '.join(set(
+            docker_args + (['-v {0}:{0}'.format(local_dir)] if disk_name is None and len(local_dirs) else [])
+        )))
 
         # generate localization script
         localization_script = '\n'.join([
@@ -856,7 +1239,9 @@ class AbstractLocalizer(abc.ABC):
                     'sudo umount {}/{}'.format(self.local_download_dir, disk_name),
                     'gcloud compute instances detach-disk $CANINE_NODE_NAME --zone $CANINE_NODE_ZONE --disk {}'.format(disk_name),
                     'gcloud compute disks delete {} --zone $CANINE_NODE_ZONE'.format(disk_name)
-                ] if disk_name is not None else []
+                ] if disk_name is not None else [
+                    'rm -rf {}'.format(shlex.quote(local_dir))
+                ] if len(local_dirs) else []
             )
         )
         return setup_script, localization_script, teardown_script, array_exports
@@ -874,6 +1259,7 @@ class AbstractLocalizer(abc.ABC):
         Exit localizer context
         May take any cleanup action required
         """
+        self.close_agent()
         if self._local_dir is not None:
             self._local_dir.cleanup()
         if self.clean_on_exit:
@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import typing
+import hashlib
+import threading
+import traceback
+import concurrent.futures
+from hound.client import _getblob_bucket
+from ..utils import get_cache_dir, canine_logging
+
+# (bucket, prefix, recursive)
+ListingKey = typing.Tuple[str, str, bool]
+
+class GSListingIndex(object):
+    """
+    Index of gs:// bucket listings.
+    Answers whether a path is an object or a directory, and object sizes and
+    generations, from one paginated listing per prefix instead of a request per path.
+    Listings are kept in memory for the life of the index. If cache_ttl is given,
+    they are also saved to disk and reused by later pipelines for up to cache_ttl seconds
+    """
+
+    def __init__(self, user_project: typing.Optional[typing.Callable[[str], typing.Optional[str]]] = None, cache_ttl: typing.Optional[float] = None):
+        """
+        user_project: Returns the project to bill when listing the given bucket
+        (for requester pays buckets), or None
+        """
+        self.user_project = user_project
+        self.cache_ttl = cache_ttl
+        self.listings = {} # {(bucket, prefix, recursive): listing}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def split(path: str) -> typing.Tuple[str, str]:
+        """
+        Splits a gs:// path into (bucket, object name)
+        """
+        if path.startswith('gs://'):
+            path = path[5:]
+        bucket, _, name = path.partition('/')
+        return bucket, name
+
+    def cache_path(self, key: ListingKey) -> str:
+        """
+        Returns the on-disk cache file of the given listing
+        """
+        return os.path.join(
+            get_cache_dir('gs_listings'),
+            hashlib.sha1(json.dumps(list(key)).encode()).hexdigest() + '.json'
+        )
+
+    def _load(self, key: ListingKey) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """
+        (Internal) Loads an unexpired listing from the disk cache
+        """
+        if self.cache_ttl is None:
+            return None
+        try:
+            with open(self.cache_path(key)) as r:
+                listing = json.load(r)
+            if time.time() - listing['time'] <= self.cache_ttl:
+                return listing
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def _save(self, key: ListingKey, listing: typing.Dict[str, typing.Any]):
+        """
+        (Internal) Saves a listing to the disk cache
+        """
+        if self.cache_ttl is None:
+            return
+        path = self.cache_path(key)
+        try:
+            with open(path + '.tmp', 'w') as w:
+                json.dump(listing, w)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            canine_logging.debug("Unable to cache listing of gs://{}/{}".format(*key))
+
+    def _list(self, bucket: str, prefix: str, recursive: bool, user_project: typing.Optional[str]) -> typing.Dict[str, typing.Any]:
+        """
+        (Internal) Lists the given prefix
+        """
+        blobs = _getblob_bucket(None, bucket, user_project).list_blobs(
+            prefix=prefix,
+            delimiter=None if recursive else '/',
+            fields='items(name,size,generation),prefixes,nextPageToken'
+        )
+        objects = {}
+        for page in blobs.pages:
+            for blob in page:
+                objects[blob.name] = [int(blob.size) if blob.size is not None else 0, blob.generation]
+        return {
+            'time': time.time(),
+            'objects': objects,
+            'prefixes': sorted(blobs.prefixes)
+        }
+
+    def listing(self, bucket: str, prefix: str, recursive: bool = False, user_project: typing.Optional[str] = None) -> typing.Dict[str, typing.Any]:
+        """
+        Returns the listing of the given prefix, as
+        {'time': listing time, 'objects': {name: [size, generation]}, 'prefixes': [prefix, ...]}.
+        Unless recursive, objects below the next '/' are summarized as prefixes
+        """
+        key = (bucket, prefix, recursive)
+        with self.lock:
+            if key in self.listings:
+                return self.listings[key]
+        listing = self._load(key)
+        if listing is None:
+            if user_project is None and self.user_project is not None:
+                user_project = self.user_project(bucket)
+            listing = self._list(bucket, prefix, recursive, user_project)
+            self._save(key, listing)
+        with self.lock:
+            self.listings[key] = listing
+        return listing
+
+    def lookup(self, path: str) -> typing.Dict[str, typing.Any]:
+        """
+        Returns a listing which includes the given path: the listing of its parent
+        directory, if it has been listed, otherwise a listing of just the path
+        """
+        bucket, name = self.split(path)
+        with self.lock:
+            for key in ((bucket, name[:name.rfind('/') + 1], False), (bucket, name, False)):
+                if key in self.listings:
+                    return self.listings[key]
+        return self.listing(bucket, name)
+
+    def prefetch(self, paths: typing.Iterable[str], threads: int = 16):
+        """
+        Lists everything needed to answer queries about the given paths, concurrently.
+        Directories containing several of the paths are listed once; other paths are listed individually.
+        Failed listings are retried when the path is queried
+        """
+        parents = {}
+        for path in {*paths}:
+            bucket, name = self.split(path)
+            parents.setdefault((bucket, name[:name.rfind('/') + 1]), []).append(name)
+        keys = set()
+        for (bucket, parent), names in parents.items():
+            if len(names) > 1:
+                keys.add((bucket, parent))
+            else:
+                keys.update((bucket, name) for name in names)
+        with self.lock:
+            keys = [key for key in keys if (*key, False) not in self.listings]
+        if self.user_project is not None:
+            # Resolve billing projects up front; lookups may not be thread safe
+            projects = {bucket: self.user_project(bucket) for bucket in {bucket for bucket, prefix in keys}}
+        else:
+            projects = {}
+
+        def fetch(key):
+            try:
+                self.listing(*key, user_project=projects.get(key[0], None))
+            except:
+                canine_logging.debug("Unable to list gs://{}/{}: {}".format(*key, traceback.format_exc()))
+
+        with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+            for _ in executor.map(fetch, keys):
+                pass
+
+    def stat(self, path: str) -> typing.Optional[typing.Tuple[int, int]]:
+        """
+        Returns the (size, generation) of the given object, or None if it is not an object
+        """
+        bucket, name = self.split(path)
+        listing = self.lookup(path)
+        if name in listing['objects']:
+            return tuple(listing['objects'][name])
+        return None
+
+    def is_directory(self, path: str) -> bool:
+        """
+        Returns True if the given path is a directory (a prefix of other objects)
+        and not an object itself
+        """
+        bucket, name = self.split(path)
+        if name == '' or name.endswith('/'):
+            return True
+        listing = self.lookup(path)
+        return name not in listing['objects'] and name + '/' in listing['prefixes']
+
+    def size(self, path: str) -> int:
+        """
+        Returns the size of the given object, or the total size of all objects in the given directory
+        """
+        stat = self.stat(path) if not path.endswith('/') else None
+        if stat is not None:
+            return stat[0]
+        if not self.is_directory(path):
+            raise FileNotFoundError(path)
+        bucket, name = self.split(path)
+        return sum(
+            size for size, generation in self.listing(bucket, name.rstrip('/') + '/' if name else '', recursive=True)['objects'].values()
+        )
+
+    def invalidate(self, path: str):
+        """
+        Drops cached listings which may include the given path, for instance after writing to it
+        """
+        bucket, name = self.split(path)
+        name = name.rstrip('/')
+        keys = {(bucket, name, False), (bucket, name + '/', False), (bucket, name + '/', True)}
+        for i in range(len(name)):
+            if i == 0 or name[i - 1] == '/':
+                keys.update({(bucket, name[:i], False), (bucket, name[:i], True)})
+        with self.lock:
+            keys.update(
+                key for key in self.listings
+                if key[0] == bucket and (key[1].startswith(name) or name.startswith(key[1]))
+            )
+            for key in keys:
+                self.listings.pop(key, None)
+        if self.cache_ttl is not None:
+            for key in keys:
+                try:
+                    os.remove(self.cache_path(key))
+                except OSError:
+                    pass
+
+class RequesterPaysCache(object):
+    """
+    Record of which buckets are requester pays, saved under the user cache
+    directory and shared by all pipelines. Entries expire after ttl seconds
+    """
+
+    def __init__(self, ttl: float = 86400, path: typing.Optional[str] = None):
+        self.ttl = ttl
+        self.path = path if path is not None else os.path.join(get_cache_dir(), 'requester_pays.json')
+        self.lock = threading.Lock()
+        self.entries = self._read() # {bucket: [requester pays, time checked]}
+
+    def _read(self) -> typing.Dict[str, typing.List[typing.Any]]:
+        """
+        (Internal) Reads the unexpired entries of the cache file
+        """
+        try:
+            with open(self.path) as r:
+                entries = json.load(r)
+            return {
+                bucket: entry
+                for bucket, entry in entries.items()
+                if time.time() - entry[1] <= self.ttl
+            }
+        except (OSError, ValueError, TypeError, IndexError, AttributeError):
+            return {}
+
+    def get(self, bucket: str) -> typing.Optional[bool]:
+        """
+        Returns whether the bucket is requester pays, or None if it is not cached
+        """
+        with self.lock:
+            if bucket in self.entries and time.time() - self.entries[bucket][1] <= self.ttl:
+                return self.entries[bucket][0]
+        return None
+
+    def update(self, flags: typing.Dict[str, bool]):
+        """
+        Records whether each bucket is requester pays, merging with entries
+        saved by other pipelines in the meantime
+        """
+        if not len(flags):
+            return
+        with self.lock:
+            entries = self._read()
+            entries.update({bucket: [flag, time.time()] for bucket, flag in flags.items()})
+            self.entries = entries
+            try:
+                with open(self.path + '.{}.tmp'.format(os.getpid()), 'w') as w:
+                    json.dump(entries, w)
+                os.replace(self.path + '.{}.tmp'.format(os.getpid()), self.path)
+            except OSError:
+                canine_logging.debug("Unable to save requester pays cache {}".format(self.path))
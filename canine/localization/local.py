@@ -37,7 +37,7 @@ class BatchedLocalizer(AbstractLocalizer):
         the localizer's entire life cycle.
         If staging_dir is not provided, a random directory is chosen
         """
-        super().__init__(backend, transfer_bucket, common, staging_dir, project)
+        super().__init__(backend, transfer_bucket, common, staging_dir, project, **kwargs)
         self.queued_gs = [] # Queued gs:// -> remote staging transfers
         self.queued_batch = [] # Queued local -> remote directory transfers
         self._has_localized = False
@@ -67,6 +67,21 @@ class BatchedLocalizer(AbstractLocalizer):
             else:
                 self.queued_batch.append((src, os.path.join(dest.remotepath, os.path.basename(src))))
 
+    def copy_queued_gs(self, context: str, transport: typing.Optional[AbstractTransport] = None):
+        """
+        (Internal) Copies all queued gs:// objects for the given context in bulk.
+        Raises a CalledProcessError if any object could not be copied
+        """
+        queued = [(src, dest) for src, dest, ctx in self.queued_gs if ctx == context]
+        self.queued_gs = [entry for entry in self.queued_gs if entry[2] != context]
+        failures = self.gs_copy_many(queued, context, transport=transport)
+        if len(failures):
+            raise subprocess.CalledProcessError(
+                1,
+                "gsutil cp ({} of {} gs:// inputs failed)".format(len(failures), len(queued)),
+                stderr = "\n".join("{}: {}".format(src, error) for src, error in failures.items())
+            )
+
     def __enter__(self):
         """
         Enter localizer context.
@@ -90,6 +105,8 @@ class BatchedLocalizer(AbstractLocalizer):
         if overrides is None:
             overrides = {}
         overrides = {k:v.lower() if isinstance(v, str) else None for k,v in overrides.items()}
+        self.prefetch_requester_pays(inputs)
+        self.prefetch_local_sizes(inputs, overrides)
         with self.backend.transport() as transport:
             if self.common:
                 common_dests = self.pick_common_inputs(inputs, overrides, transport=transport)
@@ -152,14 +169,14 @@ class BatchedLocalizer(AbstractLocalizer):
                 os.path.join(self.environment('local')['CANINE_ROOT'], 'debug.sh')
             )
 
+            self.copy_queued_gs('local')
             self.sendtree(
                 self.local_dir,
                 self.staging_dir,
                 transport,exist_okay=True
             )
             staging_dir = self.finalize_staging_dir(inputs.keys(), transport=transport)
-            for src, dest, context in self.queued_gs:
-                self.gs_copy(src, dest, context)
+            self.copy_queued_gs('remote', transport=transport)
             for src, dest in self.queued_batch:
                 self.sendtree(src, os.path.dirname(dest))
             self._has_localized = True
@@ -182,19 +199,25 @@ class LocalLocalizer(BatchedLocalizer):
     def localize_file(self, src: str, dest: PathType, transport: typing.Optional[AbstractTransport] = None):
         """
         Localizes the given file.
-        gs:// files are queued for later transfer
+        gs:// files are queued for a bulk download into the local staging directory
         local files are symlinked to the staging directory
         """
-        if not self._has_localized:
+        if self._has_localized:
             warnings.warn(
                 "BatchedLocalizer.localize_file called after main localization. File may not be localized"
             )
-        if src.startswith('gs://'):
+        if src.startswith('gs://') and self._has_localized:
             self.gs_copy(
                 src,
                 dest.localpath,
                 'local'
             )
+        elif src.startswith('gs://'):
+            self.queued_gs.append((
+                src,
+                dest.localpath,
+                'local'
+            ))
         elif os.path.exists(src):
             src = os.path.abspath(src)
             if not os.path.isdir(os.path.dirname(dest.localpath)):
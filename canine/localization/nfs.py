@@ -9,6 +9,7 @@ import glob
 import subprocess
 from .base import PathType, Localization
 from .local import BatchedLocalizer
+from .listing import GSListingIndex, RequesterPaysCache
 from ..backends import AbstractSlurmBackend, AbstractTransport
 from ..utils import get_default_gcp_project
 from agutil import status_bar
@@ -31,7 +32,10 @@ class NFSLocalizer(BatchedLocalizer):
         self, backend: AbstractSlurmBackend, transfer_bucket: typing.Optional[str] = None,
         common: bool = True, staging_dir: str = None,
         project: typing.Optional[str] = None, temporary_disk_type: str = 'standard',
-        local_download_dir: typing.Optional[str] = None,**kwargs
+        local_download_dir: typing.Optional[str] = None, incremental_sync: bool = True,
+        sync_checksum: bool = False, use_agent: bool = True,
+        gs_transfer_threads: typing.Optional[int] = None, gs_listing_ttl: typing.Optional[float] = None,
+        requester_pays_ttl: typing.Optional[float] = 86400, **kwargs
     ):
         """
         Initializes the Localizer using the given transport.
@@ -63,6 +67,15 @@ class NFSLocalizer(BatchedLocalizer):
         self.local_download_dir = local_download_dir if local_download_dir is not None else '/mnt/canine-local-downloads/{}'.format(self.disk_key)
         self.temporary_disk_type = temporary_disk_type
         self.requester_pays = {}
+        self.requester_pays_cache = RequesterPaysCache(requester_pays_ttl) if requester_pays_ttl is not None else None
+        self.incremental_sync = incremental_sync
+        self.sync_checksum = sync_checksum
+        self.use_agent = use_agent
+        self.gs_transfer_threads = gs_transfer_threads
+        self.gs_index = GSListingIndex(
+            lambda bucket: self.project if self.get_requester_pays(bucket) else None,
+            cache_ttl=gs_listing_ttl
+        )
 
     def localize_file(self, src: str, dest: PathType, transport: typing.Optional[AbstractTransport] = None):
         """
@@ -132,6 +145,8 @@ class NFSLocalizer(BatchedLocalizer):
                         )
 
         overrides = {k:v.lower() if isinstance(v, str) else None for k,v in overrides.items()}
+        self.prefetch_requester_pays(inputs)
+        self.prefetch_local_sizes(inputs, overrides)
         with self.backend.transport() as transport:
             if self.common:
                 common_dests = self.pick_common_inputs(inputs, overrides, transport=transport)
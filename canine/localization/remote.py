@@ -4,10 +4,14 @@ import typing
 import shlex
 from contextlib import ExitStack
 from .base import AbstractLocalizer, PathType, Localization
+from .agent import AgentClient
 from ..backends import AbstractSlurmBackend, AbstractTransport
 from ..utils import get_default_gcp_project, check_call
 from agutil import status_bar
 
+# Number of job scripts to send to the agent in a single request
+AGENT_BATCH_SIZE = 1536
+
 class RemoteLocalizer(AbstractLocalizer):
     """
     Remote Only strategy:
@@ -19,14 +23,12 @@ class RemoteLocalizer(AbstractLocalizer):
         May take any setup action required
         """
         with self.backend.transport() as transport:
-            if not transport.isdir(self.environment('remote')['CANINE_ROOT']):
-                transport.makedirs(self.environment('remote')['CANINE_ROOT'])
-            if not transport.isdir(self.environment('remote')['CANINE_COMMON']):
-                transport.makedirs(self.environment('remote')['CANINE_COMMON'])
-            if not transport.isdir(self.environment('remote')['CANINE_JOBS']):
-                transport.makedirs(self.environment('remote')['CANINE_JOBS'])
-            if not transport.isdir(self.environment('remote')['CANINE_OUTPUT']):
-                transport.makedirs(self.environment('remote')['CANINE_OUTPUT'])
+            transport.makedirs_many([
+                self.environment('remote')['CANINE_ROOT'],
+                self.environment('remote')['CANINE_COMMON'],
+                self.environment('remote')['CANINE_JOBS'],
+                self.environment('remote')['CANINE_OUTPUT'],
+            ])
         return self
 
     def localize_file(self, src: str, dest: PathType, transport: typing.Optional[AbstractTransport] = None):
@@ -53,6 +55,23 @@ class RemoteLocalizer(AbstractLocalizer):
                         transport
                     )
 
+    def write_job_scripts(self, scripts: typing.Dict[str, str], exports: typing.Dict[str, str], transport: AbstractTransport, agent: typing.Optional[AgentClient] = None):
+        """
+        Writes the given job scripts (made executable) and array export files.
+        Uses a single agent request if an agent is provided
+        """
+        if agent is not None:
+            agent.write_many(scripts, mode=0o775)
+            agent.write_many(exports)
+            return
+        for path, script in scripts.items():
+            with transport.open(path, 'w') as w:
+                w.write(script)
+            transport.chmod(path, 0o775)
+        for path, export in exports.items():
+            with transport.open(path, 'w') as w:
+                w.write(export)
+
     def localize(self, inputs: typing.Dict[str, typing.Dict[str, str]], patterns: typing.Dict[str, str], overrides: typing.Optional[typing.Dict[str, typing.Optional[str]]] = None) -> str:
         """
         3 phase task:
@@ -66,51 +85,47 @@ class RemoteLocalizer(AbstractLocalizer):
         if overrides is None:
             overrides = {}
         overrides = {k:v.lower() if isinstance(v, str) else None for k,v in overrides.items()}
+        self.prefetch_requester_pays(inputs)
+        self.prefetch_local_sizes(inputs, overrides)
         with self.backend.transport() as transport:
             if self.common:
                 common_dests = self.pick_common_inputs(inputs, overrides, transport=transport)
             else:
                 common_dests = {}
+            transport.makedirs_many(
+                os.path.join(
+                    self.environment('remote')['CANINE_JOBS'],
+                    jobId
+                )
+                for jobId, data in inputs.items()
+                if data is not None
+            )
+            agent = self.agent()
+            scripts = {}
+            exports = {}
             for jobId, data in inputs.items():
                 # noop; this shard has been avoided
                 if data is None:
                     continue
 
-                transport.makedirs(
-                    os.path.join(
-                        self.environment('remote')['CANINE_JOBS'],
-                        jobId
-                    )
-                )
                 self.prepare_job_inputs(jobId, data, common_dests, overrides, transport=transport)
 
                 # Now localize job setup, localization, and teardown scripts, and
                 # any array job files
                 setup_script, localization_script, teardown_script, array_exports = self.job_setup_teardown(jobId, patterns)
 
-                # Setup:
-                script_path = self.reserve_path('jobs', jobId, 'setup.sh')
-                with transport.open(script_path.remotepath, 'w') as w:
-                    w.write(setup_script)
-                transport.chmod(script_path.remotepath, 0o775)
-
-                # Localization:
-                script_path = self.reserve_path('jobs', jobId, 'localization.sh')
-                with transport.open(script_path.remotepath, 'w') as w:
-                    w.write(localization_script)
-                transport.chmod(script_path.remotepath, 0o775)
-
-                # Teardown:
-                script_path = self.reserve_path('jobs', jobId, 'teardown.sh')
-                with transport.open(script_path.remotepath, 'w') as w:
-                    w.write(teardown_script)
-                transport.chmod(script_path.remotepath, 0o775)
-
-                # Array exports
+                scripts[self.reserve_path('jobs', jobId, 'setup.sh').remotepath] = setup_script
+                scripts[self.reserve_path('jobs', jobId, 'localization.sh').remotepath] = localization_script
+                scripts[self.reserve_path('jobs', jobId, 'teardown.sh').remotepath] = teardown_script
                 for k, v in array_exports.items():
-                    export_path = self.reserve_path('jobs', jobId, k + "_array.txt")
-                    with transport.open(export_path.remotepath, 'w') as w:
-                        w.write("\n".join(v) + "\n")
+                    exports[self.reserve_path('jobs', jobId, k + "_array.txt").remotepath] = "\n".join(v) + "\n"
+
+                # Scripts are written in batches through the agent, if available
+                if agent is None or len(scripts) >= AGENT_BATCH_SIZE:
+                    self.write_job_scripts(scripts, exports, transport, agent)
+                    scripts = {}
+                    exports = {}
+            self.write_job_scripts(scripts, exports, transport, agent)
 
             # send delocalization script
             transport.send(
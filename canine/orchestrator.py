@@ -5,11 +5,13 @@ import time
 import sys
 import warnings
 import traceback
+from contextlib import contextmanager, ExitStack
 from subprocess import CalledProcessError
 from .adapters import AbstractAdapter, ManualAdapter, FirecloudAdapter
-from .backends import AbstractSlurmBackend, LocalSlurmBackend, RemoteSlurmBackend, DummySlurmBackend, TransientGCPSlurmBackend, TransientImageSlurmBackend, DockerTransientImageSlurmBackend, LocalDockerSlurmBackend
+from .backends import AbstractSlurmBackend, LocalTransport, LocalSlurmBackend, RemoteSlurmBackend, SlurmRestdBackend, DummySlurmBackend, TransientGCPSlurmBackend, TransientImageSlurmBackend, DockerTransientImageSlurmBackend, LocalDockerSlurmBackend
 from .localization import AbstractLocalizer, BatchedLocalizer, LocalLocalizer, RemoteLocalizer, NFSLocalizer
-from .utils import check_call, pandas_read_hdf5_buffered, pandas_write_hdf5_buffered, canine_logging
+from .utils import check_call, pandas_read_hdf5_buffered, pandas_write_hdf5_buffered, canine_logging, plan_worker, plan_workers_for_resources, resource_shape
+from .spool import SpoolWatcher
 import yaml
 import numpy as np
 import pandas as pd
@@ -25,6 +27,7 @@ ADAPTERS = {
 BACKENDS = {
     'Local': LocalSlurmBackend,
     'Remote': RemoteSlurmBackend,
+    'Slurmrestd': SlurmRestdBackend,
     'TransientGCP': TransientGCPSlurmBackend,
     'TransientImage': TransientImageSlurmBackend,
     'DockerTransientImage': DockerTransientImageSlurmBackend,
@@ -32,6 +35,14 @@ BACKENDS = {
     'Dummy': DummySlurmBackend
 }
 
+# Backend options holding the worker machine type and node count of transient
+# backends, which can be planned from the job's resources (see plan_worker_type)
+WORKER_NODE_COUNT_OPTIONS = {
+    'TransientGCP': 'max_node_count',
+    'TransientImage': 'tot_node_count',
+    'DockerTransientImage': 'tot_node_count',
+}
+
 LOCALIZERS = {
     'Batched': BatchedLocalizer,
     'Local': LocalLocalizer,
@@ -48,6 +59,7 @@ export CANINE_ROOT="{{CANINE_ROOT}}"
 export CANINE_COMMON="{{CANINE_COMMON}}"
 export CANINE_OUTPUT="{{CANINE_OUTPUT}}"
 export CANINE_JOBS="{{CANINE_JOBS}}"
+CANINE_START_TIME=$(date +%s)
 source $CANINE_JOBS/$SLURM_ARRAY_TASK_ID/setup.sh
 $CANINE_JOBS/$SLURM_ARRAY_TASK_ID/localization.sh
 LOCALIZER_JOB_RC=$?
@@ -75,7 +87,14 @@ else
   CANINE_JOB_RC=$LOCALIZER_JOB_RC
 fi
 $CANINE_JOBS/$SLURM_ARRAY_TASK_ID/teardown.sh
-echo -n $? > ../.teardown_exit_code
+CANINE_TEARDOWN_RC=$?
+echo -n $CANINE_TEARDOWN_RC > ../.teardown_exit_code
+# notify the orchestrator via the completion spool
+# the record is written under a hidden name and renamed, so that it appears atomically
+CANINE_SPOOL_RECORD=${{{{SLURM_ARRAY_JOB_ID}}}}_$SLURM_ARRAY_TASK_ID.json
+mkdir -p $CANINE_ROOT/.spool && printf '{{{{"job": "%s", "job_id": "%s", "array_job_id": "%s", "exit_code": %d, "teardown_exit_code": %d, "start": %d, "end": %d, "hostname": "%s"}}}}' \\
+  "$SLURM_ARRAY_TASK_ID" "$SLURM_JOB_ID" "$SLURM_ARRAY_JOB_ID" "$CANINE_JOB_RC" "$CANINE_TEARDOWN_RC" "$CANINE_START_TIME" "$(date +%s)" "$(hostname)" \\
+  > $CANINE_ROOT/.spool/.$CANINE_SPOOL_RECORD && mv -f $CANINE_ROOT/.spool/.$CANINE_SPOOL_RECORD $CANINE_ROOT/.spool/$CANINE_SPOOL_RECORD || :
 exit $CANINE_JOB_RC
 """.format(version=version)
 
@@ -223,6 +242,23 @@ class Orchestrator(object):
                 raise ValueError("Retry count must be >= 0")
         self.retry_limit = stringify(config['retry']) if 'retry' in config else 0
 
+        # preemption fallback
+        self.preemption_fallback = None
+        if "preemption_fallback" in config:
+            fallback = { "max_preemptions" : 3, "runtime" : None, "partition" : None, **config["preemption_fallback"] }
+            if fallback.keys() - { "max_preemptions", "runtime", "partition" }:
+                raise ValueError("Unknown preemption_fallback options: {}".format(
+                  ", ".join(fallback.keys() - { "max_preemptions", "runtime", "partition" })
+                ))
+            if type(fallback["max_preemptions"]) != int or fallback["max_preemptions"] < 1:
+                raise ValueError("preemption_fallback.max_preemptions must be an int >= 1")
+            if fallback["runtime"] is not None and fallback["runtime"] < 0:
+                raise ValueError("preemption_fallback.runtime must be >= 0")
+            self.preemption_fallback = fallback
+
+        # shards moved onto non-preemptible nodes, and why
+        self.on_demand_jobs = {}
+
         #
         # adapter
         adapter = config['adapter']
@@ -244,6 +280,8 @@ class Orchestrator(object):
             raise ValueError("Unknown backend type '{type}'".format(**backend))
         self._backend_type = backend['type']
         self._slurmconf_path = backend['slurm_conf_path'] if 'slurm_conf_path' in backend else None
+        if self._backend_type in WORKER_NODE_COUNT_OPTIONS:
+            backend = self.plan_worker_type(backend)
         self.backend = BACKENDS[self._backend_type](**backend)
 
         #
@@ -281,6 +319,75 @@ class Orchestrator(object):
         # job avoided
         self.df_avoided = None
 
+    def plan_worker_type(self, backend: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        """
+        Picks the cheapest worker machine type and node count which fit the
+        job's resources and shard count.
+        If the backend's worker_type is 'auto', returns the backend config with
+        the planned worker_type and node count filled in (a given node count is
+        kept as the maximum). Otherwise, recommends a cheaper machine type
+        than the configured one, if there is one
+        """
+        node_count_option = WORKER_NODE_COUNT_OPTIONS[self._backend_type]
+        auto = backend.get('worker_type', None) == 'auto'
+        try:
+            max_nodes = int(backend[node_count_option]) if node_count_option in backend else None
+            plans = plan_workers_for_resources(
+                self.resources,
+                len(self.job_spec),
+                preemptible = backend.get('preemptible', True),
+                max_nodes = max_nodes
+            )
+        except (ValueError, TypeError):
+            # Recommendations are advisory; only auto requires a plan
+            if auto:
+                raise
+            canine_logging.debug("Unable to plan worker types for resources {}".format(self.resources))
+            return backend
+        if auto:
+            if not len(plans):
+                raise ValueError("No machine type can fit a task with resources {}".format(self.resources))
+            plan = plans[0]
+            canine_logging.info("Using {} worker nodes of type {} ({} tasks per node, ${:.4f} per task-hour)".format(
+                plan.node_count,
+                plan.mtype,
+                plan.tasks_per_node,
+                plan.task_hour_cost
+            ))
+            return {
+                **backend,
+                'worker_type': plan.mtype,
+                node_count_option: plan.node_count
+            }
+        if 'worker_type' not in backend or not len(plans):
+            return backend
+        try:
+            current = plan_worker(
+                backend['worker_type'],
+                *resource_shape(self.resources),
+                len(self.job_spec),
+                preemptible = backend.get('preemptible', True),
+                max_nodes = max_nodes
+            )
+        except (KeyError, ValueError, IndexError):
+            # Machine types outside of the planned families are not second-guessed
+            return backend
+        if current is None:
+            canine_logging.warning("Worker type {} may not fit a task with resources {}; consider {} (set worker_type: auto to pick it automatically)".format(
+                backend['worker_type'],
+                self.resources,
+                plans[0].mtype
+            ))
+        elif plans[0].task_hour_cost < 0.9 * current.task_hour_cost:
+            canine_logging.info("Worker type {} would cost ${:.4f} per task-hour, compared to ${:.4f} for {} ({} tasks per node). Set worker_type: auto to use it".format(
+                backend['worker_type'],
+                current.task_hour_cost,
+                plans[0].task_hour_cost,
+                plans[0].mtype,
+                plans[0].tasks_per_node
+            ))
+        return backend
+
     def run_pipeline(self, output_dir: str = 'canine_output', dry_run: bool = False) -> pd.DataFrame:
         """
         Runs the configured pipeline
@@ -355,12 +462,11 @@ class Orchestrator(object):
                 #
                 # wait for jobs to finish
                 completed_jobs = []
-                cpu_time = {}
-                uptime = {}
-                prev_acct = None
+                usage = None
                 try:
                     if batch_id != -2: # check if all shards were avoided
-                        completed_jobs, uptime, acct = self.wait_for_jobs_to_finish(batch_id)
+                        with self.spool_watcher(localizer, batch_id) as spool:
+                            completed_jobs, usage, acct = self.wait_for_jobs_to_finish(batch_id, spool=spool)
                 except:
                     canine_logging.error("Encountered unhandled exception. Cancelling batch job")
                     self.backend.scancel(batch_id)
@@ -383,11 +489,23 @@ class Orchestrator(object):
 
         try:
             runtime = time.monotonic() - start_time
+            # backends which track node uptime also account for idle nodes;
+            # otherwise, nodes are priced for the time they spent running shards
+            node_hours = self.backend.node_hours()
             canine_logging.print("Estimated total cluster cost:", self.backend.estimate_cost(
                 runtime/3600,
-                node_uptime=sum(uptime.values())/120
+                node_uptime=node_hours if node_hours is not None else (
+                    self.backend.busy_node_hours(usage) if usage is not None else 0
+                )
             )[0])
-            job_cost = self.backend.estimate_cost(job_cpu_time=(df[('job', 'cpu_seconds')]/3600).to_dict())[1]
+            # shards are priced by the CPU time allocated to them on each node,
+            # falling back to their CPU time for shards without usage records
+            # (e.g., avoided shards)
+            task_hours = self.backend.task_cpu_hours(usage) if usage is not None else {}
+            job_cost = self.backend.estimate_cost(job_cpu_time={
+                job_id : task_hours.get('{}_{}'.format(batch_id, job_id), cpu_seconds/3600)
+                for job_id, cpu_seconds in df[('job', 'cpu_seconds')].items()
+            })[1]
             df['est_cost'] = [job_cost[job_id] for job_id in df.index] if job_cost is not None else [0] * len(df)
         except:
             traceback.print_exc()
@@ -430,7 +548,31 @@ class Orchestrator(object):
 
         return entrypoint_path
 
-    def wait_for_jobs_to_finish(self, batch_id, localizer = None):
+    @contextmanager
+    def spool_watcher(self, localizer: AbstractLocalizer, batch_id: str) -> typing.ContextManager[SpoolWatcher]:
+        """
+        Watches the completion spool of the given batch job.
+        NFS staging directories are watched directly on the local filesystem.
+        Otherwise, the spool is watched through the backend's transport
+        """
+        with ExitStack() as stack:
+            if isinstance(localizer, NFSLocalizer):
+                transport = stack.enter_context(LocalTransport())
+                root = localizer.environment('local')['CANINE_ROOT']
+            else:
+                transport = stack.enter_context(self.backend.transport())
+                root = localizer.environment('remote')['CANINE_ROOT']
+            yield stack.enter_context(SpoolWatcher(os.path.join(root, '.spool'), batch_id, transport))
+
+    def wait_for_jobs_to_finish(self, batch_id, localizer = None, spool: typing.Optional[SpoolWatcher] = None, reconcile_interval: int = 300):
+        """
+        Waits for all shards of the batch job to finish.
+        If a SpoolWatcher is provided, shards are marked complete as soon as their
+        completion records appear, and sacct is only polled every reconcile_interval
+        seconds to catch shards which never wrote a record (ie: node failures).
+        Otherwise, sacct is polled every 30 seconds.
+        Returns (completed shards, node usage (see backend.node_usage), accounting info)
+        """
         def grouper(g):
             g = g.sort_values("Submit")
             final = g.iloc[-1]
@@ -440,9 +582,24 @@ class Orchestrator(object):
 
             return final
 
+        def get_acct():
+            acct = self.backend.sacct(
+              "D",
+              job = batch_id,
+              format = "JobId%50,State,ExitCode,CPUTimeRAW,ResvCPURAW,Submit",
+              fresh = True
+            ).astype({'CPUTimeRAW': int, "ResvCPURAW" : float, "Submit" : np.datetime64})
+            acct = acct.loc[~(acct.index.str.endswith("batch") | ~acct.index.str.contains("_"))]
+            acct.loc[acct["ResvCPURAW"].isna(), "ResvCPURAW"] = 0
+            acct.loc[:, "CPUTimeRAW"] += acct.loc[:, "ResvCPURAW"].astype(int)
+            acct = acct.drop(columns = ["ResvCPURAW"])
+            return acct.groupby(acct.index).apply(grouper)
+
+        def is_finished(acct, jid):
+            return acct['State'][jid] not in {'RUNNING', 'PENDING', 'NODE_FAIL', 'REQUEUED'} or self.job_spec[jid.split('_')[1]] is None
+
         acct = None
         completed_jobs = []
-        uptime = {}
 
         waiting_jobs = {
             '{}_{}'.format(batch_id, k)
@@ -455,50 +612,120 @@ class Orchestrator(object):
             save_acct = True
             jobs_dir = localizer.environment("local")["CANINE_JOBS"]
 
+        if spool is None:
+            reconcile_interval = 30
+        next_tick = time.monotonic() + 30
+        last_reconcile = time.monotonic()
         while len(waiting_jobs):
-            time.sleep(30)
-            acct = self.backend.sacct(
-              "D",
-              job = batch_id,
-              format = "JobId%50,State,ExitCode,CPUTimeRAW,ResvCPURAW,Submit"
-            ).astype({'CPUTimeRAW': int, "ResvCPURAW" : float, "Submit" : np.datetime64})
-            acct = acct.loc[~(acct.index.str.endswith("batch") | ~acct.index.str.contains("_"))]
-            acct.loc[acct["ResvCPURAW"].isna(), "ResvCPURAW"] = 0
-            acct.loc[:, "CPUTimeRAW"] += acct.loc[:, "ResvCPURAW"].astype(int)
-            acct = acct.drop(columns = ["ResvCPURAW"])
-            acct = acct.groupby(acct.index).apply(grouper)
-
-            for jid in [*waiting_jobs]:
-                if jid in acct.index: 
-                    job = jid.split('_')[1]
-
-                    # job has completed
-                    if acct['State'][jid] not in {'RUNNING', 'PENDING', 'NODE_FAIL', 'REQUEUED'} or self.job_spec[job] is None:
-#                        print("Job",job, "completed with status", acct['State'][jid], acct['ExitCode'][jid].split(':')[0])
+            if spool is None:
+                time.sleep(max(0, next_tick - time.monotonic()))
+            else:
+                for job in spool.wait(max(0, next_tick - time.monotonic())):
+                    jid = '{}_{}'.format(batch_id, job)
+                    if jid in waiting_jobs:
                         completed_jobs.append((job, jid))
                         waiting_jobs.remove(jid)
-
-                    # TODO: run this on each worker node
-                    # save sacct info for each shard if it's not a noop (None)
-                    if save_acct and self.job_spec[job] is not None:
-                        with localizer.transport_context() as transport:
+                if len(waiting_jobs) and time.monotonic() < next_tick:
+                    continue
+
+            if len(waiting_jobs) and time.monotonic() - last_reconcile >= reconcile_interval - 1:
+                last_reconcile = time.monotonic()
+                acct = get_acct()
+
+                for jid in [*waiting_jobs]:
+                    if jid in acct.index: 
+                        job = jid.split('_')[1]
+
+                        # job has completed
+                        if is_finished(acct, jid):
+                            completed_jobs.append((job, jid))
+                            waiting_jobs.remove(jid)
+
+                        # TODO: run this on each worker node
+                        # save sacct info for each shard if it's not a noop (None)
+                        if save_acct and self.job_spec[job] is not None:
+                            with localizer.transport_context() as transport:
+                                with transport.open(os.path.join(jobs_dir, job, ".sacct"), 'w') as w:
+                                    acct.loc[[jid]].to_csv(w, sep = "\t", header = False, index = False)
+
+                if self.preemption_fallback is not None:
+                    self.apply_preemption_fallback(batch_id, acct, waiting_jobs)
+
+            if time.monotonic() >= next_tick:
+                next_tick += 30
+
+        if spool is not None and len(completed_jobs):
+            # shards reported through the spool may take a moment to reach
+            # the accounting database. Reconcile once all shards are done
+            deadline = time.monotonic() + 60
+            acct = get_acct()
+            while time.monotonic() < deadline and not all(
+                jid in acct.index and is_finished(acct, jid)
+                for job, jid in completed_jobs
+            ):
+                time.sleep(5)
+                acct = get_acct()
+            if save_acct:
+                with localizer.transport_context() as transport:
+                    for job, jid in completed_jobs:
+                        if jid in acct.index:
                             with transport.open(os.path.join(jobs_dir, job, ".sacct"), 'w') as w:
                                 acct.loc[[jid]].to_csv(w, sep = "\t", header = False, index = False)
 
-            # track node uptime
-            try:
-                for node in {node for node in self.backend.squeue(jobs=batch_id)['NODELIST(REASON)'] if not node.startswith('(')}:
-                    if node in uptime:
-                        uptime[node] += 1
-                    else:
-                        uptime[node] = 1
-            # squeue can fail here if the job completed by the time we call it,
-            # so we catch any errors.
-            # TODO: make something less heavy-handed; this may hide true failures
-            except CalledProcessError:
-                pass
+        # node usage is accounted for once, from sacct
+        try:
+            usage = self.backend.node_usage(batch_id)
+        except Exception as e:
+            canine_logging.warning("Could not load node usage from sacct: {}".format(e))
+            usage = None
+
+        return completed_jobs, usage, acct
 
-        return completed_jobs, uptime, acct
+    def apply_preemption_fallback(self, batch_id, acct: pd.DataFrame, jobs: typing.Iterable[str]) -> typing.List[str]:
+        """
+        Moves unfinished shards which keep getting preempted onto non-preemptible
+        nodes (or the configured partition): shards preempted max_preemptions
+        times, and preempted shards whose expected runtime (the median runtime
+        of the batch's completed shards) is at least runtime seconds.
+        Returns the shards which were moved
+        """
+        fallback = self.preemption_fallback
+        candidates = [jid for jid in jobs if jid in acct.index and jid not in self.on_demand_jobs and acct['n_preempted'][jid] > 0]
+        reasons = {
+            jid : "preempted {} times".format(acct['n_preempted'][jid])
+            for jid in candidates if acct['n_preempted'][jid] >= fallback['max_preemptions']
+        }
+        if fallback['runtime'] is not None and len(set(candidates) - reasons.keys()):
+            runtime = self.expected_runtime(batch_id)
+            if runtime is not None and runtime >= fallback['runtime']:
+                reasons.update({
+                    jid : "preempted with expected runtime of {:.0f}s".format(runtime)
+                    for jid in candidates if jid not in reasons
+                })
+        if not len(reasons):
+            return []
+
+        moved = self.backend.request_on_demand(sorted(reasons), partition = fallback['partition'])
+        for jid in moved:
+            canine_logging.info("Moving shard {} onto non-preemptible nodes ({})".format(jid, reasons[jid]))
+            self.on_demand_jobs[jid] = reasons[jid]
+        return moved
+
+    def expected_runtime(self, batch_id) -> typing.Optional[float]:
+        """
+        Returns the median runtime (in seconds) of the batch's completed shards,
+        or None if no shards have completed yet
+        """
+        acct = self.backend.sacct(
+          "D",
+          job = batch_id,
+          format = "JobId%50,State,ElapsedRaw",
+          fresh = True
+        )
+        acct = acct.loc[acct.index.str.contains("_") & ~acct.index.str.endswith("batch") & (acct["State"] == "COMPLETED")]
+        if acct.empty:
+            return None
+        return float(acct["ElapsedRaw"].astype(int).median())
 
     def make_output_DF(self, batch_id, job_spec, outputs, acct, localizer = None) -> pd.DataFrame:
         df = pd.DataFrame()
@@ -536,6 +763,7 @@ class Orchestrator(object):
                         ('job', 'cpu_seconds'): acct['CPUTimeRAW'][batch_id+'_'+str(array_id)],
                         ('job', 'submit_time'): acct['Submit'][batch_id+'_'+str(array_id)],
                         ('job', 'n_preempted'): acct['n_preempted'][batch_id+'_'+str(array_id)],
+                        ('job', 'on_demand'): batch_id+'_'+str(array_id) in self.on_demand_jobs,
                         **{ ('inputs', key) : val for key, val in job_spec[job_id].items() },
                         **{
                             ('outputs', key) : val[0] if isinstance(val, list) and len(val) == 1 else val
@@ -629,12 +857,24 @@ class Orchestrator(object):
                     # TODO
 
                     # check for failed shards 
+                    exit_codes = set(transport.glob(os.path.join(jobs_dir, '*', '.*_exit_code')))
+                    # read all exit codes in one round trip, if the controller agent is available
+                    agent = localizer.agent()
+                    if agent is not None:
+                        exit_codes = {
+                            path: contents.decode() if contents is not None else None
+                            for path, contents in agent.read_many(sorted(exit_codes)).items()
+                        }
+                    else:
+                        exit_codes = dict.fromkeys(exit_codes)
                     for i in js_df.index:
                         for e in [".job_exit_code", ".localizer_exit_code", ".teardown_exit_code"]:
                             exit_code = os.path.join(jobs_dir, i, e)
-                            if transport.isfile(exit_code):
-                                with transport.open(exit_code, "r") as ec:
-                                    js_df.at[i, "failed"] = (ec.read() != "0") | js_df.at[i, "failed"]
+                            if exit_code in exit_codes:
+                                if exit_codes[exit_code] is None:
+                                    with transport.open(exit_code, "r") as ec:
+                                        exit_codes[exit_code] = ec.read()
+                                js_df.at[i, "failed"] = (exit_codes[exit_code] != "0") | js_df.at[i, "failed"]
                             else:
                                 js_df.at[i, "failed"] = True
                                 break
@@ -666,10 +906,15 @@ class Orchestrator(object):
                         self.job_spec[i] = None
 
                     # shards that failed must have their output directories purged
-                    for k in js_df.index[js_df["failed"]]:
-                        transport.rmtree(
-                            localizer.reserve_path('jobs', k).remotepath
-                        )
+                    removed = transport.rmtree_many(
+                        [localizer.reserve_path('jobs', k).remotepath for k in js_df.index[js_df["failed"]]],
+                        root=localizer.staging_dir
+                    )
+                    if len(removed):
+                        canine_logging.info("Purged {} entries from {} failed shards".format(
+                            sum(result.n_removed for result in removed),
+                            len(removed)
+                        ))
 
                     # if we are re-running any jobs, we also have to remove the common
                     # inputs directory, so that the localizer can regenerate it
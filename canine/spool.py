@@ -0,0 +1,120 @@
+import typing
+import os
+import json
+import time
+import select
+import ctypes
+import ctypes.util
+from .backends import AbstractTransport, LocalTransport
+from .utils import canine_logging
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+def _inotify_init(path: str) -> typing.Optional[int]:
+    """
+    (Internal)
+    Returns a non-blocking inotify file descriptor watching the given directory
+    for new files, or None if inotify is unavailable on this system
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, path.encode(), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+class SpoolWatcher(object):
+    """
+    Watches the completion spool written by the pipeline entrypoint.
+    Each shard atomically writes {array job id}_{task}.json to the spool directory
+    when it finishes.
+    If the transport is local, the directory is watched with inotify (falling back
+    to cheap directory scans, which also catch writes from other NFS clients).
+    Otherwise, the directory is listed over the transport and only new records are read
+    """
+
+    def __init__(self, path: str, array_job_id: str, transport: AbstractTransport, scan_interval: float = 5):
+        """
+        Records from any batch job other than array_job_id are ignored
+        The transport must remain open for the life of the watcher
+        """
+        self.path = path
+        self.array_job_id = str(array_job_id)
+        self.transport = transport
+        self.scan_interval = scan_interval
+        self.seen = set()
+        self._inotify = None
+
+    def __enter__(self):
+        if isinstance(self.transport, LocalTransport):
+            os.makedirs(self.path, exist_ok=True)
+            self._inotify = _inotify_init(self.path)
+        elif not self.transport.isdir(self.path):
+            self.transport.makedirs(self.path)
+        return self
+
+    def __exit__(self, *args):
+        if self._inotify is not None:
+            os.close(self._inotify)
+            self._inotify = None
+
+    def scan(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """
+        Reads any new completion records in the spool.
+        Returns {task id: record}
+        """
+        records = {}
+        if isinstance(self.transport, LocalTransport):
+            names = os.listdir(self.path) if os.path.isdir(self.path) else []
+        else:
+            names = self.transport.listdir(self.path) if self.transport.isdir(self.path) else []
+        prefix = self.array_job_id + '_'
+        for name in names:
+            if name in self.seen or not (name.startswith(prefix) and name.endswith('.json')):
+                continue
+            self.seen.add(name)
+            try:
+                with self.transport.open(os.path.join(self.path, name), 'r') as r:
+                    record = json.loads(r.read())
+            except (OSError, ValueError):
+                canine_logging.warning("Unable to read completion record {}".format(os.path.join(self.path, name)))
+                continue
+            records[str(record.get('job', name[len(prefix):-5]))] = record
+        return records
+
+    def wait(self, timeout: float) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """
+        Waits up to timeout seconds for new completion records.
+        Returns as soon as any are available, {task id: record}
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            records = self.scan()
+            remaining = deadline - time.monotonic()
+            if len(records) or remaining <= 0:
+                return records
+            if self._inotify is not None:
+                ready, _, _ = select.select([self._inotify], [], [], min(remaining, self.scan_interval))
+                if len(ready):
+                    self._drain()
+            else:
+                time.sleep(min(remaining, self.scan_interval))
+
+    def _drain(self):
+        """
+        (Internal)
+        Discards pending inotify events. New files are found by the following scan
+        """
+        try:
+            while len(os.read(self._inotify, 65536)):
+                pass
+        except BlockingIOError:
+            pass
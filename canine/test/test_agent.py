@@ -0,0 +1,124 @@
+import unittest
+import unittest.mock
+import tempfile
+import stat
+import os
+import sys
+import shlex
+from canine.backends.local import LocalSlurmBackend, LocalTransport
+from canine.localization import agent
+from canine.localization.agent import AgentClient, AgentError
+from timeout_decorator import timeout as with_timeout
+
+class TestUnit(unittest.TestCase):
+    """
+    Tests the controller helper agent
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.backend = LocalSlurmBackend()
+        self.channel = self.backend.open_channel('{} {}'.format(
+            shlex.quote(sys.executable),
+            shlex.quote(agent.__file__)
+        ))
+        self.client = AgentClient(*self.channel.__enter__())
+
+    def tearDown(self):
+        self.client.close()
+        self.channel.__exit__(None, None, None)
+        self.tempdir.cleanup()
+
+    @with_timeout(30)
+    def test_run_many(self):
+        results = self.client.run_many(['echo {}; echo err >&2; exit {}'.format(i, i % 3) for i in range(100)])
+        self.assertEqual(self.client.requests, 1)
+        self.assertEqual(len(results), 100)
+        for i, (rc, stdout, stderr) in enumerate(results):
+            self.assertEqual(rc, i % 3)
+            self.assertEqual(stdout, '{}\n'.format(i).encode())
+            self.assertEqual(stderr, b'err\n')
+        self.assertListEqual(self.client.run_many([]), [])
+        self.assertEqual(self.client.requests, 1)
+
+    @with_timeout(30)
+    def test_files(self):
+        files = {
+            os.path.join(self.tempdir.name, 'jobs', str(i), 'setup.sh'): '#!/bin/bash\necho {}\n'.format(i)
+            for i in range(50)
+        }
+        self.client.write_many(files, mode=0o775)
+        self.client.write_many({os.path.join(self.tempdir.name, 'binary'): b'\x00\xff'})
+        self.assertEqual(self.client.requests, 2)
+        for path, contents in files.items():
+            with open(path) as r:
+                self.assertEqual(r.read(), contents)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o775)
+
+        pattern = os.path.join(self.tempdir.name, 'jobs', '*', 'setup.sh')
+        self.assertListEqual(self.client.glob_many([pattern])[pattern], sorted(files))
+
+        missing = os.path.join(self.tempdir.name, 'missing')
+        contents = self.client.read_many([*files, os.path.join(self.tempdir.name, 'binary'), missing])
+        self.assertIsNone(contents[missing])
+        self.assertEqual(contents[os.path.join(self.tempdir.name, 'binary')], b'\x00\xff')
+        self.assertEqual(contents[os.path.join(self.tempdir.name, 'jobs', '7', 'setup.sh')], b'#!/bin/bash\necho 7\n')
+
+        stats = self.client.stat_many([*files, missing])
+        self.assertIsNone(stats[missing])
+        self.assertEqual(stats[os.path.join(self.tempdir.name, 'jobs', '7', 'setup.sh')].st_size, 19)
+        self.assertTrue(stat.S_ISREG(stats[os.path.join(self.tempdir.name, 'jobs', '7', 'setup.sh')].st_mode))
+
+    @with_timeout(30)
+    def test_errors(self):
+        self.client.write_many({os.path.join(self.tempdir.name, 'file'): 'foo'})
+        with self.assertRaises(FileExistsError):
+            self.client.write_many({os.path.join(self.tempdir.name, 'file', 'child'): 'foo'})
+        with self.assertRaises(FileNotFoundError):
+            AgentClient.unwrap(self.client.request([{'op': 'chmod', 'path': os.path.join(self.tempdir.name, 'missing'), 'mode': 0o775}])[0])
+        with self.assertRaises(AgentError):
+            AgentClient.unwrap(self.client.request([{'op': 'unknown'}])[0])
+        # The agent keeps serving after failed operations
+        self.assertEqual(self.client.run_many(['true'])[0][0], 0)
+
+    @with_timeout(30)
+    def test_unavailable(self):
+        with self.backend.open_channel('true') as (stdin, stdout):
+            with self.assertRaises(AgentError):
+                AgentClient(stdin, stdout)
+
+    @with_timeout(30)
+    def test_transfer_trees(self):
+        src = os.path.join(self.tempdir.name, 'src')
+        os.makedirs(os.path.join(src, 'jobs', 'empty'))
+        for i in range(20):
+            os.makedirs(os.path.join(src, 'jobs', str(i)))
+            with open(os.path.join(src, 'jobs', str(i), 'setup.sh'), 'w') as w:
+                w.write('#!/bin/bash\necho {}\n'.format(i))
+            os.chmod(os.path.join(src, 'jobs', str(i), 'setup.sh'), 0o775)
+        with open(os.path.join(src, 'large'), 'wb') as w:
+            w.write(os.urandom(4096))
+        dest = os.path.join(self.tempdir.name, 'dest')
+        with unittest.mock.patch('canine.backends.base.AGENT_FILE_SIZE', 1024), LocalTransport() as transport:
+            with unittest.mock.patch.object(transport, 'send', wraps=transport.send) as send:
+                self.assertEqual(len(transport.sendtree(src, dest, incremental=True, agent=self.client)), 21)
+                # only large files are sent individually
+                self.assertEqual(send.call_count, 1)
+                self.assertEqual(os.path.normpath(send.call_args[0][1]), os.path.join(dest, 'large'))
+            self.assertEqual(self.client.requests, 2)
+            self.assertTrue(os.path.isdir(os.path.join(dest, 'jobs', 'empty')))
+            with open(os.path.join(dest, 'jobs', '7', 'setup.sh')) as r:
+                self.assertEqual(r.read(), '#!/bin/bash\necho 7\n')
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.join(dest, 'jobs', '7', 'setup.sh')).st_mode), 0o775)
+            self.assertListEqual(transport.sendtree(src, dest, incremental=True, agent=self.client), [])
+
+            output = os.path.join(self.tempdir.name, 'output')
+            with unittest.mock.patch.object(transport, 'receive', wraps=transport.receive) as receive:
+                self.assertEqual(len(transport.receivetree(dest, output, incremental=True, agent=self.client)), 21)
+                self.assertEqual(receive.call_count, 1)
+                self.assertEqual(os.path.normpath(receive.call_args[0][1]), os.path.join(output, 'large'))
+            self.assertEqual(self.client.requests, 3)
+            with open(os.path.join(output, 'jobs', '7', 'setup.sh')) as r:
+                self.assertEqual(r.read(), '#!/bin/bash\necho 7\n')
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.join(output, 'jobs', '7', 'setup.sh')).st_mode), 0o775)
+            self.assertListEqual(transport.receivetree(dest, output, incremental=True, agent=self.client), [])
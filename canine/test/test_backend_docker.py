@@ -0,0 +1,104 @@
+import unittest
+import unittest.mock
+import subprocess
+import itertools
+import docker
+from canine.backends.dockerTransient import DockerTransientImageSlurmBackend
+
+class FakeContainer(object):
+    """
+    Stands in for a docker SDK container.
+    exec_run replays the given list of results or exceptions
+    """
+
+    def __init__(self, results, status='running'):
+        self.results = results
+        self.status = status
+        self.commands = []
+
+    def exec_run(self, command, demux=False):
+        self.commands.append(command)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return docker.models.containers.ExecResult(*result)
+
+def make_backend(container):
+    # Skip the constructor, which needs GCP credentials
+    backend = DockerTransientImageSlurmBackend.__new__(DockerTransientImageSlurmBackend)
+    backend.config = {'cluster_name': 'canine-test'}
+    backend.dkr = unittest.mock.MagicMock()
+    backend.dkr.containers.get.return_value = container
+    backend.container = backend._get_container('canine-test')
+    return backend
+
+class TestUnit(unittest.TestCase):
+    """
+    Tests command invocation through the Docker API
+    """
+
+    def test_invoke(self):
+        container = FakeContainer([
+            (0, (b'JOBID\n', None)),
+            (2, (None, b'error\n')),
+        ])
+        backend = make_backend(container)
+        rc, stdout, stderr = backend.invoke('squeue | head -n 1')
+        self.assertEqual(rc, 0)
+        self.assertEqual(stdout.read(), b'JOBID\n')
+        self.assertEqual(stderr.read(), b'')
+        self.assertListEqual(container.commands[0], ['/bin/bash', '-c', 'squeue | head -n 1'])
+        rc, stdout, stderr = backend.invoke('false')
+        self.assertEqual(rc, 2)
+        self.assertEqual(stderr.read(), b'error\n')
+        # container status is cached between commands
+        self.assertEqual(backend.dkr.containers.get.call_count, 1)
+
+    @unittest.mock.patch('time.sleep')
+    def test_retry(self, sleep):
+        response = unittest.mock.MagicMock(status_code=500)
+        container = FakeContainer([
+            docker.errors.APIError('OCI runtime exec failed', response=response),
+            docker.errors.APIError('OCI runtime exec failed', response=response),
+            (0, (b'ok', None)),
+        ])
+        backend = make_backend(container)
+        self.assertEqual(backend.invoke('true')[0], 0)
+        self.assertEqual(sleep.call_count, 2)
+        # errors invalidate the cached container
+        self.assertEqual(backend.dkr.containers.get.call_count, 3)
+
+        response = unittest.mock.MagicMock(status_code=400)
+        container.results = [docker.errors.APIError('bad request', response=response)]
+        with self.assertRaises(docker.errors.APIError):
+            backend.invoke('true')
+
+    def test_not_running(self):
+        backend = make_backend(FakeContainer([], status='exited'))
+        rc, stdout, stderr = backend.invoke('true')
+        self.assertEqual(rc, 1)
+        self.assertEqual(stderr.read(), b'Container is not running!')
+        # stopped containers are re-checked on every command
+        backend.invoke('true')
+        self.assertEqual(backend.dkr.containers.get.call_count, 3)
+
+    @unittest.mock.patch('time.sleep')
+    def test_retry_not_found(self, sleep):
+        # lost exec instances are retried, but not forever
+        container = FakeContainer([docker.errors.NotFound('No such exec instance')] * 7)
+        backend = make_backend(container)
+        with self.assertRaises(docker.errors.NotFound):
+            backend.invoke('true')
+        self.assertEqual(sleep.call_count, 6)
+
+    def test_timeout(self):
+        container = FakeContainer([(124, (b'partial', None))])
+        backend = make_backend(container)
+        with unittest.mock.patch('time.monotonic', side_effect=itertools.count(0, 2)):
+            with self.assertRaises(subprocess.TimeoutExpired):
+                backend.invoke('sleep 60', timeout=1)
+        self.assertEqual(container.commands[0][2], "timeout -k 5 1 bash -c 'sleep 60'")
+
+        # commands which exit 124 on their own are not timeouts
+        container.results = [(124, (None, None))]
+        self.assertEqual(backend.invoke('exit 124', timeout=60)[0], 124)
@@ -122,6 +122,18 @@ class TestUnit(unittest.TestCase):
                 transport.rename('test', 'test2')
                 self.assertTrue(transport.isdir('test2'))
 
+                self.assertIn(
+                    transport.normpath('test2/test_utils.py'),
+                    [transport.normpath(path) for path in transport.glob('test2/test_*.py')]
+                )
+                self.assertListEqual(transport.glob('test2/*.nonexistent'), [])
+
+                result = transport.rmtree('test2')
+                self.assertGreater(result.n_removed, 1)
+                self.assertFalse(transport.exists('test2'))
+                with self.assertRaises(ValueError):
+                    transport.rmtree('.')
+
 
 
 class TestIntegration(unittest.TestCase):
@@ -0,0 +1,535 @@
+import unittest
+import unittest.mock
+import threading
+import json
+import re
+import time
+import http.server
+import urllib.parse
+import pandas as pd
+import googleapiclient.discovery
+import google.auth.credentials
+from canine import utils
+from canine.backends import imageTransient
+from canine.backends.imageTransient import TransientImageSlurmBackend, GCEOperationError
+from timeout_decorator import timeout as with_timeout
+
+class FakeCompute(http.server.ThreadingHTTPServer):
+    """
+    Minimal stand-in for the compute API instance, aggregated list, and zone operation endpoints.
+    Every instance has a single boot disk.
+    Operations finish after being polled twice. Instances named "bad*" fail to be created,
+    as do instances created or started in zones which have run out of capacity
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeComputeHandler)
+        self.lock = threading.Lock()
+        self.instances = {}
+        self.images = {}
+        self.operations = {}
+        # number of instances each zone can still start (default: unlimited)
+        self.capacity = {}
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:{}/compute/v1/'.format(self.server_address[1])
+
+    def add_instance(self, name, status='RUNNING', tags=('caninetransientimage',), zone='us-central1-a', image='k9-image'):
+        self.images[name] = image
+        self.instances[name] = {
+            'name': name,
+            'machineType': 'https://www.googleapis.com/compute/v1/projects/test-project/zones/{}/machineTypes/n1-standard-1'.format(zone),
+            'status': status,
+            'zone': 'https://www.googleapis.com/compute/v1/projects/test-project/zones/{}'.format(zone),
+            'selfLink': 'https://www.googleapis.com/compute/v1/projects/test-project/zones/{}/instances/{}'.format(zone, name),
+            'tags': {'items': list(tags)},
+        }
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class FakeComputeHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def not_found(self, name):
+        self.reply(404, {'error': {'code': 404, 'message': "The resource '{}' was not found".format(name), 'errors': []}})
+
+    def operation(self, name, error=None):
+        with self.server.lock:
+            op = {'name': 'op-{}'.format(len(self.server.operations)), 'status': 'RUNNING', 'polls': 0, 'target': name}
+            if error is not None:
+                op['error'] = {'errors': [{'code': error, 'message': 'Operation failed'}]}
+            self.server.operations[op['name']] = op
+        self.reply(200, {k: v for k, v in op.items() if k not in {'polls', 'error'}})
+
+    def reserve(self, zone):
+        with self.server.lock:
+            if self.server.capacity.get(zone) == 0:
+                return False
+            if zone in self.server.capacity:
+                self.server.capacity[zone] -= 1
+            return True
+
+    def aggregated_list(self, query):
+        # deliberately small pages to exercise pagination
+        start = int(query.get('pageToken', ['0'])[0])
+        names = sorted(self.server.instances)
+        items = {}
+        for name in names[start:start + 3]:
+            inst = self.server.instances[name]
+            items.setdefault('zones/' + inst['zone'].split('/')[-1], {'instances': []})['instances'].append(inst)
+        response = {'items': items}
+        if start + 3 < len(names):
+            response['nextPageToken'] = str(start + 3)
+        return self.reply(200, response)
+
+    def handle_request(self, method):
+        path, _, query = self.path.partition('?')
+        query = urllib.parse.parse_qs(query)
+        body = None
+        if 'Content-Length' in self.headers:
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])) or b'null')
+        with self.server.lock:
+            self.server.requests.append((method, path, body))
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        try:
+            # give concurrent requests a chance to overlap
+            time.sleep(0.05)
+            if path.endswith('/aggregated/instances'):
+                return self.aggregated_list(query)
+            if path.endswith('/aggregated/disks'):
+                return self.reply(200, {'items': {'zones/us-central1-a': {'disks': [
+                    {'sourceImage': 'projects/test-project/global/images/' + self.server.images[name], 'users': [inst['selfLink']]}
+                    for name, inst in self.server.instances.items()
+                ]}}})
+            match = re.match(r'/compute/v1/projects/[^/]+/zones(?:/([^/]+)(?:/(instances|operations)(?:/([^/]+)(?:/(\w+))?)?)?)?$', path)
+            if match is None:
+                return self.reply(400, {'error': {'code': 400, 'message': 'bad path ' + path}})
+            zone, collection, name, action = match.groups()
+            if zone is None:
+                return self.reply(200, {'items': [{'name': 'us-central1-a'}, {'name': 'us-central1-b'}]})
+            if collection == 'operations':
+                with self.server.lock:
+                    op = self.server.operations[name]
+                    op['polls'] += 1
+                    if op['polls'] >= 2:
+                        op['status'] = 'DONE'
+                return self.reply(200, {k: v for k, v in op.items() if k != 'polls' and (k != 'error' or op['status'] == 'DONE')})
+            if name is None and method == 'GET':
+                items = [
+                    inst for inst in self.server.instances.values()
+                    if inst['zone'].endswith('/' + zone)
+                ]
+                return self.reply(200, {'items': items} if len(items) else {})
+            if name is None and method == 'POST':
+                if body['name'].startswith('bad') or not self.reserve(zone):
+                    return self.operation(body['name'], error='ZONE_RESOURCE_POOL_EXHAUSTED')
+                self.server.add_instance(body['name'], zone=zone, image=body['disks'][0]['initializeParams']['sourceImage'].split('/')[-1])
+                return self.operation(body['name'])
+            if name not in self.server.instances or not self.server.instances[name]['zone'].endswith('/' + zone):
+                return self.not_found(name)
+            if method == 'DELETE':
+                del self.server.instances[name]
+            elif action == 'start':
+                if not self.reserve(zone):
+                    return self.operation(name, error='ZONE_RESOURCE_POOL_EXHAUSTED')
+                self.server.instances[name]['status'] = 'RUNNING'
+            elif action == 'stop':
+                self.server.instances[name]['status'] = 'TERMINATED'
+            return self.operation(name)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+def make_backend(**config):
+    # Skip the constructor, which needs GCP credentials
+    backend = TransientImageSlurmBackend.__new__(TransientImageSlurmBackend)
+    backend.config = {
+        'project': 'test-project',
+        'compute_zone': 'us-central1-a',
+        'worker_prefix': 'k9-test',
+        'worker_type': 'n1-standard-1',
+        'tot_node_count': 8,
+        'init_node_count': 4,
+        'image': 'k9-image',
+        'preemptible': '--preemptible',
+        'gpu_type': None,
+        'gpu_count': 0,
+        'compute_metadata': {'startup-script': 'echo hello'},
+        'compute_metadata_files': {},
+        'action_on_stop': 'delete',
+        'autoscale': False,
+        'min_node_count': 0,
+        'autoscale_interval': 60,
+        'idle_timeout': 300,
+        'warm_pool_size': 0,
+        **config
+    }
+    backend.operation_poll_interval = 0.01
+    return backend
+
+class TestUnit(unittest.TestCase):
+    """
+    Tests GCE instance operations against a local fake compute endpoint
+    """
+
+    def setUp(self):
+        self.server = FakeCompute()
+        service = googleapiclient.discovery.build(
+            'compute',
+            'v1',
+            client_options={'api_endpoint': self.server.endpoint},
+            credentials=google.auth.credentials.AnonymousCredentials(),
+            cache_discovery=False
+        )
+        self.patch = unittest.mock.patch.object(imageTransient, 'gce', service)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.server.stop()
+
+    @with_timeout(60)
+    def test_init_nodes(self):
+        self.server.add_instance('k9-test2', status='TERMINATED')
+        self.server.add_instance('k9-test3', tags=())
+        backend = make_backend()
+        backend.init_nodes()
+
+        # external nodes are left alone
+        self.assertListEqual(list(backend.nodes.index), ['k9-test{}'.format(i) for i in range(1, 9) if i != 3])
+        self.assertNotIn('k9-test3', [body['name'] for method, path, body in self.server.requests if body])
+
+        inserts = [body for method, path, body in self.server.requests if method == 'POST' and path.endswith('/instances')]
+        self.assertEqual(len(inserts), 6)
+        body = inserts[0]
+        self.assertEqual(body['machineType'], 'zones/us-central1-a/machineTypes/n1-standard-1')
+        self.assertEqual(body['disks'][0]['initializeParams']['sourceImage'], 'projects/test-project/global/images/k9-image')
+        self.assertTrue(body['scheduling']['preemptible'])
+        self.assertListEqual(body['tags']['items'], ['caninetransientimage'])
+        self.assertListEqual(body['metadata']['items'], [{'key': 'startup-script', 'value': 'echo hello'}])
+        self.assertNotIn('guestAccelerators', body)
+
+        # requests were issued concurrently
+        self.assertGreater(self.server.max_active, 1)
+        self.assertEqual(self.server.instances['k9-test2']['status'], 'RUNNING')
+        # nodes beyond init_node_count are stopped
+        stops = sorted(path.split('/')[-2] for method, path, body in self.server.requests if path.endswith('/stop'))
+        self.assertListEqual(stops, ['k9-test6', 'k9-test7', 'k9-test8'])
+        starts = [path.split('/')[-2] for method, path, body in self.server.requests if path.endswith('/start')]
+        self.assertListEqual(starts, ['k9-test2'])
+
+        backend.stop(kill_straggling_jobs=False)
+        self.assertListEqual(sorted(self.server.instances), ['k9-test3'])
+
+    @with_timeout(60)
+    def test_errors(self):
+        backend = make_backend(worker_prefix='bad', gpu_type='nvidia-tesla-t4', gpu_count=1)
+        self.server.add_instance('ok1', status='TERMINATED')
+        errors = backend.instance_operations('insert', ['bad1', 'bad2'], body=backend.instance_body)
+        self.assertListEqual(sorted(errors), ['bad1', 'bad2'])
+        self.assertIn('ZONE_RESOURCE_POOL_EXHAUSTED', errors['bad1'])
+        body = backend.instance_body('bad1')
+        self.assertEqual(body['guestAccelerators'][0]['acceleratorCount'], 1)
+        self.assertEqual(body['scheduling']['onHostMaintenance'], 'TERMINATE')
+
+        # missing instances are per-node errors unless ignored
+        errors = backend.instance_operations('start', ['ok1', 'missing'])
+        self.assertListEqual(list(errors), ['missing'])
+        self.assertIn('404', errors['missing'])
+        self.assertEqual(self.server.instances['ok1']['status'], 'RUNNING')
+        self.assertDictEqual(backend.instance_operations('delete', ['ok1', 'missing'], ignore_missing=True), {})
+
+        with self.assertRaises(GCEOperationError) as context:
+            backend.init_nodes()
+        self.assertEqual(len(context.exception.errors), 8)
+
+    @with_timeout(60)
+    def test_list_instances(self):
+        for i in range(8):
+            self.server.add_instance('node{}'.format(i), zone='us-central1-{}'.format('ab'[i % 2]))
+        backend = make_backend()
+        instances = backend.list_instances_all_zones()
+        self.assertListEqual(sorted(instances['name']), ['node{}'.format(i) for i in range(8)])
+        self.assertListEqual(list(instances.loc[instances['name'] == 'node1', 'zone']), ['us-central1-b'])
+        self.assertListEqual(list(instances.loc[instances['name'] == 'node1', 'machineType']), ['n1-standard-1'])
+        self.assertListEqual(instances['tags'][0], ['caninetransientimage'])
+        listings = [path for method, path, body in self.server.requests if path.endswith('/aggregated/instances')]
+        self.assertEqual(len(listings), 3)
+
+        # repeated listings are cached
+        backend.list_instances_all_zones()
+        self.assertEqual(len(self.server.requests), 3)
+
+        # until an instance operation invalidates them
+        backend.instance_operations('stop', ['node1'])
+        instances = backend.list_instances_all_zones()
+        self.assertListEqual(list(instances.loc[instances['name'] == 'node1', 'status']), ['TERMINATED'])
+        requests = len(self.server.requests)
+        backend.list_instances_all_zones(fresh=True)
+        self.assertEqual(len(self.server.requests), requests + 3)
+
+        backend.instance_operations('delete', ['node{}'.format(i) for i in range(8)])
+        self.assertTrue(backend.list_instances_all_zones().empty)
+
+    @with_timeout(60)
+    def test_autoscale(self):
+        backend = make_backend(worker_type='n1-standard-4', tot_node_count=4, init_node_count=1, min_node_count=1, idle_timeout=3600)
+        backend.init_nodes()
+        self.assertEqual(sorted(backend._node_start), ['k9-test1'])
+
+        # Stands in for Slurm: node states follow instance states and scontrol updates
+        queue = []
+        states = {}
+        commands = []
+        def sinfo(*args, **kwargs):
+            return pd.DataFrame(
+                {'STATE': [
+                    states.get(node, 'idle' if inst['status'] == 'RUNNING' else 'down*')
+                    for node, inst in sorted(self.server.instances.items())
+                ]},
+                index=sorted(self.server.instances)
+            )
+        def invoke(command):
+            commands.append(command)
+            nodes = re.search(r'nodename=(\S+)', command).group(1).split(',')
+            for node in nodes:
+                if 'state=drain' in command:
+                    states[node] = 'drain' if states.get(node) != 'alloc' else 'drng'
+                else:
+                    states.pop(node, None)
+            return 0, None, None
+        backend.squeue = lambda *args, **kwargs: pd.DataFrame({'ST': [st for st, cpus in queue], 'CPUS': [cpus for st, cpus in queue]})
+        backend.sinfo = sinfo
+        backend.invoke = invoke
+
+        # 10 pending single-CPU tasks need 3 four-CPU nodes; one is already up
+        queue[:] = [('PD', 1)] * 10
+        states['k9-test1'] = 'idle'
+        self.assertTupleEqual(backend.autoscale(), (['k9-test2', 'k9-test3'], []))
+        self.assertEqual(self.server.instances['k9-test3']['status'], 'RUNNING')
+        self.assertEqual(self.server.instances['k9-test4']['status'], 'TERMINATED')
+        self.assertIn('state=resume', commands[-1])
+        # booting nodes count towards capacity
+        self.assertTupleEqual(backend.autoscale(), ([], []))
+
+        # idle nodes are kept until idle_timeout
+        queue[:] = []
+        states.clear()
+        self.assertTupleEqual(backend.autoscale(), ([], []))
+        backend.config['idle_timeout'] = 0
+        states['k9-test2'] = 'alloc'
+        # busy nodes are kept
+        started, stopped = backend.autoscale()
+        self.assertListEqual(started, [])
+        self.assertListEqual(sorted(stopped), ['k9-test1', 'k9-test3'])
+        self.assertEqual(self.server.instances['k9-test3']['status'], 'TERMINATED')
+        self.assertEqual(sorted(backend._node_start), ['k9-test2'])
+
+        # as are min_node_count nodes
+        states.clear()
+        self.assertTupleEqual(backend.autoscale(), ([], []))
+        self.assertGreater(backend.node_hours(), 0)
+
+        # drained nodes are returned to service when the autoscaler stops
+        backend._autoscaler_thread = threading.Thread(target=lambda: None)
+        backend._autoscaler_lock = threading.Event()
+        backend._autoscaler_thread.start()
+        backend.stop(kill_straggling_jobs=False)
+        self.assertIn('nodename=k9-test1,k9-test3 state=resume', commands[-1])
+        self.assertDictEqual(backend._node_start, {})
+
+    @with_timeout(60)
+    def test_warm_pool(self):
+        self.server.add_instance('k9-test1', status='TERMINATED')
+        self.server.add_instance('k9-test2', status='TERMINATED', image='old-image')
+        self.server.add_instance('k9-test5', status='TERMINATED', image='old-image')
+        self.server.add_instance('k9-test6')
+        backend = make_backend(tot_node_count=6, init_node_count=2, warm_pool_size=4)
+        backend.init_nodes()
+
+        # initial nodes are resumed, or replaced if their image is outdated
+        self.assertEqual(self.server.images['k9-test2'], 'k9-image')
+        self.assertEqual(self.server.instances['k9-test1']['status'], 'RUNNING')
+        self.assertEqual(self.server.instances['k9-test2']['status'], 'RUNNING')
+        starts = [path.split('/')[-2] for method, path, body in self.server.requests if path.endswith('/start')]
+        self.assertListEqual(starts, ['k9-test1'])
+
+        # the rest of the pool is filled in the background
+        backend._pool_thread.join()
+        self.assertSetEqual(backend._pool_pending, frozenset())
+        for i in range(3, 7):
+            self.assertEqual(self.server.instances['k9-test{}'.format(i)]['status'], 'TERMINATED')
+            self.assertEqual(self.server.images['k9-test{}'.format(i)], 'k9-image')
+
+        # pool nodes are kept when the cluster is deleted
+        backend.stop(kill_straggling_jobs=False)
+        self.assertListEqual(sorted(self.server.instances), ['k9-test1', 'k9-test2', 'k9-test3', 'k9-test4'])
+        for inst in self.server.instances.values():
+            self.assertEqual(inst['status'], 'TERMINATED')
+
+    @with_timeout(60)
+    def test_preemption(self):
+        backend = make_backend(tot_node_count=3, init_node_count=2)
+        backend.init_nodes()
+        commands = []
+        backend.invoke = lambda command: commands.append(command) or (0, None, None)
+        backend.sinfo = lambda *args, **kwargs: pd.DataFrame({'STATE': ['alloc', 'idle', 'down*']}, index=['k9-test1', 'k9-test2', 'k9-test3'])
+        queries = []
+        def squeue(*args, **kwargs):
+            queries.append(kwargs)
+            return pd.DataFrame({'ST': ['R', 'PD']}, index=['42_1', '42_7'])
+        backend.squeue = squeue
+
+        self.assertListEqual(backend.check_preemption(), [])
+        listings = len([path for method, path, body in self.server.requests if path.endswith('/aggregated/instances')])
+        self.assertEqual(listings, 2)
+
+        self.server.instances['k9-test1']['status'] = 'STOPPING'
+        self.assertListEqual(backend.check_preemption(), ['k9-test1'])
+        self.assertEqual(queries[-1]['nodelist'], 'k9-test1')
+        self.assertListEqual(commands, [
+            'sudo -E scontrol requeue 42_1',
+            'sudo -E scontrol update nodename=k9-test1 state=down reason=preempted'
+        ])
+        # still stopping; not restarted yet
+        self.assertFalse(any(path.endswith('/start') for method, path, body in self.server.requests))
+
+        self.server.instances['k9-test1']['status'] = 'TERMINATED'
+        self.assertListEqual(backend.check_preemption(), [])
+        self.assertEqual(self.server.instances['k9-test1']['status'], 'RUNNING')
+        self.assertEqual(commands[-1], 'sudo -E scontrol update nodename=k9-test1 state=resume')
+        self.assertEqual(backend.preemption_counts['k9-test1'], 1)
+        self.assertEqual(backend.zone_preemption_counts['us-central1-a'], 1)
+        # one aggregated listing per check
+        listings = len([path for method, path, body in self.server.requests if path.endswith('/aggregated/instances')])
+        self.assertEqual(listings, 4)
+
+    @with_timeout(60)
+    def test_on_demand(self):
+        backend = make_backend(tot_node_count=4, init_node_count=2, worker_type='n1-standard-2')
+        backend.init_nodes()
+        commands = []
+        backend.invoke = lambda command: commands.append(command) or (0, None, None)
+        backend.sinfo = lambda *args, **kwargs: pd.DataFrame({'STATE': ['alloc', 'idle', 'idle', 'idle']}, index=['k9-test1', 'k9-test2', 'k9-test3', 'k9-test4'])
+        queue = pd.DataFrame({'ST': ['R', 'PD', 'PD'], 'CPUS': [2, 1, 1]}, index=['42_1', '42_2', '42_3'])
+        backend.squeue = lambda *args, **kwargs: queue
+        start = len(self.server.requests)
+
+        # 4 CPUs need two nodes; stopped nodes are used first
+        self.assertListEqual(backend.request_on_demand(['42_1', '42_2']), ['42_1', '42_2'])
+        self.assertSetEqual(set(backend._on_demand_nodes), {'k9-test4', 'k9-test3'})
+        inserts = [body for method, path, body in self.server.requests[start:] if method == 'POST' and path.endswith('/instances')]
+        self.assertListEqual(sorted(body['name'] for body in inserts), ['k9-test3', 'k9-test4'])
+        self.assertFalse(any(body['scheduling']['preemptible'] for body in inserts))
+        self.assertListEqual(commands, [
+            'sudo -E scontrol update nodename=k9-test4,k9-test3 availablefeatures=ondemand activefeatures=ondemand state=resume',
+            'sudo -E scontrol update jobid=42_2 features=ondemand'
+        ])
+        self.assertAlmostEqual(backend.node_hours(), 0, places=2)
+        self.assertEqual(len(backend._node_start), 4)
+
+        # the next task fits; idle nodes are recreated once stopped ones run out
+        commands.clear()
+        self.assertListEqual(backend.request_on_demand(['42_2', '42_3']), ['42_3'])
+        self.assertListEqual(commands, ['sudo -E scontrol update jobid=42_3 features=ondemand'])
+        queue = pd.DataFrame({'ST': ['R', 'R', 'R', 'PD'], 'CPUS': [2, 1, 1, 2]}, index=['42_1', '42_2', '42_3', '42_4'])
+        commands.clear()
+        self.assertListEqual(backend.request_on_demand(['42_4']), ['42_4'])
+        self.assertIn('k9-test2', backend._on_demand_nodes)
+        self.assertEqual(commands[0], 'sudo -E scontrol update nodename=k9-test2 state=drain reason=on_demand')
+
+        # running tasks are constrained once they are requeued
+        commands.clear()
+        backend.requeue_preempted(['k9-test1'])
+        self.assertListEqual(commands, [
+            'sudo -E scontrol requeue 42_1,42_2,42_3',
+            'sudo -E scontrol update jobid=42_1,42_2,42_3 features=ondemand',
+            'sudo -E scontrol update nodename=k9-test1 state=down reason=preempted'
+        ])
+
+        # non-preemptible nodes are not kept in the warm pool
+        backend.config['warm_pool_size'] = 4
+        backend.stop(kill_straggling_jobs=False)
+        time.sleep(0.5)
+        self.assertListEqual(sorted(self.server.instances), ['k9-test1'])
+
+    @with_timeout(60)
+    def test_zone_failover(self):
+        backend = make_backend(tot_node_count=4, init_node_count=2, fallback_zones=['us-central1-b', 'us-central1-c'])
+        self.server.capacity = {'us-central1-a': 1, 'us-central1-b': 3}
+        # k9-test1 is stopped in a zone which is now out of capacity
+        self.server.add_instance('k9-test1', status='TERMINATED', zone='us-central1-c')
+        self.server.capacity['us-central1-c'] = 0
+        backend.init_nodes()
+
+        zones = {name: inst['zone'].split('/')[-1] for name, inst in self.server.instances.items()}
+        self.assertEqual(sorted(zones.values()).count('us-central1-a'), 1)
+        self.assertEqual(sorted(zones.values()).count('us-central1-b'), 3)
+        # k9-test1 was recreated in a zone with capacity
+        self.assertEqual(zones['k9-test1'], 'us-central1-b')
+        self.assertEqual(self.server.instances['k9-test1']['status'], 'RUNNING')
+        for node, zone in zones.items():
+            self.assertEqual(backend.node_zone(node), zone)
+        inserts = [(path, body) for method, path, body in self.server.requests if method == 'POST' and path.endswith('/instances')]
+        for path, body in inserts:
+            self.assertIn('/zones/{}/'.format(path.split('/')[-2]), '/' + body['machineType'] + '/')
+
+        # operations on nodes go to their own zones
+        commands = []
+        backend.invoke = lambda command: commands.append(command) or (0, None, None)
+        backend.sinfo = lambda *args, **kwargs: pd.DataFrame({'STATE': ['idle'] * 4}, index=['k9-test1', 'k9-test2', 'k9-test3', 'k9-test4'])
+        backend.update_node_addresses(sorted(zones))
+        self.assertListEqual(commands, [
+            'sudo -E scontrol update nodename={0} nodeaddr={0}.us-central1-b.c.test-project.internal'.format(node)
+            for node in sorted(zones) if zones[node] == 'us-central1-b'
+        ])
+        backend.stop(kill_straggling_jobs=False)
+        time.sleep(0.5)
+        self.assertDictEqual(self.server.instances, {})
+
+        # preempted zones are tried last
+        backend.zone_preemption_counts = {'us-central1-b': 1}
+        self.assertListEqual(backend.zone_ranking(), ['us-central1-a', 'us-central1-c', 'us-central1-b'])
+
+    def test_estimate_cost(self):
+        backend = make_backend(worker_type='n1-standard-2')
+        backend._on_demand_nodes = frozenset(['k9-test2'])
+        preemptible = utils.gcp_hourly_cost('n1-standard-2', preemptible=True)
+        on_demand = utils.gcp_hourly_cost('n1-standard-2')
+        cluster_cost, job_cost = backend.estimate_cost(
+            node_uptime={'k9-test1': 2, 'k9-test2': 1},
+            job_cpu_time={'0': {'k9-test1': 2, 'k9-test2': 1}, '1': 4}
+        )
+        self.assertAlmostEqual(cluster_cost, 2 * preemptible + on_demand)
+        self.assertAlmostEqual(job_cost['0'], (2 * preemptible + on_demand) / 2)
+        self.assertAlmostEqual(job_cost['1'], 2 * preemptible)
+        self.assertAlmostEqual(backend.estimate_cost(node_uptime=3)[0], 3 * preemptible)
+
@@ -0,0 +1,61 @@
+import unittest
+import subprocess
+import tempfile
+import threading
+import os
+import time
+from canine.backends.local import LocalSlurmBackend
+from timeout_decorator import timeout as with_timeout
+
+class TestUnit(unittest.TestCase):
+    """
+    Tests command invocation on the local backend
+    """
+
+    def setUp(self):
+        self.backend = LocalSlurmBackend()
+
+    def test_invoke(self):
+        rc, stdout, stderr = self.backend.invoke('echo hello; echo world >&2; exit 3')
+        self.assertEqual(rc, 3)
+        self.assertEqual(stdout.read(), b'hello\n')
+        self.assertEqual(stderr.read(), b'world\n')
+
+        # non-interactive commands do not start helper threads
+        threads = threading.active_count()
+        original = threading.Thread.start
+        started = []
+        threading.Thread.start = lambda thread: started.append(thread) or original(thread)
+        try:
+            for i in range(20):
+                self.assertEqual(self.backend.invoke('true')[0], 0)
+        finally:
+            threading.Thread.start = original
+        self.assertListEqual(started, [])
+        self.assertEqual(threading.active_count(), threads)
+
+    @with_timeout(30)
+    def test_timeout(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            marker = os.path.join(tempdir, 'marker')
+            start = time.monotonic()
+            with self.assertRaises(subprocess.TimeoutExpired) as context:
+                self.backend.invoke('echo started; (sleep 2; touch {}) & wait'.format(marker), timeout=0.5)
+            self.assertLess(time.monotonic() - start, 2)
+            self.assertEqual(context.exception.output, b'started\n')
+            # children of the shell are killed too
+            time.sleep(2.5)
+            self.assertFalse(os.path.exists(marker))
+        self.assertEqual(self.backend.invoke('sleep 0.1', timeout=5)[0], 0)
+
+    @with_timeout(30)
+    def test_invoke_many(self):
+        start = time.monotonic()
+        results = self.backend.invoke_many(['sleep 1; echo {}'.format(i) for i in range(8)], max_workers=8)
+        self.assertLess(time.monotonic() - start, 4)
+        self.assertListEqual(
+            [(rc, stdout.read()) for rc, stdout, stderr in results],
+            [(0, '{}\n'.format(i).encode()) for i in range(8)]
+        )
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.backend.invoke_many(['true', 'sleep 5'], timeout=0.5)
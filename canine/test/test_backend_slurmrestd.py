@@ -0,0 +1,233 @@
+import unittest
+import unittest.mock
+import tempfile
+import threading
+import json
+import os
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from canine.backends.slurmrestd import SlurmRestdBackend, SlurmRestdError
+from timeout_decorator import timeout as with_timeout
+
+API = '/slurm/v0.0.37/'
+DB_API = '/slurmdb/v0.0.37/'
+TOKEN = 'fake-jwt'
+
+class StubSlurmrestd(ThreadingMixIn, HTTPServer):
+    """
+    Minimal in-memory slurmrestd
+    Records every request and every client connection
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.requests = []
+        self.connections = set()
+        self.next_id = 1000
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.nodes = [
+            {'name': 'worker{}'.format(i), 'state': 'idle', 'state_flags': [], 'partitions': ['main']}
+            for i in range(4)
+        ] + [
+            {'name': 'worker4', 'state': 'idle', 'state_flags': ['POWERED_DOWN'], 'partitions': ['main']},
+        ]
+
+    def submit(self, job, script):
+        with self.lock:
+            self.environment = job['environment']
+            self.next_id += 1
+            start, end = (int(x) for x in job.get('array', '0-0').split('-'))
+            for task in range(start, end + 1):
+                self.jobs['{}_{}'.format(self.next_id, task)] = {
+                    'job_id': self.next_id + task + 1,
+                    'array_job_id': self.next_id,
+                    'array_task_id': task,
+                    'name': job.get('name', 'sbatch'),
+                    'partition': job.get('partition', 'main'),
+                    'user_name': 'root',
+                    'job_state': 'RUNNING' if task < 4 else 'PENDING',
+                    'state_reason': 'None' if task < 4 else 'Resources',
+                    'start_time': int(time.time()) - 65,
+                    'node_count': 1,
+                    'cpus': job.get('cpus_per_task', 1),
+                    'nodes': 'worker{}'.format(task) if task < 4 else '',
+                    'script': script,
+                }
+            return self.next_id
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, method):
+        server = self.server
+        server.requests.append((method, self.path))
+        server.connections.add(self.client_address)
+        if self.headers.get('X-SLURM-USER-TOKEN') != TOKEN:
+            return self.reply(401, {'errors': [{'error': 'Authentication failure', 'error_number': 1}]})
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length)) if length else None
+        path = self.path.split('?')[0]
+        if path == API + 'ping':
+            return self.reply(200, {'pings': [{'hostname': 'controller', 'ping': 'UP', 'status': 0}]})
+        if path == API + 'jobs':
+            return self.reply(200, {'jobs': list(server.jobs.values())})
+        if path == API + 'nodes':
+            return self.reply(200, {'nodes': server.nodes})
+        if path == API + 'partitions':
+            return self.reply(200, {'partitions': [{'name': 'main', 'flags': ['default'], 'state': 'UP', 'maximum_time': 0xffffffff}]})
+        if path == API + 'job/submit' and method == 'POST':
+            if 'environment' not in body['job']:
+                return self.reply(500, {'errors': [{'error': 'Missing environment', 'error_number': 2}]})
+            return self.reply(200, {'job_id': server.submit(body['job'], body['script']), 'errors': []})
+        if path.startswith(API + 'job/') and method == 'DELETE':
+            array_id = path.split('/')[-1]
+            for key, job in server.jobs.items():
+                if key.split('_')[0] == array_id:
+                    job['job_state'] = 'CANCELLED'
+            return self.reply(200, {'errors': []})
+        if path.startswith(DB_API + 'job/'):
+            array_id = path.split('/')[-1]
+            return self.reply(200, {'jobs': [
+                {
+                    'job_id': job['job_id'],
+                    'name': job['name'],
+                    'partition': job['partition'],
+                    'account': 'root',
+                    'array': {'job_id': job['array_job_id'], 'task_id': job['array_task_id']},
+                    'state': {'current': 'COMPLETED' if job['job_state'] == 'RUNNING' else job['job_state'], 'reason': 'None'},
+                    'exit_code': {'status': 'SUCCESS', 'return_code': 0},
+                    'time': {'elapsed': 60, 'submission': 1591904527, 'start': 1591904530, 'end': 1591904590},
+                    'tres': {'allocated': [{'type': 'cpu', 'count': job['cpus']}]},
+                    'nodes': job['nodes'],
+                    'steps': [{
+                        'step': {'id': '{}.batch'.format(job['job_id']), 'name': 'batch'},
+                        'state': 'COMPLETED',
+                        'exit_code': {'status': 'SUCCESS', 'return_code': 0},
+                        'time': {'elapsed': 60},
+                        'tres': {'allocated': [{'type': 'cpu', 'count': job['cpus']}]},
+                    }]
+                }
+                for key, job in server.jobs.items()
+                if key.split('_')[0] == array_id
+            ]})
+        return self.reply(404, {'errors': [{'error': 'Unknown endpoint', 'error_number': 3}]})
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+class TestUnit(unittest.TestCase):
+    """
+    Tests the slurmrestd backend against a stub server
+    """
+
+    def setUp(self):
+        self.server = StubSlurmrestd()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.backend = SlurmRestdBackend(
+            'http://127.0.0.1:{}'.format(self.server.server_address[1]),
+            token=TOKEN,
+            user='root'
+        )
+        self.backend.__enter__()
+
+    def tearDown(self):
+        self.backend.__exit__()
+        self.server.shutdown()
+        self.server.server_close()
+
+    @with_timeout(30)
+    @unittest.mock.patch.dict(os.environ, {'SLURM_JWT': TOKEN})
+    def test_submit_and_poll(self):
+        self.assertTrue(self.backend.ping())
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = self.backend.pack_batch_script('echo hello', script_path=os.path.join(tempdir, 'entrypoint.sh'))
+            batch_id = self.backend.sbatch(
+                path,
+                requeue=True,
+                job_name='canine',
+                array='0-9',
+                output='{}/%a/stdout'.format(tempdir),
+                **{'cpus-per-task': 2, 'mem': '4G'}
+            )
+        self.assertEqual(batch_id, '1001')
+        # jobs inherit the caller's environment, except for the token
+        self.assertEqual(self.server.environment['PATH'], os.environ['PATH'])
+        self.assertNotIn('SLURM_JWT', self.server.environment)
+        self.assertTrue(self.server.jobs['1001_0']['script'].startswith('#!/bin/bash\necho hello'))
+
+        squeue = self.backend.squeue('array', jobs=batch_id)
+        self.assertEqual(len(squeue), 10)
+        for idx in squeue.index.values:
+            self.assertTrue(idx.startswith(batch_id + '_'))
+        self.assertEqual(squeue.loc['1001_0', 'ST'], 'R')
+        self.assertEqual(squeue.loc['1001_0', 'TIME'][:2], '1:')
+        self.assertEqual(squeue.loc['1001_9', 'NODELIST(REASON)'], '(Resources)')
+        self.assertEqual(squeue.CPUS.sum(), 20)
+
+        sacct = self.backend.sacct(
+            "D",
+            job=batch_id,
+            format="JobId%50,State,ExitCode,CPUTimeRAW,ResvCPURAW,Submit"
+        )
+        self.assertListEqual(list(sacct.columns), ['State', 'ExitCode', 'CPUTimeRAW', 'ResvCPURAW', 'Submit'])
+        self.assertEqual(len(sacct), 20)
+        self.assertEqual(sacct.loc['1001_0', 'CPUTimeRAW'], '120')
+        self.assertEqual(sacct.loc['1001_0', 'ExitCode'], '0:0')
+        self.assertTrue(sacct.ResvCPURAW.isna().all())
+        self.assertEqual(sacct.loc['1001_0.batch', 'State'], 'COMPLETED')
+        self.assertEqual(self.backend.sacct(job=batch_id).loc['1001_3', 'AllocCPUS'], '2')
+
+        self.backend.scancel(batch_id)
+        self.assertEqual(len(self.backend.squeue()), 0)
+
+    @with_timeout(30)
+    def test_sinfo(self):
+        sinfo = self.backend.sinfo()
+        self.assertEqual(sinfo.NODES.sum(), 5)
+        self.assertListEqual(sorted(sinfo.STATE), ['idle', 'idle~'])
+        self.assertTrue((sinfo.loc['main*', 'AVAIL'] == 'up').all())
+        nodes = self.backend.sinfo('N')
+        self.assertEqual(nodes.loc['worker4', 'STATE'], 'idle~')
+        self.backend.wait_for_cluster_ready(elastic=False)
+
+    @with_timeout(30)
+    def test_keepalive(self):
+        for i in range(200):
+            self.backend.squeue(fresh=True)
+        self.assertEqual(len(self.server.requests), 200)
+        self.assertEqual(len(self.server.connections), 1)
+
+    @with_timeout(30)
+    def test_errors(self):
+        backend = SlurmRestdBackend(
+            'http://127.0.0.1:{}'.format(self.server.server_address[1]),
+            token='bad-token',
+            user='root'
+        )
+        with self.assertRaises(SlurmRestdError) as context:
+            backend.squeue()
+        self.assertEqual(context.exception.returncode, 401)
+        self.assertFalse(backend.ping())
+        backend.__exit__()
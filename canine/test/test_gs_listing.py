@@ -0,0 +1,139 @@
+import unittest
+import unittest.mock
+import tempfile
+import os
+import io
+import time
+from types import SimpleNamespace
+from canine.localization.listing import GSListingIndex, RequesterPaysCache
+from canine.localization.local import BatchedLocalizer
+
+# gs://bucket contents: {name: (size, generation)}
+OBJECTS = {
+    'a/x.bam': (10, 1),
+    'a/x.bam.bai': (1, 2),
+    'a/y.bam': (20, 3),
+    'a/dir/1.txt': (5, 4),
+    'a/dir/sub/2.txt': (6, 5),
+    'b/z.bam': (30, 6),
+}
+
+class FakeBucket(object):
+    """
+    Lists OBJECTS like google.cloud.storage.Bucket.list_blobs
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def list_blobs(self, prefix, delimiter=None, fields=None):
+        self.requests.append((prefix, delimiter))
+        blobs = SimpleNamespace(prefixes=set(), pages=[[]])
+        for name, (size, generation) in sorted(OBJECTS.items()):
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if delimiter is not None and delimiter in rest:
+                blobs.prefixes.add(prefix + rest[:rest.index(delimiter) + 1])
+            else:
+                blobs.pages[0].append(SimpleNamespace(name=name, size=str(size), generation=generation))
+        return blobs
+
+class TestUnit(unittest.TestCase):
+    """
+    Tests the gs:// listing index
+    """
+
+    def setUp(self):
+        self.bucket = FakeBucket()
+        self.patch = unittest.mock.patch('canine.localization.listing._getblob_bucket', return_value=self.bucket)
+        self.getblob = self.patch.start()
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.env = unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tempdir.name})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.tempdir.cleanup()
+        self.patch.stop()
+
+    def test_lookup(self):
+        index = GSListingIndex(lambda bucket: 'my-project')
+        index.prefetch(['gs://bucket/a/x.bam', 'gs://bucket/a/y.bam', 'gs://bucket/a/dir', 'gs://bucket/b/z.bam'])
+        # shared parents are listed once, other paths individually
+        self.assertListEqual(sorted(self.bucket.requests), [('a/', '/'), ('b/z.bam', '/')])
+        self.getblob.assert_called_with(None, 'bucket', 'my-project')
+
+        self.assertTupleEqual(index.stat('gs://bucket/a/x.bam'), (10, 1))
+        self.assertIsNone(index.stat('gs://bucket/a/missing.bam'))
+        self.assertTrue(index.is_directory('gs://bucket/a/dir'))
+        self.assertFalse(index.is_directory('gs://bucket/a/x.bam'))
+        self.assertFalse(index.is_directory('gs://bucket/a/missing.bam'))
+        self.assertEqual(index.size('gs://bucket/b/z.bam'), 30)
+        self.assertEqual(len(self.bucket.requests), 2)
+
+        self.assertEqual(index.size('gs://bucket/a/dir'), 11)
+        self.assertEqual(self.bucket.requests[-1], ('a/dir/', None))
+        with self.assertRaises(FileNotFoundError):
+            index.size('gs://bucket/c/missing.bam')
+
+    def test_disk_cache(self):
+        GSListingIndex(cache_ttl=60).prefetch(['gs://bucket/a/x.bam', 'gs://bucket/a/y.bam'])
+        self.assertEqual(len(self.bucket.requests), 1)
+
+        # a later index reuses the saved listing
+        index = GSListingIndex(cache_ttl=60)
+        index.prefetch(['gs://bucket/a/x.bam', 'gs://bucket/a/y.bam'])
+        self.assertTupleEqual(index.stat('gs://bucket/a/y.bam'), (20, 3))
+        self.assertEqual(len(self.bucket.requests), 1)
+
+        # unless it has expired
+        GSListingIndex(cache_ttl=-1).listing('bucket', 'a/')
+        self.assertEqual(len(self.bucket.requests), 2)
+
+        # writes drop cached listings of the path
+        index.invalidate('gs://bucket/a/new.bam')
+        self.assertFalse(os.path.exists(index.cache_path(('bucket', 'a/', False))))
+        index.stat('gs://bucket/a/new.bam')
+        self.assertEqual(len(self.bucket.requests), 3)
+
+    def test_requester_pays_cache(self):
+        cache = RequesterPaysCache()
+        self.assertIsNone(cache.get('bucket'))
+        cache.update({'bucket': True})
+        self.assertTrue(cache.get('bucket'))
+
+        # entries are shared between instances, and merged when saved
+        other = RequesterPaysCache()
+        self.assertTrue(other.get('bucket'))
+        cache.update({'other': False})
+        other.update({'third': True})
+        self.assertDictEqual({bucket: entry[0] for bucket, entry in RequesterPaysCache().entries.items()}, {'bucket': True, 'other': False, 'third': True})
+
+        expired = RequesterPaysCache(ttl=60)
+        expired.entries['bucket'][1] = time.time() - 120
+        self.assertIsNone(expired.get('bucket'))
+
+    def test_prefetch_requester_pays(self):
+        backend = unittest.mock.MagicMock()
+        backend.invoke_many.side_effect = lambda commands: [
+            (0, io.BytesIO('{}: {}'.format(command.split()[-1], 'Enabled' if 'gs://rp' in command else 'Disabled').encode()), io.BytesIO(b''))
+            for command in commands
+        ]
+        inputs = {
+            '0': {'a': 'gs://rp/x', 'b': ['gs://free/y', 'gs://rp/z'], 'c': 'string'},
+            '1': None
+        }
+        localizer = BatchedLocalizer(backend, project='my-project')
+        localizer.prefetch_requester_pays(inputs)
+        # every bucket is checked in one batch
+        self.assertEqual(backend.invoke_many.call_count, 1)
+        self.assertTrue(localizer.get_requester_pays('gs://rp/other'))
+        self.assertFalse(localizer.get_requester_pays('gs://free/y'))
+        backend.invoke.assert_not_called()
+
+        # later pipelines reuse the results
+        localizer = BatchedLocalizer(backend, project='my-project')
+        localizer.prefetch_requester_pays(inputs)
+        self.assertTrue(localizer.get_requester_pays('gs://rp/x'))
+        self.assertEqual(backend.invoke_many.call_count, 1)
@@ -0,0 +1,126 @@
+import unittest
+import unittest.mock
+import tempfile
+import threading
+import subprocess
+import socket
+import json
+import os
+import time
+from canine.backends.lease import Lease
+from timeout_decorator import timeout as with_timeout
+
+class TestUnit(unittest.TestCase):
+    """
+    Tests cluster keep-alive leases
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'lease.json')
+        # Stand in for the watchdog process with one that is always alive
+        self.patch = unittest.mock.patch.object(Lease, 'spawn_watchdog', return_value=os.getpid())
+        self.spawn = self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tempdir.cleanup()
+
+    def read(self):
+        with open(self.path) as r:
+            return json.load(r)
+
+    def test_acquire_release(self):
+        lease = Lease(self.path)
+        self.assertFalse(lease.acquire(5, create=False))
+        self.assertFalse(lease.exists())
+        with self.assertRaises(ValueError):
+            lease.acquire()
+        self.assertTrue(lease.acquire(5))
+        self.assertListEqual(self.read()['holders'], [lease.holder])
+        # joining a lease keeps its TTL unless one is given
+        self.assertTrue(lease.acquire(create=False))
+        self.assertEqual(self.read()['ttl'], 5)
+        self.assertEqual(len(self.read()['holders']), 1)
+
+        lease.release()
+        state = self.read()
+        self.assertListEqual(state['holders'], [])
+        self.assertEqual(state['watchdog'], '{}:{}'.format(socket.gethostname(), os.getpid()))
+        # a live watchdog is not replaced
+        lease.acquire()
+        lease.release()
+        self.assertEqual(self.spawn.call_count, 1)
+
+        lease.remove()
+        self.assertFalse(lease.exists())
+
+    @with_timeout(30)
+    def test_watch(self):
+        lease = Lease(self.path)
+        lease.acquire(0.02)
+        # holders which exit without releasing do not keep the cluster alive
+        proc = subprocess.Popen(['true'])
+        proc.wait()
+        state = self.read()
+        state['holders'] = ['{}:{}'.format(socket.gethostname(), proc.pid), 'otherhost:1']
+        with open(self.path, 'w') as w:
+            json.dump(state, w)
+
+        teardowns = []
+        start = time.monotonic()
+        thread = threading.Thread(target=lambda: teardowns.append(lease.watch(lambda: teardowns.append(time.monotonic()), interval=0.1)))
+        thread.start()
+        time.sleep(0.5)
+        # holders on other hosts are trusted until they release
+        self.assertListEqual(self.read()['holders'], ['otherhost:1'])
+        self.assertListEqual(teardowns, [])
+
+        state = self.read()
+        state['holders'] = []
+        state['released'] = time.time()
+        with open(self.path, 'w') as w:
+            json.dump(state, w)
+        thread.join()
+        self.assertEqual(len(teardowns), 2)
+        self.assertGreaterEqual(teardowns[0] - start, 1.2)
+        self.assertTrue(teardowns[1])
+        self.assertFalse(lease.exists())
+
+    @with_timeout(30)
+    def test_acquire_while_stopping(self):
+        lease = Lease(self.path)
+        lease.acquire(5)
+        proc = subprocess.Popen(['sleep', '1'])
+        state = self.read()
+        state['holders'] = []
+        state['stopping'] = '{}:{}'.format(socket.gethostname(), proc.pid)
+        with open(self.path, 'w') as w:
+            json.dump(state, w)
+        reaper = threading.Thread(target=proc.wait)
+        reaper.start()
+        self.assertFalse(lease.acquire(5))
+        reaper.join()
+        # once the teardown process is gone, a new lease can be created
+        self.assertTrue(lease.acquire(5))
+        self.assertNotIn('stopping', self.read())
+
+    @with_timeout(30)
+    def test_wait_stopped(self):
+        lease = Lease(self.path)
+        self.assertFalse(lease.wait_stopped())
+        lease.acquire(5)
+        self.assertFalse(lease.wait_stopped())
+        proc = subprocess.Popen(['sleep', '1'])
+        state = self.read()
+        state['holders'] = []
+        state['stopping'] = '{}:{}'.format(socket.gethostname(), proc.pid)
+        with open(self.path, 'w') as w:
+            json.dump(state, w)
+        reaper = threading.Thread(target=proc.wait)
+        reaper.start()
+        self.assertTrue(lease.wait_stopped())
+        reaper.join()
+        # a finished teardown is not waited on again, and does not block a new lease
+        self.assertFalse(lease.wait_stopped())
+        self.assertTrue(lease.acquire(5))
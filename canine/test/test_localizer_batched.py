@@ -15,18 +15,28 @@ import agutil
 STAGING_DIR = './ci_tmp' if 'CI' in os.environ else None
 WARNING_CONTEXT = None
 BACKEND = None
+CACHE_DIR = None
+CACHE_CONTEXT = None
 
 @with_timeout(120)
 def setUpModule():
     global WARNING_CONTEXT
     global BACKEND
+    global CACHE_DIR
+    global CACHE_CONTEXT
     WARNING_CONTEXT = warnings.catch_warnings()
     WARNING_CONTEXT.__enter__()
     warnings.simplefilter('ignore', ResourceWarning)
     BACKEND = DummySlurmBackend(n_workers=1, staging_dir=STAGING_DIR)
     BACKEND.__enter__()
+    # keep gs:// listing and requester pays caches out of the user's cache
+    CACHE_DIR = tempfile.TemporaryDirectory()
+    CACHE_CONTEXT = unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': CACHE_DIR.name})
+    CACHE_CONTEXT.__enter__()
 
 def tearDownModule():
+    CACHE_CONTEXT.__exit__()
+    CACHE_DIR.cleanup()
     BACKEND.__exit__()
     WARNING_CONTEXT.__exit__()
 
@@ -341,6 +351,35 @@ class TestIntegration(unittest.TestCase):
                                     ('-p {} "{}"'.format(name, pattern) in teardown_text)
                                 )
 
+    @with_timeout(10)
+    def test_local_inputs(self):
+        sizes = {'gs://foo/a.bam': 40 * 1024**3, 'gs://bar/a.bam': 1024}
+        directories = {'gs://foo/dir': 1024}
+        for disk_type in ['standard', None]:
+            with self.subTest(temporary_disk_type=disk_type), BatchedLocalizer(BACKEND, temporary_disk_type=disk_type) as localizer:
+                localizer.get_object_size = unittest.mock.MagicMock(side_effect={**sizes, **directories}.get)
+                localizer.get_requester_pays = unittest.mock.MagicMock(return_value=False)
+                localizer.is_gs_directory = unittest.mock.MagicMock(side_effect=directories.__contains__)
+                with localizer.transport_context() as transport:
+                    localizer.prepare_job_inputs('0', {'bam': [*sizes], 'dir': 'gs://foo/dir', 'string': 'hey!'}, {}, {'bam': 'local', 'dir': 'local'}, transport=transport)
+                self.assertListEqual(localizer.inputs['0']['bam'], [Localization('local', path) for path in sizes])
+                self.assertEqual(localizer.local_download_size['0'], sum(sizes.values()) + 1024)
+
+                setup_text, localization_text, teardown_text, array_exports = localizer.job_setup_teardown('0', {'stdout': '../stdout'})
+                if disk_type is None:
+                    # downloaded to the node's boot disk, and cleaned up afterwards
+                    local_dir = os.path.join(localizer.local_download_dir, '0')
+                    self.assertNotIn('gcloud compute disks create', localization_text)
+                    self.assertIn('rm -rf {}'.format(local_dir), teardown_text)
+                else:
+                    self.assertIn('export CANINE_LOCAL_DISK_SIZE=43GB', setup_text)
+                    local_dir = [line for line in setup_text.split('\n') if line.startswith('export CANINE_LOCAL_DISK_DIR=')][0].split('=')[1]
+                    self.assertIn('gcloud compute disks delete', teardown_text)
+                # inputs sharing a basename keep it, in a subdirectory per gs:// directory
+                self.assertListEqual(array_exports['bam'], [os.path.join(local_dir, '1', 'a.bam'), os.path.join(local_dir, '2', 'a.bam')])
+                self.assertIn('cp gs://bar/a.bam {}'.format(os.path.join(local_dir, '2', 'a.bam')), localization_text)
+                self.assertIn('cp -r gs://foo/dir {}'.format(os.path.join(local_dir, '1')), localization_text)
+
     @with_timeout(30)
     def test_localize_delocalize(self):
         """
@@ -3,6 +3,8 @@ import unittest.mock
 import tempfile
 import os
 import stat
+import shlex
+import subprocess
 import warnings
 import time
 from contextlib import contextmanager
@@ -14,18 +16,28 @@ from timeout_decorator import timeout as with_timeout
 STAGING_DIR = './ci_tmp' if 'CI' in os.environ else None
 WARNING_CONTEXT = None
 BACKEND = None
+CACHE_DIR = None
+CACHE_CONTEXT = None
 
 @with_timeout(120)
 def setUpModule():
     global WARNING_CONTEXT
     global BACKEND
+    global CACHE_DIR
+    global CACHE_CONTEXT
     WARNING_CONTEXT = warnings.catch_warnings()
     WARNING_CONTEXT.__enter__()
     warnings.simplefilter('ignore', ResourceWarning)
     BACKEND = DummySlurmBackend(n_workers=1, staging_dir=STAGING_DIR)
     BACKEND.__enter__()
+    # keep gs:// listing and requester pays caches out of the user's cache
+    CACHE_DIR = tempfile.TemporaryDirectory()
+    CACHE_CONTEXT = unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': CACHE_DIR.name})
+    CACHE_CONTEXT.__enter__()
 
 def tearDownModule():
+    CACHE_CONTEXT.__exit__()
+    CACHE_DIR.cleanup()
     BACKEND.__exit__()
     WARNING_CONTEXT.__exit__()
 
@@ -68,6 +80,57 @@ class TestUnit(unittest.TestCase):
                 self.localizer.queued_batch
             )
 
+    def test_gs_copy_many(self):
+        def fake_gsutil(command, **kwargs):
+            # Stands in for bash -c 'gsutil -m cp -c -L log -I dest < manifest 2>&1 | tee output'
+            args = shlex.split(shlex.split(command)[-1])
+            log, dest, manifest, output = args[args.index('-L') + 1], args[args.index('-I') + 1], args[args.index('<') + 1], args[-1]
+            with open(manifest) as r:
+                sources = r.read().split()
+            if any('denied' in src for src in sources):
+                with open(output, 'w') as w:
+                    w.write('AccessDeniedException: 403 Forbidden\n')
+                return subprocess.CompletedProcess(command, 1)
+            with open(log, 'w') as w:
+                w.write('Source,Destination,Result,Description\n')
+                for src in sources:
+                    if 'missing' in src:
+                        w.write('{},,error,No URLs matched\n'.format(src))
+                    else:
+                        makefile(os.path.join(dest, os.path.basename(src)))
+                        w.write('{},,OK,\n'.format(src))
+            return subprocess.CompletedProcess(command, 1 if any('missing' in src for src in sources) else 0)
+
+        with unittest.mock.patch.object(self.localizer, 'is_gs_directory', return_value=False), \
+             unittest.mock.patch.object(self.localizer, 'get_requester_pays', return_value=False), \
+             unittest.mock.patch('canine.localization.base.subprocess.run', side_effect=fake_gsutil) as run:
+            failures = self.localizer.gs_copy_many(
+                [
+                    ('gs://foo/a/data.bam', self.localizer.reserve_path('jobs', '0', 'inputs', 'data.bam').localpath),
+                    ('gs://foo/a/data.bam', self.localizer.reserve_path('jobs', '1', 'inputs', 'data.bam').localpath),
+                    ('gs://foo/b/data.bam', self.localizer.reserve_path('jobs', '2', 'inputs', 'data.bam').localpath),
+                    ('gs://foo/missing.bam', self.localizer.reserve_path('jobs', '3', 'inputs', 'missing.bam').localpath),
+                ],
+                'local'
+            )
+            # objects sharing a basename are downloaded in separate batches
+            self.assertEqual(run.call_count, 2)
+        self.assertDictEqual(failures, {'gs://foo/missing.bam': 'No URLs matched'})
+        for jid in range(3):
+            self.assertTrue(os.path.isfile(self.localizer.reserve_path('jobs', jid, 'inputs', 'data.bam').localpath))
+        self.assertListEqual(os.listdir(self.localizer.reserve_path('.gs_transfer').localpath), [])
+
+        # gsutil's output explains objects which were never attempted
+        with unittest.mock.patch.object(self.localizer, 'is_gs_directory', return_value=False), \
+             unittest.mock.patch.object(self.localizer, 'get_requester_pays', return_value=False), \
+             unittest.mock.patch('canine.localization.base.subprocess.run', side_effect=fake_gsutil):
+            failures = self.localizer.gs_copy_many(
+                [('gs://denied/data.bam', self.localizer.reserve_path('jobs', '4', 'inputs', 'data.bam').localpath)],
+                'local'
+            )
+        self.assertDictEqual(failures, {'gs://denied/data.bam': 'Not copied (gsutil exited with status 1): AccessDeniedException: 403 Forbidden'})
+        self.assertListEqual(os.listdir(self.localizer.reserve_path('.gs_transfer').localpath), [])
+
 class TestIntegration(unittest.TestCase):
     """
     Tests high-level features of the localizer
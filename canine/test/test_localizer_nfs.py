@@ -14,11 +14,15 @@ from timeout_decorator import timeout as with_timeout
 
 STAGING_DIR = './ci_tmp' if 'CI' in os.environ else None
 BACKEND = None
+CACHE_DIR = None
+CACHE_CONTEXT = None
 
 @with_timeout(120)
 def setUpModule():
     global WARNING_CONTEXT
     global BACKEND
+    global CACHE_DIR
+    global CACHE_CONTEXT
     WARNING_CONTEXT = warnings.catch_warnings()
     WARNING_CONTEXT.__enter__()
     warnings.simplefilter('ignore', ResourceWarning)
@@ -29,8 +33,14 @@ def setUpModule():
             if not transport.isdir(os.path.dirname(BACKEND.bind_path.name)):
                 transport.makedirs(os.path.dirname(BACKEND.bind_path.name))
                 transport.mklink('/mnt/nfs', BACKEND.bind_path.name)
+    # keep gs:// listing and requester pays caches out of the user's cache
+    CACHE_DIR = tempfile.TemporaryDirectory()
+    CACHE_CONTEXT = unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': CACHE_DIR.name})
+    CACHE_CONTEXT.__enter__()
 
 def tearDownModule():
+    CACHE_CONTEXT.__exit__()
+    CACHE_DIR.cleanup()
     BACKEND.__exit__()
     WARNING_CONTEXT.__exit__()
 
@@ -14,18 +14,28 @@ from timeout_decorator import timeout as with_timeout
 STAGING_DIR = './ci_tmp' if 'CI' in os.environ else None
 WARNING_CONTEXT = None
 BACKEND = None
+CACHE_DIR = None
+CACHE_CONTEXT = None
 
 @with_timeout(120)
 def setUpModule():
     global WARNING_CONTEXT
     global BACKEND
+    global CACHE_DIR
+    global CACHE_CONTEXT
     WARNING_CONTEXT = warnings.catch_warnings()
     WARNING_CONTEXT.__enter__()
     warnings.simplefilter('ignore', ResourceWarning)
     BACKEND = DummySlurmBackend(n_workers=1, staging_dir=STAGING_DIR)
     BACKEND.__enter__()
+    # keep gs:// listing and requester pays caches out of the user's cache
+    CACHE_DIR = tempfile.TemporaryDirectory()
+    CACHE_CONTEXT = unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': CACHE_DIR.name})
+    CACHE_CONTEXT.__enter__()
 
 def tearDownModule():
+    CACHE_CONTEXT.__exit__()
+    CACHE_DIR.cleanup()
     BACKEND.__exit__()
     WARNING_CONTEXT.__exit__()
 
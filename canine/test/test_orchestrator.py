@@ -212,6 +212,33 @@ class TestUnit(unittest.TestCase):
         self.assertTrue((df[('job', 'cpu_seconds')] == 5).all())
         self.assertTrue((df[('inputs', 'common_file')] == __file__).all())
         self.assertTrue((df[('outputs', 'output-glob')] == 3).all())
+        self.assertFalse(df[('job', 'on_demand')].any())
+
+    def test_preemption_fallback(self):
+        self.orchestrator.preemption_fallback = {'max_preemptions': 2, 'runtime': 600, 'partition': None}
+        self.orchestrator.on_demand_jobs = {}
+        acct = pd.DataFrame(
+            {'State': ['RUNNING', 'PENDING', 'REQUEUED', 'COMPLETED'], 'n_preempted': [0, 1, 2, 0]},
+            index=['7_0', '7_1', '7_2', '7_3']
+        )
+        elapsed = pd.DataFrame({'State': ['COMPLETED', 'COMPLETED'], 'ElapsedRaw': ['300', '500']}, index=['7_3', '7_3.batch'])
+        try:
+            with unittest.mock.patch.object(self.orchestrator.backend, 'sacct', return_value=elapsed), \
+              unittest.mock.patch.object(self.orchestrator.backend, 'request_on_demand', side_effect=lambda jobs, partition: jobs) as request:
+                # only the shard preempted twice is moved while shards run shorter than 600s
+                self.assertListEqual(self.orchestrator.apply_preemption_fallback('7', acct, ['7_0', '7_1', '7_2']), ['7_2'])
+                request.assert_called_once_with(['7_2'], partition=None)
+                self.assertListEqual(self.orchestrator.apply_preemption_fallback('7', acct, ['7_0', '7_1', '7_2']), [])
+
+                elapsed['ElapsedRaw'] = ['900', '900']
+                self.assertListEqual(self.orchestrator.apply_preemption_fallback('7', acct, ['7_0', '7_1', '7_2']), ['7_1'])
+            self.assertDictEqual(self.orchestrator.on_demand_jobs, {
+                '7_2': 'preempted 2 times',
+                '7_1': 'preempted with expected runtime of 900s'
+            })
+        finally:
+            self.orchestrator.preemption_fallback = None
+            self.orchestrator.on_demand_jobs = {}
 
     @with_timeout(20)
     def test_job_submit(self):
@@ -0,0 +1,207 @@
+import unittest
+import io
+import os
+import time
+import threading
+from canine.backends.base import AbstractSlurmBackend, _status_state
+from timeout_decorator import timeout as with_timeout
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+class FixtureSlurmBackend(AbstractSlurmBackend):
+    """
+    Backend which answers slurm commands with saved output
+    """
+
+    def __init__(self, status_cache_ttl=None, **fixtures):
+        super().__init__(status_cache_ttl=status_cache_ttl)
+        self.fixtures = fixtures
+        self.commands = []
+
+    def invoke(self, command, interactive=False, **kwargs):
+        self.commands.append(command)
+        output = self.fixtures[command.split()[0]]
+        if not isinstance(output, bytes):
+            with open(os.path.join(FIXTURES, output), 'rb') as r:
+                output = r.read()
+        return 0, io.BytesIO(output), io.BytesIO()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def transport(self):
+        raise NotImplementedError()
+
+class TestUnit(unittest.TestCase):
+    """
+    Tests parsing of squeue, sacct, and sinfo output
+    """
+
+    def test_squeue(self):
+        backend = FixtureSlurmBackend(squeue='squeue.txt')
+        df = backend.squeue('array', jobs='4127')
+        self.assertIn("--format='%i|%P|%j|%u|%t|%M|%D|%C|%R'", backend.commands[-1])
+        self.assertEqual(len(df), 14)
+        self.assertListEqual(
+            list(df.columns),
+            ['PARTITION', 'NAME', 'USER', 'ST', 'TIME', 'NODES', 'CPUS', 'NODELIST(REASON)']
+        )
+        self.assertTrue((df.index == df.index.map(str)).all())
+        self.assertEqual(df.NODES.sum(), 15)
+        # CPUS is not a default squeue column; it is requested with %C
+        self.assertEqual(df.CPUS.dtype, int)
+        self.assertEqual(df.CPUS.sum(), 68)
+        self.assertEqual(df.loc['4127_0', 'CPUS'], 4)
+        self.assertEqual(df.loc['4127_2', 'NODELIST(REASON)'], 'slurm-canine-worker0011')
+        self.assertEqual(df.loc['4130', 'TIME'], '1-03:12:55')
+        self.assertEqual(
+            df.loc['4127_11', 'NODELIST(REASON)'],
+            '(Nodes required for job are DOWN, DRAINED or reserved for jobs in higher priority partitions)'
+        )
+
+        backend = FixtureSlurmBackend(squeue=b'JOBID|PARTITION|NAME|USER|ST|TIME|NODES|CPUS|NODELIST(REASON)\n')
+        self.assertTrue(backend.squeue().empty)
+
+    def test_squeue_custom_format(self):
+        backend = FixtureSlurmBackend(squeue=b'JOBID  STATE\n   12  RUNNING\n')
+        df = backend.squeue(format='%.5i %.8T')
+        self.assertEqual(backend.commands[-1].count('--format'), 1)
+        self.assertEqual(df.loc['12', 'STATE'], 'RUNNING')
+
+    def test_sacct(self):
+        backend = FixtureSlurmBackend(sacct='sacct.txt')
+        df = backend.sacct()
+        self.assertIn('--parsable2', backend.commands[-1])
+        self.assertEqual(len(df), 16)
+        job = df.iloc[-2]
+        self.assertEqual(job.JobName, 'ls')
+        self.assertEqual(job.Partition, 'slurmind')
+        self.assertEqual(job.Account, 'root')
+        self.assertEqual(job.AllocCPUS, '1')
+        self.assertEqual(job.State, 'COMPLETED')
+        self.assertEqual(job.ExitCode, '0:0')
+        self.assertEqual(df.loc['4126', 'JobName'], 'NA')
+        self.assertEqual(df.loc['4126', 'State'], 'CANCELLED by 0')
+        self.assertTrue(df.loc['4125_0.batch', ['Partition']].isna().all())
+
+        backend = FixtureSlurmBackend(sacct='sacct_format.txt')
+        df = backend.sacct(
+            "D",
+            job='4125',
+            format="JobId%50,State,ExitCode,CPUTimeRAW,ResvCPURAW,Submit"
+        ).astype({'CPUTimeRAW': int, "ResvCPURAW": float})
+        self.assertEqual(df.CPUTimeRAW.sum(), 5982)
+        self.assertEqual(df.ResvCPURAW.isna().sum(), 4)
+        self.assertEqual(len(df.loc['4125_2']), 2)
+
+    def test_node_usage(self):
+        backend = FixtureSlurmBackend(sacct=(
+            b'JobID|NodeList|Start|End|AllocCPUS\n'
+            b'4125_0|w1|2020-01-01T00:00:00|2020-01-01T01:00:00|2\n'
+            b'4125_0.batch|w1|2020-01-01T00:00:00|2020-01-01T01:00:00|2\n'
+            b'4125_1|w1|2020-01-01T00:30:00|2020-01-01T02:00:00|2\n'
+            b'4125_2|w[2-3]|2020-01-01T00:00:00|2020-01-01T00:30:00|4\n'
+            b'4125_2|w2|2020-01-01T01:00:00|2020-01-01T02:00:00|1\n'
+            b'4125_3|None assigned|Unknown|Unknown|1\n'
+        ))
+        usage = backend.node_usage('4125')
+        self.assertIn('--format=JobId,NodeList,Start,End,AllocCPUS', backend.commands[-1])
+        self.assertEqual(len(usage), 5)
+        # overlapping tasks on a node are counted once
+        self.assertDictEqual(backend.busy_node_hours(usage), {'w1': 2.0, 'w2': 1.5, 'w3': 0.5})
+        self.assertDictEqual(backend.task_cpu_hours(usage), {
+            '4125_0': {'w1': 2.0},
+            '4125_1': {'w1': 3.0},
+            '4125_2': {'w2': 2.0, 'w3': 1.0}
+        })
+
+    def test_sinfo(self):
+        backend = FixtureSlurmBackend(sinfo='sinfo.txt')
+        df = backend.sinfo()
+        self.assertIn("--format='%P|%a|%l|%D|%t|%N'", backend.commands[-1])
+        self.assertEqual(df.NODES.sum(), 34)
+        default = df.index[df.index.str.contains(r"\*$")]
+        self.assertEqual(len(default), 4)
+        self.assertTrue((df.loc[default, 'AVAIL'] == 'up').all())
+        self.assertTrue(df.loc[default, "STATE"].str.contains(r"(?:mix|idle~?|completing|alloc)$").any())
+
+        backend = FixtureSlurmBackend(sinfo='sinfo_node.txt')
+        df = backend.sinfo('N')
+        self.assertIn("--format='%N|%D|%P|%t'", backend.commands[-1])
+        self.assertEqual(df.loc['slurm-canine-worker0021', 'STATE'], 'idle~')
+
+    @with_timeout(30)
+    def test_large_output(self):
+        with open(os.path.join(FIXTURES, 'squeue.txt'), 'rb') as r:
+            header = r.readline()
+        rows = [
+            '9000_{0}|main|canine_pipeline|aarong|R|1:{1:02d}:00|1|2|slurm-canine-worker{0:04d}\n'.format(i, i % 60).encode()
+            for i in range(200000)
+        ]
+        backend = FixtureSlurmBackend(squeue=header + b''.join(rows))
+        start = time.monotonic()
+        df = backend.squeue('array')
+        elapsed = time.monotonic() - start
+        self.assertEqual(len(df), 200000)
+        self.assertEqual(df.CPUS.sum(), 400000)
+        self.assertEqual(df.loc['9000_199999', 'NODELIST(REASON)'], 'slurm-canine-worker199999')
+        self.assertLess(elapsed, 10)
+
+    @with_timeout(30)
+    def test_status_cache(self):
+        backend = FixtureSlurmBackend(squeue='squeue.txt', sinfo='sinfo.txt', sbatch=b'Submitted batch job 4131\n')
+        backend.status_cache_ttl = 60
+        df = backend.squeue('array', jobs='4127')
+        # Cached results are shared, but callers get their own copy
+        df.drop(df.index, inplace=True)
+        self.assertEqual(len(backend.squeue('array', jobs='4127')), 14)
+        self.assertEqual(len(backend.commands), 1)
+        # Different queries do not share results
+        backend.squeue('array')
+        backend.sinfo()
+        self.assertEqual(len(backend.commands), 3)
+        # Fresh queries always run, and refresh the cache
+        backend.squeue('array', fresh=True)
+        self.assertEqual(len(backend.commands), 4)
+        backend.squeue('array')
+        self.assertEqual(len(backend.commands), 4)
+        # Submitting jobs invalidates the cache
+        backend.sbatch('script.sh')
+        backend.squeue('array')
+        self.assertEqual(len(backend.commands), 6)
+        # Expired results are not reused
+        backend.status_cache_ttl = 0
+        backend.squeue('array')
+        self.assertEqual(len(backend.commands), 7)
+
+    @with_timeout(30)
+    def test_status_coalescing(self):
+        backend = FixtureSlurmBackend(squeue='squeue.txt', status_cache_ttl=0)
+        release = threading.Event()
+        invoke = backend.invoke
+
+        def slow_invoke(command, interactive=False, **kwargs):
+            release.wait()
+            return invoke(command, interactive, **kwargs)
+
+        backend.invoke = slow_invoke
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(backend.squeue('array')))
+            for i in range(16)
+        ]
+        for thread in threads:
+            thread.start()
+        # Wait for every caller to join the running query
+        while _status_state(backend).merged < 15:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(backend.commands), 1)
+        self.assertEqual(len(results), 16)
+        self.assertEqual(len({id(df) for df in results}), 16)
+        self.assertTrue(all(len(df) == 14 for df in results))
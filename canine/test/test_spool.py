@@ -0,0 +1,118 @@
+import unittest
+import tempfile
+import threading
+import subprocess
+import json
+import os
+import time
+from canine.backends.local import LocalTransport
+from canine.orchestrator import ENTRYPOINT
+from canine.spool import SpoolWatcher
+from timeout_decorator import timeout as with_timeout
+
+def write_record(spool, array_job_id, task, **record):
+    path = os.path.join(spool, '{}_{}.json'.format(array_job_id, task))
+    tmp = os.path.join(spool, '.{}_{}.json'.format(array_job_id, task))
+    with open(tmp, 'w') as w:
+        json.dump({'job': str(task), 'array_job_id': str(array_job_id), **record}, w)
+    os.rename(tmp, path)
+
+class TestUnit(unittest.TestCase):
+    """
+    Tests the job completion spool
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.spool = os.path.join(self.tempdir.name, '.spool')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_scan(self):
+        with SpoolWatcher(self.spool, '42', LocalTransport()) as watcher:
+            self.assertDictEqual(watcher.scan(), {})
+            write_record(self.spool, 41, 0, exit_code=0)
+            write_record(self.spool, 42, 0, exit_code=0)
+            write_record(self.spool, 42, 1, exit_code=1)
+            with open(os.path.join(self.spool, '.42_2.json'), 'w') as w:
+                w.write('{"job": "2"')
+            with open(os.path.join(self.spool, '42_3.json'), 'w') as w:
+                w.write('not json')
+            records = watcher.scan()
+            self.assertListEqual(sorted(records), ['0', '1'])
+            self.assertEqual(records['1']['exit_code'], 1)
+            # Records are only reported once
+            self.assertDictEqual(watcher.scan(), {})
+            write_record(self.spool, 42, 2, exit_code=0)
+            self.assertListEqual(list(watcher.scan()), ['2'])
+
+    @with_timeout(30)
+    def test_wait(self):
+        with SpoolWatcher(self.spool, '42', LocalTransport(), scan_interval=0.25) as watcher:
+            start = time.monotonic()
+            self.assertDictEqual(watcher.wait(1), {})
+            self.assertGreaterEqual(time.monotonic() - start, 1)
+
+            timer = threading.Timer(0.5, write_record, args=(self.spool, 42, 7), kwargs={'exit_code': 0})
+            timer.start()
+            start = time.monotonic()
+            self.assertListEqual(list(watcher.wait(20)), ['7'])
+            self.assertLess(time.monotonic() - start, 5)
+            timer.join()
+
+    @with_timeout(30)
+    def test_inotify(self):
+        # With a long scan interval, new records must be noticed through inotify
+        with SpoolWatcher(self.spool, '42', LocalTransport(), scan_interval=60) as watcher:
+            if watcher._inotify is None:
+                self.skipTest("inotify is not available")
+            timer = threading.Timer(0.5, write_record, args=(self.spool, 42, 3), kwargs={'exit_code': 0})
+            timer.start()
+            start = time.monotonic()
+            self.assertListEqual(list(watcher.wait(20)), ['3'])
+            self.assertLess(time.monotonic() - start, 5)
+            timer.join()
+
+    @with_timeout(30)
+    def test_entrypoint(self):
+        root = self.tempdir.name
+        workspace = os.path.join(root, 'jobs', '5', 'workspace')
+        os.makedirs(workspace)
+        for script in ['setup.sh', 'localization.sh', 'teardown.sh']:
+            with open(os.path.join(root, 'jobs', '5', script), 'w') as w:
+                w.write('#!/bin/bash\n')
+            os.chmod(os.path.join(root, 'jobs', '5', script), 0o775)
+        with open(os.path.join(root, 'script.sh'), 'w') as w:
+            w.write('#!/bin/bash\nexit 3\n')
+        os.chmod(os.path.join(root, 'script.sh'), 0o775)
+        with open(os.path.join(root, 'entrypoint.sh'), 'w') as w:
+            w.write(ENTRYPOINT.format(
+                backend='Local',
+                adapter='Manual',
+                pipeline_script=os.path.join(root, 'script.sh'),
+                retry_limit=0,
+                CANINE_ROOT=root,
+                CANINE_COMMON=os.path.join(root, 'common'),
+                CANINE_OUTPUT=os.path.join(root, 'outputs'),
+                CANINE_JOBS=os.path.join(root, 'jobs')
+            ))
+        rc = subprocess.call(
+            ['bash', os.path.join(root, 'entrypoint.sh')],
+            cwd=workspace,
+            env={
+                **os.environ,
+                'SLURM_ARRAY_TASK_ID': '5',
+                'SLURM_ARRAY_JOB_ID': '42',
+                'SLURM_JOB_ID': '48'
+            },
+            stderr=subprocess.DEVNULL
+        )
+        self.assertEqual(rc, 3)
+        self.assertListEqual(os.listdir(self.spool), ['42_5.json'])
+        with SpoolWatcher(self.spool, '42', LocalTransport()) as watcher:
+            record = watcher.wait(5)['5']
+        self.assertEqual(record['job_id'], '48')
+        self.assertEqual(record['exit_code'], 3)
+        self.assertEqual(record['teardown_exit_code'], 0)
+        self.assertLessEqual(record['start'], record['end'])
@@ -0,0 +1,172 @@
+import unittest
+import unittest.mock
+import tempfile
+import os
+from canine.backends.base import AbstractTransport
+from canine.backends.local import LocalTransport
+
+class TestUnit(unittest.TestCase):
+    """
+    Runs tests on the local file transport
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tempdir.name, 'src')
+        self.dest = os.path.join(self.tempdir.name, 'dest')
+        os.makedirs(os.path.join(self.src, 'foo', 'bar'))
+        for path in ['a', os.path.join('foo', 'b'), os.path.join('foo', 'bar', 'c')]:
+            with open(os.path.join(self.src, path), 'wb') as w:
+                w.write(os.urandom(64))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_listtree(self):
+        with LocalTransport() as transport:
+            self.assertDictEqual(transport.listtree(self.dest), {})
+            tree = transport.listtree(self.src)
+            self.assertSetEqual(
+                set(tree),
+                {'a', 'foo', os.path.join('foo', 'b'), os.path.join('foo', 'bar'), os.path.join('foo', 'bar', 'c')}
+            )
+            self.assertEqual(tree['a'].st_size, 64)
+
+    def test_incremental_sendtree(self):
+        with LocalTransport() as transport:
+            # mtimes are not preserved for new destinations
+            with unittest.mock.patch.object(transport, 'utime', wraps=transport.utime) as utime:
+                self.assertEqual(
+                    len(transport.sendtree(self.src, self.dest, incremental=True)),
+                    3
+                )
+                utime.assert_not_called()
+            self.assertListEqual(
+                transport.sendtree(self.src, self.dest, incremental=True),
+                []
+            )
+
+            with open(os.path.join(self.src, 'foo', 'b'), 'wb') as w:
+                w.write(os.urandom(32))
+            self.assertListEqual(
+                transport.sendtree(self.src, self.dest, incremental=True),
+                [os.path.join('foo', 'b')]
+            )
+            self.assertEqual(
+                int(os.stat(os.path.join(self.dest, 'foo', 'b')).st_mtime),
+                int(os.stat(os.path.join(self.src, 'foo', 'b')).st_mtime)
+            )
+
+            # Same size and mtime, different contents: only caught by checksum
+            stat = os.stat(os.path.join(self.dest, 'a'))
+            with open(os.path.join(self.dest, 'a'), 'wb') as w:
+                w.write(os.urandom(64))
+            os.utime(os.path.join(self.dest, 'a'), (stat.st_atime, stat.st_mtime))
+            self.assertListEqual(
+                transport.sendtree(self.src, self.dest, incremental=True),
+                []
+            )
+            self.assertListEqual(
+                transport.sendtree(self.src, self.dest, incremental=True, checksum=True),
+                ['a']
+            )
+            with open(os.path.join(self.src, 'a'), 'rb') as r1, open(os.path.join(self.dest, 'a'), 'rb') as r2:
+                self.assertEqual(r1.read(), r2.read())
+
+    def test_incremental_receivetree(self):
+        with LocalTransport() as transport:
+            self.assertEqual(
+                len(transport.receivetree(self.src, self.dest, incremental=True)),
+                3
+            )
+            self.assertTrue(os.path.isdir(os.path.join(self.dest, 'foo', 'bar')))
+            self.assertListEqual(
+                transport.receivetree(self.src, self.dest, incremental=True),
+                []
+            )
+            os.remove(os.path.join(self.dest, 'foo', 'bar', 'c'))
+            self.assertListEqual(
+                transport.receivetree(self.src, self.dest, incremental=True),
+                [os.path.join('foo', 'bar', 'c')]
+            )
+
+    def test_bulk_metadata(self):
+        with LocalTransport() as transport:
+            paths = [os.path.join(self.src, 'a'), os.path.join(self.src, 'foo'), os.path.join(self.src, 'missing')]
+            stats = transport.stat_many(paths)
+            self.assertEqual(stats[paths[0]].st_size, 64)
+            self.assertIsNone(stats[paths[2]])
+            self.assertDictEqual(
+                transport.exists_many(paths),
+                {paths[0]: True, paths[1]: True, paths[2]: False}
+            )
+
+            transport.makedirs_many([
+                os.path.join(self.dest, 'x', 'y'),
+                os.path.join(self.dest, 'x', 'z'),
+                os.path.join(self.src, 'foo')
+            ])
+            self.assertTrue(os.path.isdir(os.path.join(self.dest, 'x', 'y')))
+            self.assertTrue(os.path.isdir(os.path.join(self.dest, 'x', 'z')))
+
+            self.assertListEqual(
+                sorted(name for name, attr in transport.listdir_attr(self.src)),
+                ['a', 'foo']
+            )
+            self.assertListEqual(
+                [(dirpath, sorted(dirnames), sorted(filenames)) for dirpath, dirnames, filenames in AbstractTransport.walk(transport, self.src)],
+                [(dirpath, sorted(dirnames), sorted(filenames)) for dirpath, dirnames, filenames in os.walk(self.src)]
+            )
+
+    def test_stat_cache(self):
+        with LocalTransport() as transport:
+            path = os.path.join(self.src, 'new')
+            with transport.stat_cache():
+                self.assertFalse(transport.exists(path))
+                # Changes made outside of the transport are not seen
+                os.mkdir(path)
+                self.assertFalse(transport.exists(path))
+                # Changes made through the transport invalidate the cache
+                transport.rmdir(path)
+                transport.mkdir(path)
+                self.assertTrue(transport.isdir(path))
+                with transport.open(os.path.join(path, 'file'), 'w') as w:
+                    w.write('foo')
+                self.assertTrue(transport.isfile(os.path.join(path, 'file')))
+                transport.rename(path, path + '2')
+                self.assertFalse(transport.exists(os.path.join(path, 'file')))
+                self.assertTrue(transport.isfile(os.path.join(path + '2', 'file')))
+            self.assertIsNone(transport._stat_cache)
+            os.mkdir(path)
+            self.assertTrue(transport.exists(path))
+
+    def test_rmtree(self):
+        with LocalTransport() as transport:
+            self.assertListEqual(
+                sorted(transport.glob(os.path.join(self.src, 'foo', '*'))),
+                [os.path.join(self.src, 'foo', 'b'), os.path.join(self.src, 'foo', 'bar')]
+            )
+            with self.assertRaises(ValueError):
+                transport.rmtree('/')
+            with self.assertRaises(ValueError):
+                transport.rmtree(os.path.join(self.src, 'foo'), root=self.dest)
+            with self.assertRaises(NotADirectoryError):
+                transport.rmtree(os.path.join(self.src, 'a'))
+            # symlinks are not followed out of root
+            outside = os.path.join(self.tempdir.name, 'outside')
+            os.mkdir(outside)
+            os.symlink(outside, os.path.join(self.src, 'link'))
+            with self.assertRaises(ValueError):
+                transport.rmtree(os.path.join(self.src, 'link'), root=self.src)
+            with self.assertRaises(ValueError):
+                transport.rmtree_many([os.path.join(self.src, 'link')])
+            self.assertTrue(os.path.isdir(outside))
+            os.remove(os.path.join(self.src, 'link'))
+            result = transport.rmtree(os.path.join(self.src, 'foo', 'bar'), root=self.src)
+            self.assertEqual(result.path, os.path.join(self.src, 'foo', 'bar'))
+            self.assertEqual(result.n_removed, 2)
+            self.assertListEqual(
+                transport.rmtree_many([os.path.join(self.src, 'foo'), os.path.join(self.src, 'missing')], root=self.src),
+                [(os.path.join(self.src, 'foo'), 2), (os.path.join(self.src, 'missing'), 0)]
+            )
+            self.assertListEqual(os.listdir(self.src), ['a'])
@@ -44,3 +44,92 @@ class TestUnit(unittest.TestCase):
                             '--{}={}'.format(k,v),
                             cmd
                         )
+
+    def test_hostlist(self):
+        self.assertListEqual(
+            utils.expand_hostlist('node[1-3,05],other,x[08-10]-b'),
+            ['node1', 'node2', 'node3', 'node05', 'other', 'x08-b', 'x09-b', 'x10-b']
+        )
+        self.assertListEqual(utils.expand_hostlist('None assigned'), [])
+        self.assertListEqual(
+            utils.merge_intervals([(3, 5), (1, 2), (2, 2.5), (4, 6), (8, 9)]),
+            [(1, 2.5), (3, 6), (8, 9)]
+        )
+
+    def test_plan_workers(self):
+        self.assertEqual(utils.parse_slurm_mem('4G'), 4096)
+        self.assertEqual(utils.parse_slurm_mem('512'), 512)
+        self.assertTupleEqual(utils.resource_shape({'cpus-per-task': '2', 'mem-per-cpu': '1G'}), (2, 2048))
+        self.assertEqual(utils.gcp_hourly_cost('custom-2-4096'), utils.gcp_hourly_cost('n1-custom-2-4096'))
+
+        # a 4GB task doesn't fit on n1-standard-1, and packs 7 to a node on n1-standard-8
+        self.assertIsNone(utils.plan_worker('n1-standard-1', 1, 4096))
+        plan = utils.plan_worker('n1-standard-8', 1, 4096, 10)
+        self.assertEqual(plan.tasks_per_node, 7)
+        self.assertEqual(plan.node_count, 2)
+        self.assertAlmostEqual(plan.task_hour_cost, plan.hourly_cost * 2 / 10)
+        self.assertEqual(utils.plan_worker('n1-standard-8', 1, 4096, 10, max_nodes = 1).node_count, 1)
+        # part of each node's memory is reserved for the OS
+        self.assertEqual(utils.plan_worker('n2-highmem-4', 1, 8192, 4).tasks_per_node, 3)
+
+        plans = utils.plan_workers_for_resources({'cpus-per-task': '2', 'mem': '3G'}, 16, custom = False)
+        self.assertListEqual(
+            sorted(plans, key = lambda plan : plan.task_hour_cost),
+            plans
+        )
+        self.assertTrue(all(plan.node_count * plan.tasks_per_node >= 16 for plan in plans))
+        self.assertNotIn('n1-highcpu-2', [plan.mtype for plan in plans])
+
+        # memory-heavy tasks get a custom type fitting a whole number of tasks
+        plan = utils.plan_workers_for_resources({'cpus-per-task': '1', 'mem': '10G'}, 4)[0]
+        self.assertIn('custom', plan.mtype)
+        self.assertEqual(plan.node_count * plan.tasks_per_node, 4)
+        self.assertLess(
+            plan.task_hour_cost,
+            utils.plan_workers_for_resources({'cpus-per-task': '1', 'mem': '10G'}, 4, custom = False)[0].task_hour_cost
+        )
+
+    def test_task_graph(self):
+        import threading
+        import time
+        order = []
+        lock = threading.Lock()
+        def task(name, delay=0):
+            def run():
+                with lock:
+                    order.append(('start', name))
+                time.sleep(delay)
+                with lock:
+                    order.append(('end', name))
+            return run
+
+        start = time.monotonic()
+        timings = utils.run_task_graph({
+            'nfs': (task('nfs', 0.5), []),
+            'image': (task('image', 0.5), []),
+            'mount': (task('mount'), ['nfs']),
+            'container': (task('container'), ['mount', 'image']),
+        })
+        # independent tasks overlap
+        self.assertLess(time.monotonic() - start, 0.9)
+        self.assertSetEqual(set(timings), {'nfs', 'image', 'mount', 'container'})
+        self.assertGreaterEqual(timings['nfs'], 0.5)
+        for before, after in [('nfs', 'mount'), ('mount', 'container'), ('image', 'container')]:
+            self.assertLess(order.index(('end', before)), order.index(('start', after)))
+
+        # failures stop dependent tasks and are re-raised
+        order.clear()
+        def fail():
+            raise RuntimeError('nfs failed')
+        with self.assertRaisesRegex(RuntimeError, 'nfs failed'):
+            utils.run_task_graph({
+                'nfs': (fail, []),
+                'image': (task('image', 0.2), []),
+                'mount': (task('mount'), ['nfs']),
+            })
+        self.assertListEqual(order, [('start', 'image'), ('end', 'image')])
+
+        with self.assertRaises(ValueError):
+            utils.run_task_graph({'a': (task('a'), ['b'])})
+        with self.assertRaises(ValueError):
+            utils.run_task_graph({'a': (task('a'), ['b']), 'b': (task('b'), ['a'])})
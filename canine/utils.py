@@ -7,12 +7,15 @@ import warnings
 import logging
 from collections import namedtuple
 import functools
+import concurrent.futures
 import shlex
+import re
 import subprocess
 import google.auth
 import paramiko
 import shutil
 import time
+import math
 import numpy as np
 import pandas as pd
 import requests
@@ -200,6 +203,19 @@ def get_default_gcp_project():
         )
     return __DEFAULT_GCP_PROJECT__
 
+def get_cache_dir(*components: str) -> str:
+    """
+    Returns a directory within canine's cache ($XDG_CACHE_HOME/canine, or ~/.cache/canine),
+    creating it if needed
+    """
+    path = os.path.join(
+        os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+        'canine',
+        *components
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
 def check_call(cmd:str, rc: int, stdout: typing.Optional[typing.BinaryIO] = None, stderr: typing.Optional[typing.BinaryIO] = None):
     """
     Checks that the rc is 0
@@ -219,7 +235,7 @@ predefined_mtypes = {
     'n1-standard': (0.0475, 0.01),
     'n1-highmem': (0.0592, 0.0125),
     'n1-highcpu': (0.03545, 0.0075),
-    'n2-standard': (0.4855, 0.01175),
+    'n2-standard': (0.04855, 0.01175),
     'n2-highmem': (0.0655, 0.01585),
     'n2-highcpu': (0.03585, 0.00865),
     'm1-ultramem': (0.1575975, 0.0332775),
@@ -279,6 +295,7 @@ def _get_mtype_cost(mtype: str) -> typing.Tuple[float, float]:
         # (n1-|n2-)?custom-(\d+)-(\d+)(-ext)?
         if components[0] == 'custom':
             components = ['n1'] + components
+            track = 'n1-custom'
         if len(components) not in {4, 5}:
             raise ValueError("Custom mtype {} not in expected format".format(mtype))
         cores = int(components[2])
@@ -318,6 +335,183 @@ def gcp_hourly_cost(mtype: str, preemptible: bool = False, ssd_size: int = 0, hd
         )
     )
 
+def gcp_mtype_cpus(mtype: str) -> int:
+    """
+    Returns the number of vCPUs of a GCP machine type
+    """
+    mtype_prefix = mtype[:3]
+    if mtype_prefix in {'f1-', 'g1-'}:
+        return 1
+    elif mtype_prefix == 'cus': # custom-X-Y
+        return int(mtype.split('-')[1])
+    return int(mtype.split('-')[2])
+
+def expand_hostlist(hostlist: str) -> typing.List[str]:
+    """
+    Expands a Slurm hostlist expression (e.g. "node[1-3,05],other") into node names.
+    Placeholders for jobs without nodes (e.g. "None assigned") expand to nothing
+    """
+    hostlist = hostlist.strip() if isinstance(hostlist, str) else ""
+    if hostlist in {"", "None assigned", "(null)"}:
+        return []
+    hosts = []
+    for prefix, ranges, suffix in re.findall(r"([^,\[]+)(?:\[([^\]]*)\]([^,]*))?(?:,|$)", hostlist):
+        if not ranges:
+            hosts.append(prefix)
+            continue
+        for part in ranges.split(","):
+            first, _, last = part.partition("-")
+            for i in range(int(first), int(last or first) + 1):
+                hosts.append("{}{}{}".format(prefix, str(i).zfill(len(first)), suffix))
+    return hosts
+
+def merge_intervals(intervals: typing.Iterable[typing.Tuple[float, float]]) -> typing.List[typing.Tuple[float, float]]:
+    """
+    Merges overlapping (start, end) intervals. Returns the merged intervals, sorted
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if len(merged) and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+# memory (GB) / CPU, and the available CPU counts, of the predefined tracks
+# which can be planned for (see plan_workers)
+predefined_mtype_shapes = {
+    'n1-standard': (3.75, [1, 2, 4, 8, 16, 32, 64, 96]),
+    'n1-highmem': (6.5, [2, 4, 8, 16, 32, 64, 96]),
+    'n1-highcpu': (0.9, [2, 4, 8, 16, 32, 64, 96]),
+    'n2-standard': (4, [2, 4, 8, 16, 32, 48, 64, 80]),
+    'n2-highmem': (8, [2, 4, 8, 16, 32, 48, 64, 80]),
+    'n2-highcpu': (1, [2, 4, 8, 16, 32, 48, 64, 80]),
+}
+
+# CPU counts, and (min, max) memory (GB) / CPU before extended memory, of
+# custom machine types
+custom_mtype_shapes = {
+    'n1-custom': ([1] + list(range(2, 97, 2)), (0.9, 6.5)),
+    'n2-custom': (list(range(2, 33, 2)) + list(range(36, 81, 4)), (0.5, 8)),
+}
+
+# memory held back on each node for the OS and Slurm daemons, since Slurm's
+# RealMemory is always below the machine's nominal memory: a fixed amount (MB)
+# plus a fraction of the total
+node_mem_reserve = (512, 0.05)
+
+def schedulable_node_mem(mem: float) -> float:
+    """
+    Returns the memory (MB) which Slurm can allocate to tasks on a node with
+    mem GB of memory
+    """
+    return mem * 1024 * (1 - node_mem_reserve[1]) - node_mem_reserve[0]
+
+WorkerPlan = namedtuple('WorkerPlan', [
+    'mtype',
+    'node_count',
+    'tasks_per_node',
+    'hourly_cost',
+    'task_hour_cost'
+])
+
+def parse_slurm_mem(mem: typing.Union[str, int, float]) -> float:
+    """
+    Converts a Slurm memory specification (e.g. 4G, 500M, or 2048) to MB
+    """
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$", str(mem), re.IGNORECASE)
+    if match is None:
+        raise ValueError("Invalid memory specification {}".format(mem))
+    return float(match.group(1)) * {'K': 1/1024, '': 1, 'M': 1, 'G': 1024, 'T': 1024**2}[match.group(2).upper()]
+
+def plan_worker(mtype: str, cpus_per_task: int = 1, mem_per_task: float = 0, n_tasks: int = 1, preemptible: bool = True, max_nodes: typing.Optional[int] = None, mem: typing.Optional[float] = None) -> typing.Optional[WorkerPlan]:
+    """
+    Returns how tasks (mem_per_task in MB) pack onto nodes of the given machine
+    type, or None if a task does not fit on one node. Tasks are packed into the
+    memory left after node_mem_reserve.
+    mem (GB) is required for predefined machine types outside of predefined_mtype_shapes.
+    Tasks are priced by the cost of all nodes over the tasks running at once,
+    so idle slots on the last node count against the machine type
+    """
+    ncpus = gcp_mtype_cpus(mtype)
+    if mem is None and 'custom' in mtype:
+        mem = int(mtype.replace('-ext', '').rsplit('-', 1)[1]) / 1024
+    elif mem is None:
+        mem = predefined_mtype_shapes[mtype.rsplit('-', 1)[0]][0] * ncpus
+    tasks_per_node = min(ncpus // cpus_per_task, int(schedulable_node_mem(mem) // mem_per_task) if mem_per_task > 0 else ncpus)
+    if tasks_per_node < 1:
+        return None
+    hourly_cost = gcp_hourly_cost(mtype, preemptible = preemptible)
+    node_count = math.ceil(n_tasks / tasks_per_node)
+    if max_nodes is not None:
+        node_count = min(node_count, max_nodes)
+    return WorkerPlan(
+        mtype,
+        node_count,
+        tasks_per_node,
+        hourly_cost,
+        hourly_cost * node_count / min(tasks_per_node * node_count, n_tasks)
+    )
+
+def plan_workers(cpus_per_task: int = 1, mem_per_task: float = 0, n_tasks: int = 1, preemptible: bool = True, max_nodes: typing.Optional[int] = None, custom: bool = True) -> typing.List[WorkerPlan]:
+    """
+    Plans worker nodes for n_tasks tasks, each needing cpus_per_task CPUs and
+    mem_per_task MB of memory. Considers the predefined machine types in
+    predefined_mtype_shapes and (if custom is True) custom machine types sized
+    to fit a whole number of tasks.
+    Returns the plans which fit, cheapest per task-hour first
+    """
+    plans = []
+    for track, (mem_per_cpu, cpu_counts) in predefined_mtype_shapes.items():
+        for ncpus in cpu_counts:
+            plan = plan_worker('{}-{}'.format(track, ncpus), cpus_per_task, mem_per_task, n_tasks, preemptible, max_nodes, mem = mem_per_cpu * ncpus)
+            if plan is not None:
+                plans.append(plan)
+    if custom:
+        for track, (cpu_counts, (min_mem, max_mem)) in custom_mtype_shapes.items():
+            for ncpus in cpu_counts:
+                tasks = ncpus // cpus_per_task
+                if tasks < 1:
+                    continue
+                # memory comes in multiples of 256MB, and must leave room for node_mem_reserve
+                mem_mb = max((tasks * mem_per_task + node_mem_reserve[0]) / (1 - node_mem_reserve[1]), min_mem * 1024 * ncpus)
+                mem_mb = int(math.ceil(mem_mb / 256) * 256)
+                mtype = '{}-{}-{}{}'.format(
+                    'custom' if track == 'n1-custom' else track,
+                    ncpus,
+                    mem_mb,
+                    '-ext' if mem_mb > max_mem * 1024 * ncpus else ''
+                )
+                plan = plan_worker(mtype, cpus_per_task, mem_per_task, n_tasks, preemptible, max_nodes, mem = mem_mb / 1024)
+                if plan is not None:
+                    plans.append(plan)
+    # Among equally priced plans, prefer running more tasks at once on fewer nodes
+    return sorted(plans, key = lambda plan : (
+        round(plan.task_hour_cost, 6),
+        -min(plan.node_count * plan.tasks_per_node, n_tasks),
+        plan.node_count,
+        plan.hourly_cost
+    ))
+
+def resource_shape(resources: typing.Dict[str, typing.Any]) -> typing.Tuple[int, float]:
+    """
+    Returns the (CPUs, memory in MB) requested per task by the given sbatch
+    resources (cpus-per-task, and mem or mem-per-cpu)
+    """
+    cpus = int(resources.get('cpus-per-task', resources.get('c', 1)))
+    if 'mem' in resources:
+        return cpus, parse_slurm_mem(resources['mem'])
+    elif 'mem-per-cpu' in resources:
+        return cpus, parse_slurm_mem(resources['mem-per-cpu']) * cpus
+    return cpus, 0
+
+def plan_workers_for_resources(resources: typing.Dict[str, typing.Any], n_tasks: int, **kwargs) -> typing.List[WorkerPlan]:
+    """
+    Plans worker nodes (see plan_workers) for tasks requesting the given sbatch
+    resources
+    """
+    return plan_workers(*resource_shape(resources), n_tasks, **kwargs)
+
 # rmtree_retry removed in favor of AbstractTransport.rmtree
 
 from threading import Lock
@@ -374,6 +568,55 @@ def sha1_base32(buf: bytes, n: int = None):
     """
 
     return base32(hashlib.sha1(buf).digest()[slice(0, n)])
+
+def run_task_graph(tasks: typing.Dict[str, typing.Tuple[typing.Callable[[], typing.Any], typing.Iterable[str]]], max_workers: int = 4) -> typing.Dict[str, float]:
+    """
+    Runs a dependency graph of tasks on a thread pool.
+    tasks maps each task name to (function, names of tasks it depends on).
+    Each task starts as soon as all of its dependencies have finished.
+    If a task fails, no further tasks are started, and its exception is raised
+    once the tasks already running have finished.
+    Returns {task name: seconds taken}
+    """
+    deps = {name: set(requires) for name, (func, requires) in tasks.items()}
+    for name, requires in deps.items():
+        if len(requires - tasks.keys()):
+            raise ValueError("Task {} depends on unknown tasks {}".format(name, sorted(requires - tasks.keys())))
+
+    timings = {}
+    def timed(name):
+        start = time.monotonic()
+        try:
+            return tasks[name][0]()
+        finally:
+            timings[name] = time.monotonic() - start
+
+    done = set()
+    error = None
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        running = {}
+        while True:
+            if error is None:
+                for name in tasks:
+                    if name not in done and name not in running.values() and deps[name] <= done:
+                        running[executor.submit(timed, name)] = name
+            if not len(running):
+                break
+            finished, _ = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    canine_logging.debug("{} failed after {:.1f}s".format(name, timings[name]))
+                    if error is None:
+                        error = future.exception()
+                else:
+                    canine_logging.debug("{} finished in {:.1f}s".format(name, timings[name]))
+                    done.add(name)
+    if error is not None:
+        raise error
+    if len(done) < len(tasks):
+        raise ValueError("Tasks {} have circular dependencies".format(sorted(tasks.keys() - done)))
+    return timings
   
 ## Hook for get external logging module
 
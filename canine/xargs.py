@@ -140,7 +140,7 @@ class Xargs(Orchestrator):
                 print("Batch id:", batch_id)
                 completed_jobs = []
                 cpu_time = {}
-                uptime = {}
+                usage = None
                 prev_acct = None
                 try:
                     waiting_jobs = {
@@ -163,11 +163,6 @@ class Xargs(Orchestrator):
                                     print("Job",job, "completed with status", acct['State'][jid], acct['ExitCode'][jid].split(':')[0])
                                     completed_jobs.append((job, jid))
                                     waiting_jobs.remove(jid)
-                        for node in {node for node in self.backend.squeue(jobs=batch_id)['NODELIST(REASON)'] if not node.startswith('(')}:
-                            if node in uptime:
-                                uptime[node] += 1
-                            else:
-                                uptime[node] = 1
                         if prev_acct is None:
                             prev_acct = acct
                         else:
@@ -179,6 +174,10 @@ class Xargs(Orchestrator):
                     print("Encountered unhandled exception. Cancelling batch job", file=sys.stderr)
                     self.backend.scancel(batch_id)
                     raise
+                try:
+                    usage = self.backend.node_usage(batch_id)
+                except:
+                    traceback.print_exc()
         runtime = time.monotonic() - start_time
         job_spec = {
             str(i): {
@@ -201,11 +200,18 @@ class Xargs(Orchestrator):
             }
         ).T.set_index(pd.Index([*job_spec], name='job_id')).astype({'cpu_hours': int})
         try:
+            node_hours = self.backend.node_hours()
             print("Estimated total cluster cost:", self.backend.estimate_cost(
                 runtime/3600,
-                node_uptime=sum(uptime.values())/120
+                node_uptime=node_hours if node_hours is not None else (
+                    self.backend.busy_node_hours(usage) if usage is not None else 0
+                )
             )[0])
-            job_cost = self.backend.estimate_cost(job_cpu_time=df['cpu_hours'].to_dict())[1]
+            task_hours = self.backend.task_cpu_hours(usage) if usage is not None else {}
+            job_cost = self.backend.estimate_cost(job_cpu_time={
+                job_id: task_hours.get(batch_id+'_'+job_id, cpu_hours)
+                for job_id, cpu_hours in df['cpu_hours'].items()
+            })[1]
             df['est_cost'] = [job_cost[job_id] for job_id in df.index] if job_cost is not None else [0] * len(df)
         except:
             traceback.print_exc()
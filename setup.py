@@ -59,6 +59,7 @@ setup(
         'docker>=4.1.0',
         'psutil>=5.6.7',
         'port-for>=0.4',
+        'requests>=2.22.0',
         'tables>=3.6.1'
     ],
     classifiers = [